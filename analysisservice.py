@@ -0,0 +1,280 @@
+"""
+A long-lived local service running Nimble syntax and semantic checking for
+editor integrations.
+
+Clients speak JSON-RPC 2.0, one message per line, over stdio or a Unix domain
+socket. Methods:
+
+- `analyze` with params `{"uri": ..., "text": ..., "version": ...}` returns
+  `{"uri", "version", "diagnostics", "superseded"}`, where each diagnostic is
+  `{"line", "column", "category", "message", "source"}`; syntax errors are
+  reported with category `SYNTAX`. Parses are limited by
+  `parsewatchdog.DEFAULT_BUDGET`, so a pathological script is reported as a
+  syntax error rather than tying up, or crashing, a worker. Should the
+  semantic analysis itself fail, the failure is reported as a diagnostic
+  with category `ANALYSIS_FAILED`, as in `nimblelsp`.
+- `metrics` returns the request count and p50/p99 latencies in milliseconds.
+- `shutdown` stops the service once the response has been sent.
+
+Parsing and both `nimblesemantics` passes run in a process pool whose workers
+are warmed up on start by `testhelpers.warm_up`, so the parser's DFA cache
+(shared by every `NimbleParser` in a process) is already populated when real
+requests arrive.
+
+Rapid successive edits of the same document are coalesced: a request waits
+`debounce` seconds, and if a newer version of the same document arrives in
+that time only the newest text is analyzed. Every waiting request receives
+that one result, with `superseded` set for the ones whose text was replaced,
+as tracked by the order in which requests arrive rather than by version, which
+clients may omit.
+
+Run with `python analysisservice.py [--socket PATH] [--workers N]`.
+
+Version: 2026-10-19
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from generic_parser import parse, SyntaxErrors
+from nimble import NimbleLexer, NimbleParser
+from parsewatchdog import DEFAULT_BUDGET
+from testhelpers import analyze_tree, warm_up
+
+# Number of recent requests over which latency percentiles are reported
+LATENCY_WINDOW = 1000
+
+
+def analyze_source(text):
+    """
+    Parses and analyzes a Nimble script, returning its diagnostics as a list of
+    dictionaries. Runs in a worker process.
+    """
+    try:
+        tree = parse(text, 'script', NimbleLexer, NimbleParser, budget=DEFAULT_BUDGET)
+    except SyntaxErrors as e:
+        return [{'line': r.line, 'column': r.column, 'category': 'SYNTAX', 'message': r.message,
+                 'source': r.offending_symbol.text if r.offending_symbol else ''}
+                for r in e.error_log.syntax_errors]
+    try:
+        error_log = analyze_tree(tree)[0]
+    except Exception as e:
+        # Reported on the script, rather than failing the whole request
+        return [{'line': tree.start.line, 'column': tree.start.column, 'category': 'ANALYSIS_FAILED',
+                 'message': f'semantic analysis failed with {type(e).__name__}', 'source': ''}]
+    return [{'line': e.line(), 'column': e.ctx.start.column, 'category': str(e.category),
+             'message': e.message, 'source': e.ctx.getText()}
+            for e in error_log.entries()]
+
+
+class _PendingAnalysis:
+    """
+    The newest text submitted for a document, and the requests waiting on its result.
+    `sequence` is the number of the request that submitted the text.
+    """
+
+    def __init__(self, text, version, sequence):
+        self.text = text
+        self.version = version
+        self.sequence = sequence
+        self.generation = 0
+        self.result = asyncio.get_running_loop().create_future()
+
+
+class AnalysisService:
+    """
+    Dispatches JSON-RPC requests to the analysis pool, coalescing edits and recording
+    latencies.
+
+    :param executor: A `concurrent.futures` executor for the analysis work; by default
+        a warmed-up process pool with `workers` processes
+    :param debounce: Seconds to wait for a newer edit of the same document
+    """
+
+    def __init__(self, executor=None, workers=None, debounce=0.05):
+        self.executor = executor or ProcessPoolExecutor(max_workers=workers, initializer=warm_up)
+        self.debounce = debounce
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.analyses = 0
+        self.running = True
+        self.__pending = {}
+        self.__sequence = 0
+        # Running analyses, referenced so they aren't collected before they finish
+        self.__runs = set()
+
+    async def analyze(self, uri, text, version=None):
+        self.__sequence += 1
+        sequence = self.__sequence
+        pending = self.__pending.get(uri)
+        if pending is None:
+            pending = self.__pending[uri] = _PendingAnalysis(text, version, sequence)
+            run = asyncio.create_task(self.__run(uri, pending))
+            self.__runs.add(run)
+            run.add_done_callback(self.__runs.discard)
+        else:
+            # A newer edit replaces the text and restarts the debounce
+            pending.text = text
+            pending.version = version
+            pending.sequence = sequence
+            pending.generation += 1
+        diagnostics, analyzed_version, analyzed_sequence = await asyncio.shield(pending.result)
+        return {'uri': uri, 'version': analyzed_version, 'diagnostics': diagnostics,
+                'superseded': analyzed_sequence != sequence}
+
+    async def __run(self, uri, pending):
+        generation = -1
+        while generation != pending.generation:
+            generation = pending.generation
+            await asyncio.sleep(self.debounce)
+        # From here on, new edits start a fresh pending analysis
+        del self.__pending[uri]
+        try:
+            self.analyses += 1
+            diagnostics = await asyncio.get_running_loop().run_in_executor(
+                self.executor, analyze_source, pending.text)
+            pending.result.set_result((diagnostics, pending.version, pending.sequence))
+        except Exception as e:
+            pending.result.set_exception(e)
+
+    def metrics(self):
+        ordered = sorted(self.latencies)
+        return {'requests': self.requests, 'analyses': self.analyses,
+                'p50_ms': _percentile(ordered, 50), 'p99_ms': _percentile(ordered, 99)}
+
+    async def handle(self, message):
+        """Handles one decoded JSON-RPC message; returns the response, or None for a notification."""
+        start = time.perf_counter()
+        request_id = message.get('id')
+        method = message.get('method')
+        params = message.get('params') or {}
+        try:
+            if method == 'analyze':
+                if 'uri' not in params or 'text' not in params:
+                    return _error(request_id, -32602, 'analyze requires uri and text')
+                result = await self.analyze(params['uri'], params['text'], params.get('version'))
+            elif method == 'metrics':
+                result = self.metrics()
+            elif method == 'shutdown':
+                self.running = False
+                result = None
+            else:
+                return _error(request_id, -32601, f'unknown method {method!r}')
+        except Exception as e:
+            return _error(request_id, -32603, f'{type(e).__name__}: {e}')
+        finally:
+            if method == 'analyze':
+                self.requests += 1
+                self.latencies.append((time.perf_counter() - start) * 1000)
+        if request_id is None:
+            return None
+        return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+
+    async def serve(self, reader, write):
+        """
+        Serves newline-delimited JSON-RPC messages from an asyncio StreamReader, handling
+        each concurrently, until end of input or shutdown. `write` sends one response line.
+        """
+        tasks = set()
+
+        async def respond(message):
+            response = await self.handle(message)
+            if response is not None:
+                await write(json.dumps(response))
+
+        while self.running:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError as e:
+                await write(json.dumps(_error(None, -32700, f'parse error: {e}')))
+                continue
+            if not isinstance(message, dict):
+                # Batches aren't supported, and scalars aren't requests
+                await write(json.dumps(_error(None, -32600, 'invalid request: expected a JSON object')))
+                continue
+            if message.get('method') == 'shutdown':
+                # Let in-flight requests answer first
+                await asyncio.gather(*tasks)
+                await respond(message)
+                break
+            task = asyncio.create_task(respond(message))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+
+    def close(self):
+        self.executor.shutdown()
+
+
+async def serve_stdio(service):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    async def write(line):
+        sys.stdout.write(line + '\n')
+        sys.stdout.flush()
+
+    await service.serve(reader, write)
+
+
+async def serve_unix(service, path):
+    stopped = asyncio.Event()
+
+    async def client(reader, writer):
+        async def write(line):
+            writer.write(line.encode() + b'\n')
+            await writer.drain()
+
+        await service.serve(reader, write)
+        writer.close()
+        if not service.running:
+            stopped.set()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(client, path)
+    async with server:
+        await stopped.wait()
+
+
+def _percentile(ordered, percent):
+    if not ordered:
+        return None
+    rank = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return round(ordered[rank], 3)
+
+
+def _error(request_id, code, message):
+    return {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': code, 'message': message}}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Nimble analysis service (JSON-RPC)')
+    arg_parser.add_argument('--socket', help='serve on this Unix socket path instead of stdio')
+    arg_parser.add_argument('--workers', type=int, help='analysis worker processes')
+    arg_parser.add_argument('--debounce', type=float, default=0.05,
+                            help='seconds to wait for further edits of a document')
+    args = arg_parser.parse_args()
+
+    service = AnalysisService(workers=args.workers, debounce=args.debounce)
+    try:
+        if args.socket:
+            asyncio.run(serve_unix(service, args.socket))
+        else:
+            asyncio.run(serve_stdio(service))
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
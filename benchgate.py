@@ -0,0 +1,170 @@
+"""
+Compares two sets of `nimblebench` results, a baseline and a candidate, and
+fails if the throughput of any stage has regressed.
+
+Each result set is a JSON-lines file written by `nimblebench.py --store`,
+holding one or more records for the same benchmark parameters; the run times
+of every record are pooled. For each stage the gate compares the median
+throughput in tokens per second, and tests whether the candidate is slower
+with a one-sided Mann-Whitney U test, which assumes nothing about how run
+times are distributed. A stage regresses if its median throughput drops by
+more than `threshold` and the drop is significant at level `alpha`, so noise
+alone, however large, doesn't fail the gate, and nor does a significant but
+negligible drop. The p-values use the normal approximation with corrections
+for ties and continuity, which is close enough for ten or more runs a side.
+
+For example, before and after changing the vendored `antlr4` runtime:
+
+    python nimblebench.py --repeat 20 --store baseline.jsonl
+    python nimblebench.py --repeat 20 --store candidate.jsonl
+    python benchgate.py baseline.jsonl candidate.jsonl
+
+Run with `python benchgate.py BASELINE CANDIDATE [--threshold F] [--alpha P]
+[--stages STAGE...]`; the exit status is 1 if any stage regressed.
+
+Version: 2026-10-19
+"""
+
+import argparse
+import math
+import statistics
+import sys
+from dataclasses import dataclass
+
+from nimblebench import STAGES, load_results
+
+
+@dataclass
+class StageComparison:
+    """The comparison of one stage's throughput, in tokens per second, between two result sets."""
+    stage: str
+    baseline_median: float
+    baseline_iqr: float
+    candidate_median: float
+    candidate_iqr: float
+    change: float
+    p_value: float
+    regressed: bool
+
+
+def throughput_samples(records):
+    """
+    Returns the throughput of every run in the records, in tokens per second, as a
+    dictionary keyed by stage. Raises ValueError unless they all have the same parameters.
+    """
+    if not records:
+        raise ValueError('no benchmark results')
+    parameters = records[0]['parameters']
+    samples = {}
+    for record in records:
+        if record['parameters'] != parameters:
+            raise ValueError(f'results have different parameters: {parameters} and {record["parameters"]}')
+        for stage, stats in record['stages'].items():
+            # Records without samples keep only the best time
+            times = stats.get('samples', [stats['seconds']])
+            samples.setdefault(stage, []).extend(record['tokens'] / t for t in times)
+    return samples
+
+
+def interquartile_range(values):
+    if len(values) < 2:
+        return 0.0
+    first, _, third = statistics.quantiles(values, n=4)
+    return third - first
+
+
+def p_value_lower(candidate, baseline):
+    """
+    The one-sided p-value of the Mann-Whitney U test that `candidate` values tend to be
+    lower than `baseline` values.
+    """
+    n1, n2 = len(candidate), len(baseline)
+    if not n1 or not n2:
+        return 1.0
+    values = sorted([(v, 0) for v in candidate] + [(v, 1) for v in baseline])
+    n = n1 + n2
+    rank_sum = 0.0
+    tie_correction = 0
+    i = 0
+    while i < n:
+        j = i
+        while j < n and values[j][0] == values[i][0]:
+            j += 1
+        # Tied values share the mean of their ranks, i + 1 to j
+        rank = (i + 1 + j) / 2
+        rank_sum += rank * sum(1 for _, side in values[i:j] if side == 0)
+        tie_correction += (j - i) ** 3 - (j - i)
+        i = j
+    u = rank_sum - n1 * (n1 + 1) / 2
+    variance = n1 * n2 / 12 * ((n + 1) - tie_correction / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 + 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(-z / math.sqrt(2))
+
+
+def compare(baseline_records, candidate_records, threshold=0.1, alpha=0.05, stages=STAGES):
+    """
+    Compares the throughput of each stage between two sets of `nimblebench` records,
+    returning a list of `StageComparison`s.
+
+    :param threshold: Largest fractional drop in median throughput that isn't a regression
+    :param alpha: Significance level of the test that the candidate is slower
+    :param stages: The stages to compare
+    """
+    if baseline_records and candidate_records and \
+            baseline_records[0]['parameters'] != candidate_records[0]['parameters']:
+        raise ValueError('baseline and candidate results have different parameters')
+    baseline = throughput_samples(baseline_records)
+    candidate = throughput_samples(candidate_records)
+    comparisons = []
+    for stage in stages:
+        if stage not in baseline or stage not in candidate:
+            raise ValueError(f'no results for stage {stage}')
+        baseline_median = statistics.median(baseline[stage])
+        candidate_median = statistics.median(candidate[stage])
+        change = candidate_median / baseline_median - 1
+        p_value = p_value_lower(candidate[stage], baseline[stage])
+        comparisons.append(StageComparison(
+            stage, baseline_median, interquartile_range(baseline[stage]),
+            candidate_median, interquartile_range(candidate[stage]),
+            change, p_value, change < -threshold and p_value < alpha))
+    return comparisons
+
+
+def report(comparisons, threshold, alpha):
+    """Returns a table of the comparisons, followed by a verdict."""
+    lines = [f'{"stage":14} {"baseline tokens/s (IQR)":>26} {"candidate tokens/s (IQR)":>26} '
+             f'{"change":>8} {"p":>7}']
+    for c in comparisons:
+        lines.append(f'{c.stage:14} {c.baseline_median:14,.0f} ({c.baseline_iqr:9,.0f}) '
+                     f'{c.candidate_median:14,.0f} ({c.candidate_iqr:9,.0f}) '
+                     f'{c.change:+8.1%} {c.p_value:7.4f}{"  REGRESSED" if c.regressed else ""}')
+    regressed = [c.stage for c in comparisons if c.regressed]
+    if regressed:
+        lines.append(f'FAIL: {", ".join(regressed)} slower by more than {threshold:.0%} (p < {alpha})')
+    else:
+        lines.append(f'OK: no stage slower by more than {threshold:.0%} (p < {alpha})')
+    return '\n'.join(lines)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Fail if nimblebench throughput regressed')
+    arg_parser.add_argument('baseline', help='JSON-lines results of the baseline')
+    arg_parser.add_argument('candidate', help='JSON-lines results of the candidate')
+    arg_parser.add_argument('--threshold', type=float, default=0.1,
+                            help='largest fractional drop in median throughput allowed')
+    arg_parser.add_argument('--alpha', type=float, default=0.05, help='significance level')
+    arg_parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    args = arg_parser.parse_args()
+    try:
+        comparisons = compare(load_results(args.baseline), load_results(args.candidate),
+                              args.threshold, args.alpha, args.stages)
+    except ValueError as e:
+        sys.exit(f'error: {e}')
+    print(report(comparisons, args.threshold, args.alpha))
+    sys.exit(1 if any(c.regressed for c in comparisons) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+Exports Nimble diagnostics as JSON lines, one object per syntax or semantic
+error, for CI and other tools:
+
+    {"file": ..., "line": ..., "column": ..., "end_line": ..., "end_column": ...,
+     "category": ..., "message": ..., "source": ...}
+
+Lines are numbered from 1 and columns from 0, as by ANTLR; `end_line` and
+`end_column` give the end of the source span, exclusive. Syntax errors have
+category `SYNTAX`, and their source is the offending token. Should the
+semantic analysis itself fail, the failure is written as a record with
+category `ANALYSIS_FAILED` at the start of the script, after any errors
+already written, and the export goes on to the next script.
+
+Streaming: `StreamingSyntaxErrorLog` and `StreamingErrorLog` stand in for
+`generic_parser.SyntaxErrorLog` and `errorlog.ErrorLog`. Syntax errors are
+written as soon as they are reported. A semantic error can still be replaced
+by a later one for the same line and source, and the analysis phases log
+errors out of line order, so `StreamingErrorLog` keeps only the entries an
+`ErrorLog` would keep, without its indexes, and writes them in the same order
+when flushed at the end of the analysis. Streamed and bulk exports of a script
+are therefore identical, unless the analysis fails.
+
+Bulk: `JsonLinesWriter.write_log` and `write_syntax_log` serialize a whole
+existing log with a single reused encoder.
+
+Run with `python diagnosticexport.py SCRIPT... [--output FILE] [--bulk]`; the
+exit status is 1 if there are any diagnostics.
+
+Version: 2026-10-19
+"""
+
+import argparse
+import json
+import sys
+from collections import Counter
+
+from antlr4 import Token
+from errorlog import Category, Entry
+from generic_parser import SyntaxErrorLog, SyntaxErrors, parse
+from nimble import NimbleLexer, NimbleParser
+from testhelpers import analyze_tree
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, check_circular=False, separators=(',', ':'))
+
+
+def entry_record(entry: Entry, filename=None) -> dict:
+    """The JSON-lines record of an `errorlog.Entry`."""
+    start, stop = entry.ctx.start, entry.ctx.stop
+    return {'file': filename, 'line': start.line, 'column': start.column,
+            'end_line': stop.line, 'end_column': stop.column + len(stop.text),
+            'category': str(entry.category), 'message': entry.message, 'source': entry.ctx.getText()}
+
+
+def syntax_record(line, column, offending_symbol, message, filename=None) -> dict:
+    """The JSON-lines record of a syntax error, as reported to an ANTLR error listener."""
+    if offending_symbol is not None and offending_symbol.type != Token.EOF:
+        source, width = offending_symbol.text, len(offending_symbol.text)
+    else:
+        source, width = '', 1
+    return {'file': filename, 'line': line, 'column': column, 'end_line': line, 'end_column': column + width,
+            'category': 'SYNTAX', 'message': message, 'source': source}
+
+
+def failure_record(tree, exception, filename=None) -> dict:
+    """The JSON-lines record of a semantic analysis of `tree` that failed with `exception`."""
+    start = tree.start
+    return {'file': filename, 'line': start.line, 'column': start.column,
+            'end_line': start.line, 'end_column': start.column, 'category': 'ANALYSIS_FAILED',
+            'message': f'semantic analysis failed with {type(exception).__name__}', 'source': ''}
+
+
+class JsonLinesWriter:
+    """
+    Writes diagnostic records to a text file, one JSON object per line.
+
+    :param file: The file to write to, e.g. `sys.stdout`
+    :param filename: The name of the Nimble file the diagnostics are for, or None
+    """
+
+    def __init__(self, file, filename=None):
+        self.file = file
+        self.filename = filename
+        self.records_written = 0
+
+    def write(self, record: dict):
+        self.file.write(_ENCODER.encode(record) + '\n')
+        self.records_written += 1
+
+    def write_log(self, error_log):
+        """Writes every entry of an `errorlog.ErrorLog`, in the order of its `entries`."""
+        self.__write_all(entry_record(e, self.filename) for e in error_log.entries())
+
+    def write_syntax_log(self, syntax_error_log: SyntaxErrorLog):
+        """Writes every record of a `generic_parser.SyntaxErrorLog`."""
+        self.__write_all(syntax_record(r.line, r.column, r.offending_symbol, r.message, self.filename)
+                         for r in syntax_error_log.syntax_errors)
+
+    def __write_all(self, records):
+        encode = _ENCODER.encode
+        lines = [encode(record) + '\n' for record in records]
+        self.file.writelines(lines)
+        self.records_written += len(lines)
+
+
+class StreamingErrorLog:
+    """
+    Takes the place of an `errorlog.ErrorLog` in semantic analysis, holding each entry
+    until `flush` writes it. As in an `ErrorLog`, an entry replaces an earlier one for the
+    same line and source, and entries are written by line and, within a line, in the
+    order they were first added.
+
+    :param writer: The `JsonLinesWriter` to write entries to
+    """
+
+    def __init__(self, writer: JsonLinesWriter):
+        self.writer = writer
+        self.truncated = False
+        self.__counts = Counter()
+        # Line -> {source text: Entry}, for the entries not yet written
+        self.__pending = {}
+
+    def add(self, ctx, category: Category, message: str, *args):
+        entry = Entry(ctx, category, message, args)
+        entries = self.__pending.setdefault(entry.line(), {})
+        replaced = entries.get(ctx.getText())
+        if replaced is not None:
+            self.__counts[replaced.category] -= 1
+        entries[ctx.getText()] = entry
+        self.__counts[category] += 1
+
+    def flush(self):
+        """Writes the entries held, once no more can be added for their lines."""
+        for line in sorted(self.__pending):
+            for entry in self.__pending[line].values():
+                self.writer.write(entry_record(entry, self.writer.filename))
+        self.__pending.clear()
+
+    def total_entries(self):
+        return sum(self.__counts.values())
+
+    def category_counts(self) -> Counter:
+        return +self.__counts
+
+
+class StreamingSyntaxErrorLog(SyntaxErrorLog):
+    """
+    A `generic_parser.SyntaxErrorLog` writing each syntax error as it's reported rather
+    than keeping it.
+
+    :param writer: The `JsonLinesWriter` to write errors to
+    """
+
+    def __init__(self, writer: JsonLinesWriter):
+        super().__init__()
+        self.writer = writer
+        self.__count = 0
+
+    def syntaxError(self, recognizer, offending_symbol, line, char_position, msg, exception):
+        self.writer.write(syntax_record(line, char_position, offending_symbol, msg, self.writer.filename))
+        self.__count += 1
+
+    def has_errors(self):
+        return self.__count > 0
+
+    def total_entries(self):
+        return self.__count
+
+
+def export_file(path, file, bulk=False):
+    """
+    Parses and analyzes a Nimble script, writing its diagnostics to `file` as JSON
+    lines; returns the number written. Semantic analysis only runs if it parses; if
+    it fails, an `ANALYSIS_FAILED` record is written in place of the rest of its errors.
+    """
+    writer = JsonLinesWriter(file, path)
+    if bulk:
+        try:
+            tree = parse(path, 'script', NimbleLexer, NimbleParser, from_file=True)
+        except SyntaxErrors as e:
+            writer.write_syntax_log(e.error_log)
+        else:
+            try:
+                error_log = analyze_tree(tree)[0]
+            except Exception as e:
+                writer.write(failure_record(tree, e, path))
+            else:
+                writer.write_log(error_log)
+    else:
+        try:
+            tree = parse(path, 'script', NimbleLexer, NimbleParser, from_file=True,
+                         error_log=StreamingSyntaxErrorLog(writer))
+        except SyntaxErrors:
+            pass
+        else:
+            error_log = StreamingErrorLog(writer)
+            try:
+                analyze_tree(tree, error_log=error_log)
+            except Exception as e:
+                # The errors logged before the failure are written ahead of it
+                error_log.flush()
+                writer.write(failure_record(tree, e, path))
+            else:
+                error_log.flush()
+    return writer.records_written
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Export Nimble diagnostics as JSON lines')
+    arg_parser.add_argument('scripts', nargs='+', help='paths of the Nimble scripts to check')
+    arg_parser.add_argument('--output', help='file to write to, instead of standard output')
+    arg_parser.add_argument('--bulk', action='store_true', help='write each log whole, once complete')
+    args = arg_parser.parse_args()
+    file = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        total = sum(export_file(path, file, args.bulk) for path in args.scripts)
+    finally:
+        if args.output:
+            file.close()
+    sys.exit(1 if total else 0)
+
+
+if __name__ == '__main__':
+    main()
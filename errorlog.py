@@ -7,11 +7,13 @@ Author: Greg Phillips
 Version: 2022-02-04
 """
 
-from collections import defaultdict
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict
 from dataclasses import dataclass
 from enum import Enum, auto
 
 from antlr4 import ParserRuleContext
+from antlr4.tree.Tree import ParseTree
 
 
 class Category(Enum):
@@ -25,6 +27,9 @@ class Category(Enum):
     INVALID_BINARY_OP = auto()  # binary operator applied to incompatible left and right expressions
     CONDITION_NOT_BOOL = auto()  # condition on if or while statement not a Bool
     UNPRINTABLE_EXPRESSION = auto() # expression in print is not a valid type
+    INVALID_CALL = auto()  # call of a non-function, or with the wrong number or types of arguments
+    INVALID_RETURN = auto()  # return value missing, unexpected or of the wrong type
+    MISSING_RETURN = auto()  # function returning a value can end without a return
 
     def __str__(self):
         return self.name
@@ -37,10 +42,20 @@ class Entry:
     """
     A record of a semantic error, to be stored in the error log. Includes the parse tree
     node on which the error was detected, the ErrorCategory, and a useful descriptive message.
+
+    The message is only formatted when it's asked for: `template` is a `str.format`
+    template for `args`, any of which may be parse tree nodes, standing for their text.
     """
     ctx: ParserRuleContext
     category: Category
-    message: str
+    template: str
+    args: tuple = ()
+
+    @property
+    def message(self) -> str:
+        if not self.args:
+            return self.template
+        return self.template.format(*(a.getText() if isinstance(a, ParseTree) else a for a in self.args))
 
     def line(self) -> int:
         """The source code line on which the semantic error was detected."""
@@ -50,22 +65,105 @@ class Entry:
         return f'line {self.line()} : {self.category} : {self.message}\n    {self.ctx.getText()}'
 
 
+class TooManyErrors(Exception):
+    """
+    Raised by `ErrorLog.add` when the entry added brings the log to its maximum number of
+    entries, to abort the analysis walk.
+    """
+
+
+class _Source:
+    """
+    A node's source text as a dictionary key, without getting the text unless it must:
+    nodes are hashed by the first and last characters of their text, and their whole
+    texts only compared when those match.
+    """
+    __slots__ = ('ctx', '__text')
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.__text = None
+
+    @property
+    def text(self):
+        if self.__text is None:
+            self.__text = self.ctx.getText()
+        return self.__text
+
+    def __hash__(self):
+        start, stop = self.ctx.start, self.ctx.stop
+        if start is None or stop is None or stop.tokenIndex < start.tokenIndex:
+            return 0
+        return hash((start.text[:1], stop.text[-1:]))
+
+    def __eq__(self, other):
+        return self.ctx is other.ctx or self.text == other.text
+
+
 class ErrorLog:
     """
     A log of SemanticErrors detected. For each line on which an error was detected, contains
     a dictionary mapping source strings to errors arising from that source string.
-    """
 
-    def __init__(self):
-        self.__entries = defaultdict(dict)
+    The log is also indexed by category, keeps its lines in order and counts its entries
+    by category, overall and per line, all as entries are added, so queries like
+    `includes_on_line`, `total_entries` and `entries_in_lines` needn't scan the log.
+
+    A lazy log keys its entries by `_Source` rather than by the source strings themselves,
+    so adding an entry doesn't get the node's text, which is costly for large nodes. It
+    is meant for batch runs that only count errors; its `includes_exactly` is slower.
+
+    A log with `max_errors` raises `TooManyErrors` once it holds that many entries, and
+    is then marked `truncated`, bounding the size of the log and the time spent on badly
+    broken input.
+    """
 
-    def add(self, ctx: ParserRuleContext, category: Category, message: str):
+    def __init__(self, lazy=False, max_errors=None):
+        self.lazy = lazy
+        self.max_errors = max_errors
+        self.truncated = False
+        self.__entries = {}
+        # Lines with entries, in order
+        self.__lines = []
+        # Category -> {id(Entry): Entry}
+        self.__by_category = defaultdict(dict)
+        self.__category_counts = Counter()
+        # Line -> {Category: number of its entries in that category}
+        self.__line_counts = {}
+        self.__size = 0
+
+    def add(self, ctx: ParserRuleContext, category: Category, message: str, *args):
         """
         Creates a new log Entry using the provided information and inserts it into the log.
-        The message should be a well formatted string that clearly describes the error.
+        The message should be a well formatted string that clearly describes the error; if
+        `args` are given, it's a `str.format` template for them, formatted only when needed.
         """
-        entry = Entry(ctx, category, message)
-        self.__entries[entry.line()][ctx.getText()] = entry
+        entry = Entry(ctx, category, message, args)
+        line = entry.line()
+        key = _Source(ctx) if self.lazy else ctx.getText()
+        entries = self.__entries.get(line)
+        if entries is None:
+            entries = self.__entries[line] = {}
+            self.__line_counts[line] = {}
+            if self.__lines and line < self.__lines[-1]:
+                insort(self.__lines, line)
+            else:
+                self.__lines.append(line)
+        replaced = entries.get(key)
+        entries[key] = entry
+        category_counts, line_counts = self.__category_counts, self.__line_counts[line]
+        if replaced is None:
+            self.__size += 1
+        else:
+            del self.__by_category[replaced.category][id(replaced)]
+            category_counts[replaced.category] -= 1
+            line_counts[replaced.category] -= 1
+        self.__by_category[category][id(entry)] = entry
+        category_counts[category] = category_counts.get(category, 0) + 1
+        line_counts[category] = line_counts.get(category, 0) + 1
+        if self.max_errors is not None and self.__size >= self.max_errors:
+            self.truncated = True
+            raise TooManyErrors(f'analysis stopped after {self.__size} errors')
 
 
     def includes_exactly(self, category: Category, line: int, source: str) -> bool:
@@ -74,6 +172,9 @@ class ErrorLog:
         given line corresponding to the given source string. Useful when there may
         be multiple errors on a line and a specific error is of interest.
         """
+        if self.lazy:
+            return any(key.text == source and entry.category == category
+                       for key, entry in self.__entries.get(line, {}).items())
         return self.__entries[line][source].category == category
 
 
@@ -83,14 +184,34 @@ class ErrorLog:
         given line. Useful when it's inconvenient to include the entire source
         corresponding to the error.
         """
-        return any(category == entry.category for entry in self.__entries[line].values())
+        return self.__line_counts.get(line, {}).get(category, 0) > 0
 
     def total_entries(self):
-        return sum(len(entry) for entry in self.__entries.values())
+        return self.__size
+
+    def category_counts(self) -> Counter:
+        """Returns the number of entries in each Category."""
+        return +self.__category_counts
+
+    def entries(self):
+        """
+        Yields every Entry in the log, ordered by line and, within a line, by the
+        order in which the entries were first added. Adding the yielded entries to
+        an empty log in this order reproduces the log exactly.
+        """
+        for line in self.__lines:
+            yield from self.__entries[line].values()
+
+    def entries_in_lines(self, first: int, last: int):
+        """Yields the entries on lines `first` to `last` inclusive, ordered as by `entries`."""
+        for i in range(bisect_left(self.__lines, first), bisect_right(self.__lines, last)):
+            yield from self.__entries[self.__lines[i]].values()
+
+    def entries_in_category(self, category: Category) -> list:
+        """Returns the entries of the given Category, ordered by line."""
+        entries = list(self.__by_category[category].values())
+        entries.sort(key=Entry.line)
+        return entries
 
     def __str__(self):
-        error_list = [str(entry)
-                      for line in sorted(self.__entries.keys())
-                      for entry in self.__entries[line].values()
-                      ]
-        return '\n'.join(error_list)
+        return '\n'.join(str(entry) for entry in self.entries())
@@ -11,9 +11,11 @@ from dataclasses import dataclass
 
 from antlr4 import FileStream, InputStream, CommonTokenStream,\
     Recognizer, RecognitionException, Token
+from parsewatchdog import BudgetExceeded, install_watchdog
 
 
-def parse(source_or_path, start_rule_name, lexer_class, parser_class, from_file=False):
+def parse(source_or_path, start_rule_name, lexer_class, parser_class, from_file=False, error_log=None,
+          budget=None):
     """
     Creates a parser on the provided source or source file, adds a `SyntaxErrorLog` as
     error listener at both the lex and parse stages, and attempts the parse from the given
@@ -25,6 +27,9 @@ def parse(source_or_path, start_rule_name, lexer_class, parser_class, from_file=
     :param lexer_class: A generated ANTLR lexer class
     :param parser_class: A generated ANTLR parser class
     :param from_file: True if input is a file
+    :param error_log: The `SyntaxErrorLog` to use, if not a new one
+    :param budget: A `parsewatchdog.ParseBudget` limiting the parse; exceeding it is
+        logged as a syntax error, with no parse tree
     :return: The computed ANTLR parse tree
     """
     if from_file:
@@ -37,12 +42,21 @@ def parse(source_or_path, start_rule_name, lexer_class, parser_class, from_file=
 
     lexer.removeErrorListeners()
     parser.removeErrorListeners()
-    error_log = SyntaxErrorLog()
+    error_log = error_log if error_log is not None else SyntaxErrorLog()
     lexer.addErrorListener(error_log)
     parser.addErrorListener(error_log)
 
+    if budget is not None:
+        install_watchdog(parser, budget)
+
     parse_function = parser.__getattribute__(start_rule_name)
-    parse_tree = parse_function()
+    try:
+        parse_tree = parse_function()
+    except BudgetExceeded as e:
+        (line, column), (end_line, end_column) = e.span()
+        error_log.syntaxError(parser, e.start, line, column,
+                              f'{e.message}, over {line}:{column} to {end_line}:{end_column}', e)
+        raise SyntaxErrors(error_log, None)
 
     if error_log.has_errors():
         raise SyntaxErrors(error_log, parse_tree)
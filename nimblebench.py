@@ -0,0 +1,310 @@
+"""
+Benchmarks the stages of Nimble front-end processing on synthetic programs.
+
+`generate_program` writes a random but reproducible Nimble script, shaped by
+the number of functions, statements per body, nesting depth of `while` and
+`if` blocks, operands per expression and the fraction of statements that
+contain a semantic error. Each generated function takes up to three `Int`
+parameters and returns an `Int`, ending with a `return`. Functions are
+called both as statements and as operands of `Int` expressions, from main
+and from each other, before or after their definitions, so the analysis
+checks calls and resolves names through function scopes. Erroneous calls
+pass a `Bool` argument.
+
+`run_benchmark` times each stage separately, taking the best of several
+runs, and measures each stage's peak memory with `tracemalloc` in one extra
+run:
+
+- `lex`: `NimbleLexer` over the whole source, filling a token stream;
+- `parse`: `NimbleParser.script` over the lexed tokens;
+- `define_scopes`: walking `nimblesemantics.DefineScopesAndSymbols`;
+- `infer_types`: walking `nimblesemantics.InferTypesAndCheckConstraints`;
+- `index`: `testhelpers.index` over the inferred types.
+
+Results can be appended to a JSON-lines file, one record per run, tagged
+with the current git commit, for comparison across commits.
+
+Run with `python nimblebench.py [--functions N] [--statements N] [--depth N]
+[--expression-length N] [--error-density P] [--seed N] [--repeat N]
+[--store FILE] [--source FILE]`; with `--source`, the given script is
+benchmarked instead, e.g. one found by `nimblefuzz.py`.
+
+Version: 2026-10-19
+"""
+
+import argparse
+import gc
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+from antlr4 import CommonTokenStream, InputStream, ParseTreeWalker
+from errorlog import ErrorLog
+from nimble import NimbleLexer, NimbleParser
+from nimblesemantics import DefineScopesAndSymbols, InferTypesAndCheckConstraints
+from symboltable import Scope
+from testhelpers import index
+
+STAGES = ('lex', 'parse', 'define_scopes', 'infer_types', 'index')
+
+
+# ---------------------------------------------------------------------------------
+# Program generation
+
+class ProgramGenerator:
+    """
+    Generates Nimble scripts. See `generate_program` for the parameters.
+    """
+
+    def __init__(self, functions=10, statements=20, depth=3, expression_length=4, error_density=0.0,
+                 seed=0):
+        self.functions = functions
+        self.statements = statements
+        self.depth = depth
+        self.expression_length = expression_length
+        self.error_density = error_density
+        self.random = random.Random(seed)
+        self.__lines = []
+        self.__ints = []
+        self.__bools = []
+        # Number of parameters of each function
+        self.__arities = []
+
+    def generate(self) -> str:
+        self.__lines = []
+        # Known up front, so calls may precede a function's definition
+        self.__arities = [self.random.randrange(4) for _ in range(self.functions)]
+        for i, arity in enumerate(self.__arities):
+            parameters = [f'f{i}_p{k}' for k in range(arity)]
+            self.__lines.append(f'func f{i}({", ".join(p + " : Int" for p in parameters)}) -> Int {{')
+            self.__body(f'f{i}_', 1, parameters)
+            self.__lines.append(f'    return {self.__int_expr()}')
+            self.__lines.append('}')
+        self.__body('m_', 0, [])
+        return '\n'.join(self.__lines) + '\n'
+
+    def __body(self, prefix, indent, parameters):
+        pad = '    ' * indent
+        # Each initializer uses only the parameters and variables declared before it
+        self.__ints, self.__bools = list(parameters), []
+        for k in range(3):
+            self.__lines.append(f'{pad}var {prefix}i{k} : Int = {self.__int_expr()}')
+            self.__ints.append(f'{prefix}i{k}')
+        for k in range(2):
+            self.__lines.append(f'{pad}var {prefix}b{k} : Bool = {self.__bool_expr()}')
+            self.__bools.append(f'{prefix}b{k}')
+        self.__lines.append(f'{pad}var {prefix}s : String = "text\\t{prefix}"')
+        self.__block(indent, self.depth)
+
+    def __block(self, indent, depth):
+        pad = '    ' * indent
+        for _ in range(self.statements):
+            erroneous = self.random.random() < self.error_density
+            kind = self.random.choice(['assign', 'assign', 'print', 'block', 'call'] if depth else
+                                      ['assign', 'assign', 'print', 'call'])
+            if kind == 'block':
+                keyword = self.random.choice(['while', 'if'])
+                condition = self.__int_expr() if erroneous else self.__bool_expr()
+                self.__lines.append(f'{pad}{keyword} {condition} {{')
+                self.__block(indent + 1, depth - 1)
+                self.__lines.append(f'{pad}}}')
+                # Nested blocks take the place of several statements, to bound the size
+                return
+            if kind == 'call' and self.functions:
+                self.__lines.append(f'{pad}{self.__call(erroneous)}')
+            elif kind == 'print':
+                value = f'true + {self.__int_expr()}' if erroneous else self.__int_expr()
+                self.__lines.append(f'{pad}print {value}')
+            elif self.random.random() < 0.7:
+                value = self.__bool_expr() if erroneous else self.__int_expr()
+                self.__lines.append(f'{pad}{self.random.choice(self.__ints)} = {value}')
+            else:
+                value = f'undefined_{self.random.randrange(100)}' if erroneous else self.__bool_expr()
+                self.__lines.append(f'{pad}{self.random.choice(self.__bools)} = {value}')
+
+    def __call(self, erroneous=False):
+        """
+        Returns a call of a random function with `Int` operands as arguments; if erroneous,
+        one argument is a `Bool`, or a parameterless function gets one.
+        """
+        i = self.random.randrange(self.functions)
+        arguments = [self.__int_operand(calls=False) for _ in range(self.__arities[i])]
+        if erroneous and arguments:
+            arguments[self.random.randrange(len(arguments))] = 'true'
+        elif erroneous:
+            arguments.append('true')
+        return f'f{i}({", ".join(arguments)})'
+
+    def __int_operand(self, calls=True):
+        choice = self.random.random()
+        if calls and self.functions and choice < 0.1:
+            return self.__call()
+        if choice < 0.4:
+            return self.random.choice(self.__ints) if self.__ints else '1'
+        if choice < 0.9:
+            return str(self.random.randrange(1, 1000))
+        return f'-({self.random.choice(self.__ints) if self.__ints else "1"})'
+
+    def __int_expr(self):
+        parts = [self.__int_operand()]
+        for _ in range(self.random.randrange(1, self.expression_length + 1) - 1):
+            parts.append(self.random.choice('+-*/'))
+            parts.append(self.__int_operand())
+        if len(parts) > 3 and self.random.random() < 0.5:
+            parts[0] = '(' + parts[0]
+            parts[2] = parts[2] + ')'
+        return ' '.join(parts)
+
+    def __bool_expr(self):
+        if self.__bools and self.random.random() < 0.3:
+            return '!' + self.random.choice(self.__bools)
+        return f'{self.__int_expr()} {self.random.choice(["<", "<=", "=="])} {self.__int_expr()}'
+
+
+def generate_program(functions=10, statements=20, depth=3, expression_length=4, error_density=0.0,
+                     seed=0) -> str:
+    """
+    Returns a synthetic Nimble script.
+
+    :param functions: Number of functions, called as statements and in expressions
+    :param statements: Number of statements per block, before any nested block
+    :param depth: Maximum nesting depth of `while` and `if` blocks
+    :param expression_length: Maximum number of operands in an `Int` expression
+    :param error_density: Fraction of statements given a semantic error
+    :param seed: Seed for the random choices, so the same parameters give the same script
+    """
+    return ProgramGenerator(functions, statements, depth, expression_length, error_density, seed).generate()
+
+
+# ---------------------------------------------------------------------------------
+# Measurement
+
+def _run_stages(source, measure):
+    """
+    Runs every stage once, calling `measure(stage, function)` to run each; returns the
+    number of tokens and the error log.
+    """
+    stream = CommonTokenStream(NimbleLexer(InputStream(source)))
+    measure('lex', stream.fill)
+    tree = measure('parse', NimbleParser(stream).script)
+    error_log = ErrorLog()
+    global_scope = Scope('$global', None, None)
+    node_types = {}
+    walker = ParseTreeWalker()
+    measure('define_scopes',
+            lambda: walker.walk(DefineScopesAndSymbols(error_log, global_scope, node_types), tree))
+    measure('infer_types',
+            lambda: walker.walk(InferTypesAndCheckConstraints(error_log, global_scope, node_types), tree))
+    measure('index', lambda: index(node_types))
+    return len(stream.tokens), error_log
+
+
+def run_benchmark(source, repeat=5):
+    """
+    Benchmarks each stage on the source. Returns a dictionary with the source's line and
+    token counts, the number of semantic errors, and for each stage its best time in
+    seconds, its throughput in lines and tokens per second, its peak memory in bytes, and
+    the time of every run, as `samples`.
+    """
+    samples = {stage: [] for stage in STAGES}
+
+    def timed(stage, function):
+        start = time.perf_counter()
+        result = function()
+        samples[stage].append(time.perf_counter() - start)
+        return result
+
+    # As in timeit, collections triggered by earlier runs' garbage would only add noise
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            tokens, error_log = _run_stages(source, timed)
+            gc.collect()
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    peaks = {}
+
+    def traced(stage, function):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = function()
+        peaks[stage] = tracemalloc.get_traced_memory()[1] - baseline
+        return result
+
+    tracemalloc.start()
+    try:
+        _run_stages(source, traced)
+    finally:
+        tracemalloc.stop()
+
+    lines = source.count('\n')
+    times = {stage: min(samples[stage]) for stage in STAGES}
+    return {'lines': lines, 'tokens': tokens, 'errors': error_log.total_entries(),
+            'stages': {stage: {'seconds': times[stage], 'lines_per_s': lines / times[stage],
+                               'tokens_per_s': tokens / times[stage], 'peak_bytes': peaks[stage],
+                               'samples': samples[stage]}
+                       for stage in STAGES}}
+
+
+def current_commit():
+    """The abbreviated hash of the git commit checked out, or None if it can't be found."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def store_result(path, parameters, result):
+    """Appends a benchmark result to a JSON-lines file, with its parameters and commit."""
+    record = {'commit': current_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(), 'parameters': parameters, **result}
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(record) + '\n')
+    return record
+
+
+def load_results(path):
+    """Returns the records stored in a JSON-lines results file, oldest first."""
+    with open(path, encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark the Nimble front end on a synthetic program')
+    arg_parser.add_argument('--functions', type=int, default=10)
+    arg_parser.add_argument('--statements', type=int, default=20)
+    arg_parser.add_argument('--depth', type=int, default=3)
+    arg_parser.add_argument('--expression-length', type=int, default=4)
+    arg_parser.add_argument('--error-density', type=float, default=0.0)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--repeat', type=int, default=5, help='runs to take the best time of')
+    arg_parser.add_argument('--store', help='JSON-lines file to append the result to')
+    arg_parser.add_argument('--source', help='Nimble script to benchmark instead of a generated one')
+    args = arg_parser.parse_args()
+    parameters = {'functions': args.functions, 'statements': args.statements, 'depth': args.depth,
+                  'expression_length': args.expression_length, 'error_density': args.error_density,
+                  'seed': args.seed}
+    if args.source:
+        parameters = {'source': args.source}
+        with open(args.source, encoding='utf-8') as file:
+            source = file.read()
+    else:
+        source = generate_program(**parameters)
+    result = run_benchmark(source, args.repeat)
+    print(f'{result["lines"]} lines, {result["tokens"]} tokens, {result["errors"]} errors')
+    for stage, stats in result['stages'].items():
+        print(f'{stage:14} {stats["seconds"] * 1000:9.3f} ms {stats["lines_per_s"]:12,.0f} lines/s '
+              f'{stats["tokens_per_s"]:12,.0f} tokens/s {stats["peak_bytes"] / 1024:10,.1f} KiB peak')
+    if args.store:
+        store_result(args.store, parameters, result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+"""
+Fuzzes the Nimble front end with random scripts generated from the grammar.
+
+`GrammarFuzzer` has one method per parser rule of `Nimble.g4`, each choosing
+at random among the rule's alternatives, so every script it generates is
+syntactically valid, and every construct, including function definitions,
+parameters, calls, `return` and `else`, turns up. Names are drawn from a
+small pool, and operands and types are chosen regardless of each other, so
+most scripts are ill-typed, use undefined names or redefine names. Rules
+past `max_depth` choose only their non-recursive alternatives.
+
+`fuzz` runs each script through `testhelpers.do_semantic_analysis`,
+recording:
+
+- throughput, in scripts and tokens per second;
+- crashes: any exception other than the errors logged by the analysis,
+  grouped by exception type and the line of the analysis that raised it;
+- the slowest scripts, and every script slower than `slow_seconds`;
+- scripts that fail to parse, which would be a bug in the fuzzer.
+
+Run with `python nimblefuzz.py [--count N] [--seed N] [--max-depth N]
+[--slow-ms MS] [--corpus DIR]`. With `--corpus`, the first script found for
+each crash and every slow script are written to the directory, for use as
+regression tests or with `python nimblebench.py --source FILE`. The exit
+status is 1 if anything crashed.
+
+Version: 2026-10-19
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import traceback
+from dataclasses import dataclass, field
+
+from generic_parser import SyntaxErrors
+from testhelpers import do_semantic_analysis
+
+# Few enough names that scripts often reuse and redefine them
+NAMES = ('a', 'b', 'n', 'x', 'f', 'g')
+TYPES = ('Int', 'Bool', 'String')
+
+
+class GrammarFuzzer:
+    """
+    Generates random Nimble scripts, as token lists, one method per grammar rule.
+
+    :param seed: Seed for the random choices
+    :param max_depth: Nesting depth of rules beyond which only non-recursive alternatives are chosen
+    :param max_repeat: Largest number of repetitions of a `*` in the grammar
+    """
+
+    def __init__(self, seed=0, max_depth=6, max_repeat=4):
+        self.random = random.Random(seed)
+        self.max_depth = max_depth
+        self.max_repeat = max_repeat
+        self.__tokens = []
+        self.__depth = 0
+
+    def generate(self) -> str:
+        self.__tokens = []
+        self.__depth = 0
+        self.script()
+        return ' '.join(self.__tokens)
+
+    def __emit(self, *tokens):
+        self.__tokens.extend(tokens)
+
+    def __repeat(self):
+        return range(self.random.randint(0, self.max_repeat))
+
+    def __deep(self):
+        return self.__depth >= self.max_depth
+
+    def __name(self):
+        return self.random.choice(NAMES)
+
+    # script : funcDef* main EOF;
+    def script(self):
+        for _ in self.__repeat():
+            self.funcDef()
+        self.main()
+
+    # funcDef: 'func' ID '(' (parameterDef (',' parameterDef)*)? ')' ('->' TYPE)? '{' body '}';
+    def funcDef(self):
+        self.__emit('func', self.__name(), '(')
+        for i in self.__repeat():
+            if i:
+                self.__emit(',')
+            self.parameterDef()
+        self.__emit(')')
+        if self.random.random() < 0.7:
+            self.__emit('->', self.random.choice(TYPES))
+        self.__emit('{')
+        self.body()
+        self.__emit('}')
+
+    # parameterDef: ID ':' TYPE;
+    def parameterDef(self):
+        self.__emit(self.__name(), ':', self.random.choice(TYPES))
+
+    # main: body;
+    def main(self):
+        self.body()
+
+    # body : varBlock block;
+    def body(self):
+        self.varBlock()
+        self.block()
+
+    # varBlock: varDec* ;
+    def varBlock(self):
+        for _ in self.__repeat():
+            self.varDec()
+
+    # block : statement* ;
+    def block(self):
+        for _ in self.__repeat():
+            self.statement()
+
+    # varDec: 'var' ID ':' TYPE ('=' expr)? ;
+    def varDec(self):
+        self.__emit('var', self.__name(), ':', self.random.choice(TYPES))
+        if self.random.random() < 0.8:
+            self.__emit('=')
+            self.expr()
+
+    # statement : assignment | while | if | print | return | funcCallStmt ;
+    def statement(self):
+        self.__depth += 1
+        kinds = ['assignment', 'print', 'return', 'funcCallStmt']
+        if not self.__deep():
+            kinds += ['while', 'if']
+        kind = self.random.choice(kinds)
+        if kind == 'assignment':
+            self.__emit(self.__name(), '=')
+            self.expr()
+        elif kind in ('while', 'if'):
+            self.__emit(kind)
+            self.expr()
+            self.__emit('{')
+            self.block()
+            self.__emit('}')
+            if kind == 'if' and self.random.random() < 0.5:
+                self.__emit('else', '{')
+                self.block()
+                self.__emit('}')
+        elif kind == 'print':
+            self.__emit('print')
+            self.expr()
+        elif kind == 'return':
+            self.__emit('return')
+            if self.random.random() < 0.7:
+                self.expr()
+        else:
+            self.funcCall()
+        self.__depth -= 1
+
+    # expr: parens | neg | mulDiv | addSub | compare | funcCallExpr | variable | ... literals ;
+    def expr(self):
+        self.__depth += 1
+        kinds = ['variable', 'stringLiteral', 'intLiteral', 'boolLiteral']
+        if not self.__deep():
+            kinds += ['parens', 'neg', 'mulDiv', 'addSub', 'compare', 'funcCallExpr'] * 2
+        kind = self.random.choice(kinds)
+        if kind == 'parens':
+            self.__emit('(')
+            self.expr()
+            self.__emit(')')
+        elif kind == 'neg':
+            self.__emit(self.random.choice('!-'))
+            self.expr()
+        elif kind in ('mulDiv', 'addSub', 'compare'):
+            self.expr()
+            self.__emit(self.random.choice({'mulDiv': ['*', '/'], 'addSub': ['+', '-'],
+                                            'compare': ['<', '<=', '==']}[kind]))
+            self.expr()
+        elif kind == 'funcCallExpr':
+            self.funcCall()
+        elif kind == 'variable':
+            self.__emit(self.__name())
+        elif kind == 'stringLiteral':
+            self.__emit(self.random.choice(['""', '"text"', '"tab\\t"', '"quote\\""']))
+        elif kind == 'intLiteral':
+            self.__emit(str(self.random.choice([0, 1, 7, 42, 2 ** 31, 10 ** 30])))
+        else:
+            self.__emit(self.random.choice(['true', 'false']))
+        self.__depth -= 1
+
+    # funcCall: ID '('(expr (',' expr)* )?')';
+    def funcCall(self):
+        self.__emit(self.__name(), '(')
+        for i in range(0 if self.__deep() else self.random.randint(0, 3)):
+            if i:
+                self.__emit(',')
+            self.expr()
+        self.__emit(')')
+
+
+@dataclass
+class Crash:
+    """The scripts raising the same type of exception from the same line of code."""
+    error: str
+    location: str
+    sources: list = field(default_factory=list)
+
+
+@dataclass
+class FuzzReport:
+    scripts: int = 0
+    tokens: int = 0
+    seconds: float = 0.0
+    # Keyed by exception type and location
+    crashes: dict = field(default_factory=dict)
+    # (seconds, source) pairs, slowest first
+    slowest: list = field(default_factory=list)
+    slow: list = field(default_factory=list)
+    unparsable: list = field(default_factory=list)
+
+    @property
+    def scripts_per_s(self):
+        return self.scripts / self.seconds if self.seconds else 0.0
+
+    @property
+    def tokens_per_s(self):
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+
+def _crash_location(e: BaseException):
+    """The innermost frame of the traceback outside the antlr4 runtime, as `file:line`."""
+    frames = [f for f in traceback.extract_tb(e.__traceback__) if f'{os.sep}antlr4{os.sep}' not in f.filename]
+    frame = frames[-1] if frames else traceback.extract_tb(e.__traceback__)[-1]
+    return f'{os.path.basename(frame.filename)}:{frame.lineno}'
+
+
+def fuzz(count=1000, seed=0, max_depth=6, slow_seconds=0.1, keep_slowest=5):
+    """
+    Generates `count` scripts and analyzes each, returning a `FuzzReport`.
+
+    :param seed: Seed for the `GrammarFuzzer`
+    :param max_depth: Nesting depth for the `GrammarFuzzer`
+    :param slow_seconds: Time beyond which a script is recorded as slow
+    :param keep_slowest: Number of slowest scripts to record
+    """
+    fuzzer = GrammarFuzzer(seed, max_depth)
+    report = FuzzReport()
+    for _ in range(count):
+        source = fuzzer.generate()
+        start = time.perf_counter()
+        try:
+            do_semantic_analysis(source, 'script')
+        except SyntaxErrors:
+            report.unparsable.append(source)
+        except Exception as e:
+            key = (type(e).__name__, _crash_location(e))
+            report.crashes.setdefault(key, Crash(f'{type(e).__name__}: {e}', key[1])).sources.append(source)
+        elapsed = time.perf_counter() - start
+        report.scripts += 1
+        # Every token but the last is followed by a space
+        report.tokens += source.count(' ') + 1
+        report.seconds += elapsed
+        if elapsed > slow_seconds:
+            report.slow.append((elapsed, source))
+        report.slowest.append((elapsed, source))
+        if len(report.slowest) > 2 * keep_slowest:
+            report.slowest = sorted(report.slowest, reverse=True)[:keep_slowest]
+    report.slowest = sorted(report.slowest, reverse=True)[:keep_slowest]
+    return report
+
+
+def write_corpus(report: FuzzReport, directory):
+    """Writes the first script of each crash, and every slow script, to files in the directory."""
+    os.makedirs(directory, exist_ok=True)
+    for i, crash in enumerate(report.crashes.values()):
+        with open(os.path.join(directory, f'crash-{i}.nimble'), 'w', encoding='utf-8') as file:
+            file.write(f'// {crash.error} at {crash.location}\n{crash.sources[0]}\n')
+    for i, (seconds, source) in enumerate(report.slow):
+        with open(os.path.join(directory, f'slow-{i}.nimble'), 'w', encoding='utf-8') as file:
+            file.write(f'// {seconds * 1000:.1f} ms\n{source}\n')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Fuzz Nimble semantic analysis with random scripts')
+    arg_parser.add_argument('--count', type=int, default=1000, help='number of scripts to generate')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--max-depth', type=int, default=6)
+    arg_parser.add_argument('--slow-ms', type=float, default=100, help='time beyond which a script is slow')
+    arg_parser.add_argument('--corpus', help='directory to write crashing and slow scripts to')
+    args = arg_parser.parse_args()
+    report = fuzz(args.count, args.seed, args.max_depth, args.slow_ms / 1000)
+    print(f'{report.scripts} scripts, {report.tokens} tokens in {report.seconds:.3f} s: '
+          f'{report.scripts_per_s:,.0f} scripts/s, {report.tokens_per_s:,.0f} tokens/s')
+    for crash in sorted(report.crashes.values(), key=lambda c: -len(c.sources)):
+        print(f'CRASH x{len(crash.sources)} at {crash.location}: {crash.error}\n    {crash.sources[0][:200]}')
+    for source in report.unparsable[:5]:
+        print(f'UNPARSABLE: {source[:200]}')
+    print(f'{len(report.slow)} scripts slower than {args.slow_ms:g} ms; slowest:')
+    for seconds, source in report.slowest:
+        print(f'{seconds * 1000:8.3f} ms  {source[:100]}')
+    if args.corpus:
+        write_corpus(report, args.corpus)
+    sys.exit(1 if report.crashes else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,905 @@
+"""
+Executes Nimble programs by compiling their parse trees into nested Python
+closures.
+
+Rather than walking `NimbleParser` contexts while the program runs, the
+`Compiler` visits each `expr` and `statement` node exactly once, producing a
+closure that does only that node's run-time work. A running function keeps
+its parameters and variables in one preallocated list, its frame, and every
+variable access is a list index fixed at compile time: a parameter lives at
+its `Symbol.index`, a variable at the number of parameters plus its
+`Symbol.index`. Executing `while` and `if` blocks therefore involves no tree
+navigation, `getText()` calls or dictionary lookups.
+
+Only scripts that pass semantic analysis are compiled: the `Compiler`
+requires the `type_of` map computed by `nimblesemantics`, and
+`compile_source` and the command line run `testhelpers.check_script`
+first, refusing a script with errors. Expression types are taken from
+`type_of` where it has an entry for the node, and otherwise inferred by the
+compiler as it goes. Types decide how values print and the initial value of
+a variable declared without one: `0`, `false` or `""`.
+
+With `tail_calls` set, a `return` of a call to the function it appears in
+(a self tail call) doesn't call at all: it overwrites the parameters in the
+running function's frame, resets its variables, and jumps back to the start
+of the function body. Such recursion then runs in constant stack depth and
+allocates no frames, however deep it goes.
+
+Calls of the functions named in `memoize` are memoized: each function keeps
+a bounded LRU cache of results by argument values, consulted before running
+its body. Only pure functions, which always return the same result for the
+same arguments and do nothing else (see `nimbleoptimizer.pure_functions`),
+may be memoized.
+
+String literals are decoded once, at compile time, and interned, so every
+occurrence of the same string in a script is the same object. Adding two
+`String` values concatenates them; a long result is a `Rope`, which keeps its
+pieces and only joins them when its text is needed, so a string built by
+repeated `s = s + piece` takes linear rather than quadratic time. The
+semantic analysis doesn't yet allow `+` between `String` values, so until it
+does this is only run-time support.
+
+Run-time semantics: `Int` is unbounded, `/` truncates towards zero, and
+`print` writes the value followed by a newline, printing `Bool` values as
+`true` or `false`. Dividing by zero raises `NimbleRuntimeError`.
+
+With `overflow` set, `Int` is instead 64-bit two's complement, as on the
+target platform: every `Int` operation's result is wrapped into range
+(`'wrap'`), or an out-of-range result raises `NimbleRuntimeError` (`'trap'`).
+Integer literals out of range are wrapped, or rejected with a
+`CompileError`. Trees folded by `nimbleoptimizer.fold_constants` must have
+been folded with the same `overflow`. Printed text
+is collected by a `nimbleoutput.BufferedOutput` and written in large chunks.
+
+Run with `python nimbleinterpreter.py SCRIPT [--tail-calls] [--memoize]
+[--overflow {wrap,trap}]`, or
+`python nimbleinterpreter.py --benchmark` to time an arithmetic loop,
+recursive calls, and the output throughput of a print loop.
+
+Version: 2026-10-19
+"""
+
+import argparse
+import operator
+import sys
+import time
+from collections import OrderedDict
+
+from generic_parser import parse
+from nimble import NimbleLexer, NimbleParser
+from nimbleoutput import DEFAULT_CAPACITY, BufferedOutput
+from symboltable import FunctionType, PrimitiveType, Scope
+from testhelpers import SemanticErrors, check_script
+
+_TYPES = {'Int': PrimitiveType.Int, 'Bool': PrimitiveType.Bool, 'String': PrimitiveType.String}
+_INITIAL_VALUES = {PrimitiveType.Int: 0, PrimitiveType.Bool: False, PrimitiveType.String: ''}
+_ESCAPES = {'a': '\a', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v',
+            "'": "'", '"': '"', '\\': '\\', '?': '?'}
+
+
+class CompileError(Exception):
+    """Raised when a parse tree can't be compiled, e.g. because it uses an undefined name."""
+
+
+class NimbleRuntimeError(Exception):
+    """Raised when a running Nimble program fails, e.g. by dividing by zero."""
+
+
+class _Function:
+    """
+    A compiled function. `frame` is the frame a call starts from: parameter slots, then
+    variables at their initial values, then one slot for the return value. `memo` maps
+    argument values to results if the function is memoized, and is otherwise None.
+    """
+    __slots__ = ('name', 'parameter_count', 'frame', 'body', 'memo')
+
+    def __init__(self, name, parameter_count, frame):
+        self.name = name
+        self.parameter_count = parameter_count
+        self.frame = frame
+        self.body = None
+        self.memo = None
+
+
+class CompiledScript:
+    """
+    A compiled Nimble script, which can be run any number of times.
+
+    :param main: The compiled main, as a `_Function` taking no parameters
+    :param functions: The compiled functions, by name
+    :param output: The one-element list through which the compiled prints write
+    """
+
+    def __init__(self, main, functions, output):
+        self.main = main
+        self.functions = functions
+        self.__output = output
+
+    def run(self, write=None, capacity=DEFAULT_CAPACITY):
+        """
+        Runs the script's main.
+
+        :param write: Called with each chunk of printed text; by default `sys.stdout.write`
+        :param capacity: Characters of printed text to collect before calling `write`, or 0
+            to call it for every print
+        """
+        write = write or sys.stdout.write
+        if not capacity:
+            self.__output[0] = write
+            self.main.body(self.main.frame.copy())
+            return
+        output = BufferedOutput(write, capacity)
+        self.__output[0] = output.write
+        try:
+            self.main.body(self.main.frame.copy())
+        finally:
+            output.flush()
+
+
+class Compiler:
+    """
+    Compiles a Nimble parse tree into closures. Each `compile...` method compiles one
+    kind of context, named as in `NimbleListener`; expression methods return the
+    closure together with the expression's type.
+
+    :param type_of: The node types inferred by semantic analysis of the script, which
+        must have found no errors
+    :param tables: `nimbleoptimizer.SideTables` from the optimization passes, or None
+    :param tail_calls: True to turn self tail calls into jumps
+    :param memoize: Names of pure functions whose calls to memoize
+    :param memo_size: Maximum number of results each memoized function keeps
+    :param overflow: None for unbounded `Int`, or `'wrap'` or `'trap'` for 64-bit `Int`
+        which wraps or raises `NimbleRuntimeError` on overflow
+    """
+
+    def __init__(self, type_of, tables=None, tail_calls=False, memoize=(), memo_size=4096,
+                 overflow=None):
+        if overflow not in (None, 'wrap', 'trap'):
+            raise ValueError(f'overflow must be None, wrap or trap, not {overflow!r}')
+        self.type_of = type_of
+        self.tail_calls = tail_calls
+        self.memoize = set(memoize)
+        self.memo_size = memo_size
+        self.overflow = overflow
+        self.constant_value = tables.constant_value if tables else {}
+        self.replacement = tables.replacement if tables else {}
+        self.unreachable = tables.unreachable if tables else set()
+        self.global_scope = Scope('$global', None, None)
+        self.functions = {}
+        # Decoded string literals, interned, by literal text
+        self.strings = {}
+        # The print target, replaced when a script is run
+        self.write = [sys.stdout.write]
+        self.__scope = None
+        self.__slots = None
+        self.__function = None
+        self.__has_tail_call = False
+
+    def compile_script(self, ctx: NimbleParser.ScriptContext) -> CompiledScript:
+        # Declare every function before compiling any body, so calls may precede definitions
+        for func_def in ctx.funcDef():
+            self.declare_function(func_def)
+        for func_def in ctx.funcDef():
+            self.compileFuncDef(func_def)
+        main = self.compileMain(ctx.main())
+        return CompiledScript(main, self.functions, self.write)
+
+    def declare_function(self, ctx: NimbleParser.FuncDefContext):
+        name = ctx.ID().getText()
+        if self.global_scope.resolve_locally(name) is not None:
+            raise CompileError(f'function {name} is defined more than once')
+        parameter_types = [_TYPES[p.TYPE().getText()] for p in ctx.parameterDef()]
+        return_type = _TYPES[ctx.TYPE().getText()] if ctx.TYPE() else PrimitiveType.Void
+        self.global_scope.define(name, FunctionType(parameter_types, return_type))
+        self.functions[name] = _Function(name, len(parameter_types), None)
+        if name in self.memoize:
+            self.functions[name].memo = OrderedDict()
+
+    # ---------------------------------------------------------------------------------
+    # Program structure
+
+    def compileFuncDef(self, ctx: NimbleParser.FuncDefContext):
+        name = ctx.ID().getText()
+        symbol = self.global_scope.resolve_locally(name)
+        scope = self.global_scope.create_child_scope(name, symbol.type.return_type)
+        for parameter in ctx.parameterDef():
+            parameter_name = parameter.ID().getText()
+            if scope.resolve_locally(parameter_name) is not None:
+                raise CompileError(f'parameter {parameter_name} of {name} is defined more than once')
+            scope.define(parameter_name, _TYPES[parameter.TYPE().getText()], is_param=True)
+        self.functions[name] = self.__compile_unit(name, scope, ctx.body())
+
+    def compileMain(self, ctx: NimbleParser.MainContext):
+        scope = self.global_scope.create_child_scope('$main', PrimitiveType.Void)
+        return self.__compile_unit('$main', scope, ctx.body())
+
+    def __compile_unit(self, name, scope, body):
+        self.__scope = scope
+        variables = [(v.ID().getText(), _TYPES[v.TYPE().getText()]) for v in body.varBlock().varDec()]
+        parameter_count = len(scope.parameters())
+        frame = [None] * parameter_count + [_INITIAL_VALUES[t] for _, t in variables] + [None]
+        function = self.functions.get(name) or _Function(name, parameter_count, None)
+        function.frame = frame
+        self.__function = function
+        self.__has_tail_call = False
+        self.__slots = {}
+        for parameter in scope.parameters():
+            self.__slots[parameter.name] = parameter.index
+        initializers = []
+        for var_dec in body.varBlock().varDec():
+            initializer = self.compileVarDec(var_dec)
+            if initializer is not None:
+                initializers.append(initializer)
+        block = self.compileBlock(body.block())
+        function.body = _sequence(initializers + [block]) if initializers else block
+        if self.__has_tail_call:
+            function.body = _restartable(function.body)
+        return function
+
+    def compileVarDec(self, ctx: NimbleParser.VarDecContext):
+        """Defines the variable; returns a closure initializing it, or None if it has no initial value."""
+        name = ctx.ID().getText()
+        if self.__scope.resolve_locally(name) is not None:
+            raise CompileError(f'line {ctx.start.line}: {name} is defined more than once')
+        # The initial value is compiled before the variable is in scope
+        value = self.compile_expr(ctx.expr())[0] if ctx.expr() else None
+        self.__scope.define(name, _TYPES[ctx.TYPE().getText()])
+        slot = len(self.__scope.parameters()) + self.__scope.resolve_locally(name).index
+        self.__slots[name] = slot
+        if value is None:
+            return None
+
+        def initialize(frame):
+            frame[slot] = value(frame)
+        return initialize
+
+    def compileBlock(self, ctx: NimbleParser.BlockContext):
+        return _sequence([self.compile_statement(s) for s in ctx.statement() if s not in self.unreachable])
+
+    # ---------------------------------------------------------------------------------
+    # Statements
+    #
+    # A statement closure takes the frame and returns True if it executed a `return`,
+    # having stored any returned value in the frame's last slot, or _TAIL_CALL if it
+    # made a self tail call, having set up the frame for the function to restart.
+
+    def compile_statement(self, ctx):
+        return getattr(self, 'compile' + type(ctx).__name__[:-len('Context')])(ctx)
+
+    def compileAssignment(self, ctx: NimbleParser.AssignmentContext):
+        slot = self.__slot(ctx.ID())
+        value = self.compile_expr(ctx.expr())[0]
+
+        def assign(frame):
+            frame[slot] = value(frame)
+        return assign
+
+    def compileWhile(self, ctx: NimbleParser.WhileContext):
+        if self.__constant(ctx.expr()) is False:
+            return _no_op
+        condition = self.compile_expr(ctx.expr())[0]
+        body = self.compileBlock(ctx.block())
+
+        def loop(frame):
+            while condition(frame):
+                result = body(frame)
+                if result:
+                    return result
+        return loop
+
+    def compileIf(self, ctx: NimbleParser.IfContext):
+        constant = self.__constant(ctx.expr())
+        if constant is not None:
+            # Only the branch taken is compiled
+            taken = ctx.block(0) if constant else ctx.block(1)
+            return self.compileBlock(taken) if taken is not None else _no_op
+        condition = self.compile_expr(ctx.expr())[0]
+        then_block = self.compileBlock(ctx.block(0))
+        if ctx.block(1) is None:
+            def if_then(frame):
+                if condition(frame):
+                    return then_block(frame)
+            return if_then
+        else_block = self.compileBlock(ctx.block(1))
+
+        def if_then_else(frame):
+            if condition(frame):
+                return then_block(frame)
+            return else_block(frame)
+        return if_then_else
+
+    def compilePrint(self, ctx: NimbleParser.PrintContext):
+        value, value_type = self.compile_expr(ctx.expr())
+        output = self.write
+        if value_type == PrimitiveType.Bool:
+            def print_bool(frame):
+                output[0]('true\n' if value(frame) else 'false\n')
+            return print_bool
+
+        # Formatting turns a Rope into its text
+        def print_value(frame):
+            output[0](f'{value(frame)}\n')
+        return print_value
+
+    def compileReturn(self, ctx: NimbleParser.ReturnContext):
+        if ctx.expr() is None:
+            return _return_none
+        if self.tail_calls:
+            call = self.__self_call(ctx.expr())
+            if call is not None:
+                self.__has_tail_call = True
+                return _tail_call(self.__function, self.__arguments(call))
+        value = self.compile_expr(ctx.expr())[0]
+
+        def return_value(frame):
+            frame[-1] = value(frame)
+            return True
+        return return_value
+
+    def compileFuncCallStmt(self, ctx: NimbleParser.FuncCallStmtContext):
+        call = self.compileFuncCall(ctx.funcCall())[0]
+
+        def call_statement(frame):
+            call(frame)
+        return call_statement
+
+    # ---------------------------------------------------------------------------------
+    # Expressions
+    #
+    # An expression closure takes the frame and returns the expression's value.
+
+    def compile_expr(self, ctx):
+        """Returns the closure evaluating the expression, and the expression's type."""
+        ctx = self.replacement.get(ctx, ctx)
+        if ctx in self.constant_value:
+            value = self.constant_value[ctx]
+            return (lambda frame: value), _constant_type(value)
+        value, inferred_type = getattr(self, 'compile' + type(ctx).__name__[:-len('Context')])(ctx)
+        return value, self.type_of.get(ctx, inferred_type)
+
+    def compileParens(self, ctx: NimbleParser.ParensContext):
+        return self.compile_expr(ctx.expr())
+
+    def compileNeg(self, ctx: NimbleParser.NegContext):
+        operand = self.compile_expr(ctx.expr())[0]
+        if ctx.op.text == '-' and self.overflow is None:
+            return (lambda frame: -operand(frame)), PrimitiveType.Int
+        if ctx.op.text == '-' and self.overflow == 'wrap':
+            return (lambda frame: ((-operand(frame) - INT_MIN) & _INT_MASK) + INT_MIN), PrimitiveType.Int
+        if ctx.op.text == '-':
+            return (lambda frame: value if (value := -operand(frame)) <= INT_MAX else _overflow(value)), \
+                PrimitiveType.Int
+        return (lambda frame: not operand(frame)), PrimitiveType.Bool
+
+    def compileMulDiv(self, ctx: NimbleParser.MulDivContext):
+        return self.__binary(ctx, _INT_OPERATIONS[ctx.op.text], self.overflow), PrimitiveType.Int
+
+    def compileAddSub(self, ctx: NimbleParser.AddSubContext):
+        if ctx.op.text == '+' and (self.__is_string(ctx.expr(0)) or self.__is_string(ctx.expr(1))):
+            return self.__binary(ctx, concatenate), PrimitiveType.String
+        return self.__binary(ctx, _INT_OPERATIONS[ctx.op.text], self.overflow), PrimitiveType.Int
+
+    def compileCompare(self, ctx: NimbleParser.CompareContext):
+        return self.__binary(ctx, _COMPARISONS[ctx.op.text]), PrimitiveType.Bool
+
+    def compileFuncCallExpr(self, ctx: NimbleParser.FuncCallExprContext):
+        return self.compileFuncCall(ctx.funcCall())
+
+    def compileVariable(self, ctx: NimbleParser.VariableContext):
+        slot = self.__slot(ctx.ID())
+        symbol = self.__scope.resolve_locally(ctx.ID().getText())
+        return (lambda frame: frame[slot]), symbol.type
+
+    def compileStringLiteral(self, ctx: NimbleParser.StringLiteralContext):
+        text = ctx.getText()
+        value = self.strings.get(text)
+        if value is None:
+            value = self.strings[text] = sys.intern(decode_string(text))
+        return (lambda frame: value), PrimitiveType.String
+
+    def compileIntLiteral(self, ctx: NimbleParser.IntLiteralContext):
+        value = self.__int_literal(ctx)
+        return (lambda frame: value), PrimitiveType.Int
+
+    def compileBoolLiteral(self, ctx: NimbleParser.BoolLiteralContext):
+        value = ctx.getText() == 'true'
+        return (lambda frame: value), PrimitiveType.Bool
+
+    def compileFuncCall(self, ctx: NimbleParser.FuncCallContext):
+        arguments = self.__arguments(ctx)
+        name = ctx.ID().getText()
+        # The callee may not be compiled yet, so its frame and body are looked up when called
+        function = self.functions[name]
+        call = _call(function, arguments) if function.memo is None else \
+            _memoized_call(function, arguments, self.memo_size)
+        return call, self.global_scope.resolve_locally(name).type.return_type
+
+    # ---------------------------------------------------------------------------------
+
+    def __slot(self, id_node):
+        slot = self.__slots.get(id_node.getText())
+        if slot is None:
+            raise CompileError(f'line {id_node.symbol.line}: {id_node.getText()} is not a defined variable')
+        return slot
+
+    def __arguments(self, ctx: NimbleParser.FuncCallContext):
+        """Checks a call and returns the closures evaluating its arguments."""
+        name = ctx.ID().getText()
+        symbol = self.global_scope.resolve_locally(name)
+        if symbol is None or not isinstance(symbol.type, FunctionType):
+            raise CompileError(f'line {ctx.start.line}: {name} is not a defined function')
+        arguments = [self.compile_expr(e)[0] for e in ctx.expr()]
+        if len(arguments) != len(symbol.type.parameter_types):
+            raise CompileError(f'line {ctx.start.line}: {name} takes '
+                               f'{len(symbol.type.parameter_types)} arguments, not {len(arguments)}')
+        return arguments
+
+    def __self_call(self, ctx):
+        """The funcCall node if the expression is a call of the function being compiled, else None."""
+        ctx = self.replacement.get(ctx, ctx)
+        while isinstance(ctx, NimbleParser.ParensContext):
+            ctx = self.replacement.get(ctx.expr(), ctx.expr())
+        if isinstance(ctx, NimbleParser.FuncCallExprContext) and \
+                ctx.funcCall().ID().getText() == self.__function.name:
+            return ctx.funcCall()
+        return None
+
+    def __constant(self, ctx):
+        """The constant value of an expression, or None if it isn't constant."""
+        return self.constant_value.get(self.replacement.get(ctx, ctx))
+
+    def __is_string(self, ctx):
+        """True if an expression is of type `String`, found without compiling it."""
+        ctx = self.replacement.get(ctx, ctx)
+        if self.type_of.get(ctx) == PrimitiveType.String or isinstance(ctx, NimbleParser.StringLiteralContext):
+            return True
+        if isinstance(ctx, NimbleParser.ParensContext):
+            return self.__is_string(ctx.expr())
+        if isinstance(ctx, NimbleParser.AddSubContext):
+            return ctx.op.text == '+' and (self.__is_string(ctx.expr(0)) or self.__is_string(ctx.expr(1)))
+        if isinstance(ctx, NimbleParser.VariableContext):
+            symbol = self.__scope.resolve_locally(ctx.ID().getText())
+            return symbol is not None and symbol.type == PrimitiveType.String
+        if isinstance(ctx, NimbleParser.FuncCallExprContext):
+            symbol = self.global_scope.resolve_locally(ctx.funcCall().ID().getText())
+            return symbol is not None and symbol.type.return_type == PrimitiveType.String
+        return False
+
+    def __binary(self, ctx, apply, overflow=None):
+        """
+        Combines the closures for a binary expression's operands. Variables and literals
+        are read directly rather than through their own closures. With `overflow`, the
+        result is wrapped or checked within the same closure, so bounded `Int` arithmetic
+        costs no extra call per operation.
+        """
+        left, right = ctx.expr(0), ctx.expr(1)
+        left_slot, left_value = self.__leaf(left)
+        right_slot, right_value = self.__leaf(right)
+        if overflow == 'wrap':
+            return self.__wrapping_binary(left, right, left_slot, right_slot, right_value, apply)
+        if overflow == 'trap':
+            return self.__trapping_binary(left, right, left_slot, right_slot, right_value, apply)
+        if left_slot is not None:
+            if right_value is not None:
+                return lambda frame: apply(frame[left_slot], right_value)
+            if right_slot is not None:
+                return lambda frame: apply(frame[left_slot], frame[right_slot])
+        left_closure = self.compile_expr(left)[0]
+        if right_value is not None:
+            return lambda frame: apply(left_closure(frame), right_value)
+        if right_slot is not None:
+            return lambda frame: apply(left_closure(frame), frame[right_slot])
+        right_closure = self.compile_expr(right)[0]
+        return lambda frame: apply(left_closure(frame), right_closure(frame))
+
+    def __wrapping_binary(self, left, right, left_slot, right_slot, right_value, apply):
+        """`__binary`, wrapping the result into the 64-bit range."""
+        if left_slot is not None:
+            if right_value is not None:
+                return lambda frame: ((apply(frame[left_slot], right_value) - INT_MIN) & _INT_MASK) + INT_MIN
+            if right_slot is not None:
+                return lambda frame: ((apply(frame[left_slot], frame[right_slot]) - INT_MIN) & _INT_MASK) + INT_MIN
+        left_closure = self.compile_expr(left)[0]
+        if right_value is not None:
+            return lambda frame: ((apply(left_closure(frame), right_value) - INT_MIN) & _INT_MASK) + INT_MIN
+        if right_slot is not None:
+            return lambda frame: ((apply(left_closure(frame), frame[right_slot]) - INT_MIN) & _INT_MASK) + INT_MIN
+        right_closure = self.compile_expr(right)[0]
+        return lambda frame: ((apply(left_closure(frame), right_closure(frame)) - INT_MIN) & _INT_MASK) + INT_MIN
+
+    def __trapping_binary(self, left, right, left_slot, right_slot, right_value, apply):
+        """`__binary`, raising `NimbleRuntimeError` if the result is out of the 64-bit range."""
+        if left_slot is not None:
+            if right_value is not None:
+                return lambda frame: value if INT_MIN <= (value := apply(frame[left_slot], right_value)) <= INT_MAX \
+                    else _overflow(value)
+            if right_slot is not None:
+                return lambda frame: value if INT_MIN <= (value := apply(frame[left_slot], frame[right_slot])) <= INT_MAX \
+                    else _overflow(value)
+        left_closure = self.compile_expr(left)[0]
+        if right_value is not None:
+            return lambda frame: value if INT_MIN <= (value := apply(left_closure(frame), right_value)) <= INT_MAX \
+                else _overflow(value)
+        if right_slot is not None:
+            return lambda frame: value if INT_MIN <= (value := apply(left_closure(frame), frame[right_slot])) <= INT_MAX \
+                else _overflow(value)
+        right_closure = self.compile_expr(right)[0]
+        return lambda frame: value if INT_MIN <= (value := apply(left_closure(frame), right_closure(frame))) <= INT_MAX \
+            else _overflow(value)
+
+    def __leaf(self, ctx):
+        """Returns (slot, None) for a variable, (None, value) for a constant, else (None, None)."""
+        while isinstance(ctx, NimbleParser.ParensContext) or ctx in self.replacement:
+            ctx = self.replacement.get(ctx) or ctx.expr()
+        if ctx in self.constant_value:
+            return None, self.constant_value[ctx]
+        if isinstance(ctx, NimbleParser.VariableContext):
+            return self.__slot(ctx.ID()), None
+        if isinstance(ctx, NimbleParser.IntLiteralContext):
+            return None, self.__int_literal(ctx)
+        return None, None
+
+    def __int_literal(self, ctx):
+        value = int(ctx.getText())
+        if self.overflow == 'wrap':
+            return wrap_int(value)
+        if self.overflow == 'trap' and not INT_MIN <= value <= INT_MAX:
+            raise CompileError(f'line {ctx.start.line}: {value} is out of range for a 64-bit Int')
+        return value
+
+
+def compile_source(source) -> CompiledScript:
+    """
+    Parses, analyzes and compiles a Nimble script; raises `SyntaxErrors` if it doesn't
+    parse, or `testhelpers.SemanticErrors` if it has semantic errors.
+    """
+    tree = parse(source, 'script', NimbleLexer, NimbleParser)
+    return Compiler(check_script(tree)).compile_script(tree)
+
+
+def decode_string(literal):
+    """Returns the value of a Nimble STRING literal, given its text including the quotes."""
+    text = literal[1:-1]
+    if '\\' not in text:
+        return text
+    chars = []
+    i = 0
+    while i < len(text):
+        if text[i] == '\\':
+            i += 1
+            chars.append(_ESCAPES[text[i]])
+        else:
+            chars.append(text[i])
+        i += 1
+    return ''.join(chars)
+
+
+# ---------------------------------------------------------------------------------
+# Run-time support
+
+
+def _sequence(statements):
+    if not statements:
+        return _no_op
+    if len(statements) == 1:
+        return statements[0]
+    if len(statements) == 2:
+        first, second = statements
+
+        def run_two(frame):
+            return first(frame) or second(frame)
+        return run_two
+    statements = tuple(statements)
+
+    def run_all(frame):
+        for statement in statements:
+            result = statement(frame)
+            if result:
+                return result
+    return run_all
+
+
+def _constant_type(value):
+    return PrimitiveType.Bool if isinstance(value, bool) else PrimitiveType.Int
+
+
+def _no_op(frame):
+    return None
+
+
+def _return_none(frame):
+    return True
+
+
+# Returned by a statement closure that has made a self tail call
+_TAIL_CALL = 'tail call'
+
+
+def _restartable(body):
+    """Runs a function body again each time it ends with a self tail call."""
+    def run(frame):
+        while body(frame) is _TAIL_CALL:
+            pass
+    return run
+
+
+def _tail_call(function, arguments):
+    """
+    Sets the running frame up as a fresh call's would be, reusing it rather than
+    allocating another: arguments first, then variables at their initial values.
+    """
+    if len(arguments) == 1:
+        argument, = arguments
+
+        def tail_call(frame):
+            value = argument(frame)
+            frame[:] = function.frame
+            frame[0] = value
+            return _TAIL_CALL
+        return tail_call
+    count = len(arguments)
+    arguments = tuple(arguments)
+
+    def tail_call(frame):
+        values = [argument(frame) for argument in arguments]
+        frame[:] = function.frame
+        frame[:count] = values
+        return _TAIL_CALL
+    return tail_call
+
+
+def _call(function, arguments):
+    if not arguments:
+        def call(frame):
+            callee = function.frame.copy()
+            function.body(callee)
+            return callee[-1]
+    elif len(arguments) == 1:
+        argument, = arguments
+
+        def call(frame):
+            callee = function.frame.copy()
+            callee[0] = argument(frame)
+            function.body(callee)
+            return callee[-1]
+    else:
+        arguments = tuple(enumerate(arguments))
+
+        def call(frame):
+            callee = function.frame.copy()
+            for i, argument in arguments:
+                callee[i] = argument(frame)
+            function.body(callee)
+            return callee[-1]
+    return call
+
+
+# Marks a result missing from a memo, where None is a valid result
+_MISSING = object()
+
+
+def _memoized_call(function, arguments, memo_size):
+    """Like `_call`, but looks the arguments up in the function's memo first."""
+    memo = function.memo
+    arguments = tuple(arguments)
+    single = len(arguments) == 1
+
+    def call(frame):
+        values = [argument(frame) for argument in arguments]
+        key = values[0] if single else tuple(values)
+        result = memo.get(key, _MISSING)
+        if result is not _MISSING:
+            memo.move_to_end(key)
+            return result
+        callee = function.frame.copy()
+        callee[:len(values)] = values
+        function.body(callee)
+        result = memo[key] = callee[-1]
+        if len(memo) > memo_size:
+            memo.popitem(last=False)
+        return result
+    return call
+
+
+def divide(a, b):
+    """Nimble integer division: truncates towards zero, and fails on a zero divisor."""
+    if b == 0:
+        raise NimbleRuntimeError('division by zero')
+    quotient = abs(a) // abs(b)
+    return -quotient if (a < 0) != (b < 0) else quotient
+
+
+INT_MIN, INT_MAX = -1 << 63, (1 << 63) - 1
+
+
+def wrap_int(value):
+    """Wraps an integer into the 64-bit two's complement range."""
+    return ((value - INT_MIN) & _INT_MASK) + INT_MIN
+
+
+_INT_MASK = 0xFFFF_FFFF_FFFF_FFFF
+
+
+def _overflow(value):
+    raise NimbleRuntimeError(f'Int overflow: {value} is out of range')
+
+
+# The Int arithmetic operators; with `overflow` set, the compiled closures bound their results
+_INT_OPERATIONS = {'*': operator.mul, '/': divide, '+': operator.add, '-': operator.sub}
+
+# Concatenations shorter than this are copied rather than made into a Rope
+ROPE_THRESHOLD = 64
+
+
+class Rope:
+    """
+    A `String` value made by concatenation. Its pieces are kept in a list, only joined
+    when its text is needed, e.g. to print it, and the text is then kept.
+
+    Adding to a rope appends to its list in place, unless a rope made from the same one
+    already has, so building a string by repeatedly adding to it takes linear time. The
+    ropes sharing a list each see only their own first `count` pieces.
+
+    :param pieces: The strings making up the text, in order; the rope takes ownership
+    :param length: The length of the text
+    """
+    __slots__ = ('pieces', 'count', 'length', 'text')
+
+    def __init__(self, pieces, length):
+        self.pieces = pieces
+        self.count = len(pieces)
+        self.length = length
+        self.text = None
+
+    def __str__(self):
+        if self.text is None:
+            self.text = ''.join(self.pieces[:self.count])
+            # Later additions start a list of their own rather than copy the pieces
+            self.pieces, self.count = [self.text], 1
+        return self.text
+
+    def __len__(self):
+        return self.length
+
+    def __add__(self, other):
+        pieces = self.pieces
+        if len(pieces) != self.count:
+            pieces = pieces[:self.count]
+        pieces.append(str(other))
+        return Rope(pieces, self.length + len(other))
+
+    def __radd__(self, other):
+        return Rope([other, str(self)], len(other) + self.length)
+
+    def __eq__(self, other):
+        if isinstance(other, (str, Rope)):
+            return str(self) == str(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __repr__(self):
+        return f'Rope({str(self)!r})'
+
+
+def concatenate(a, b):
+    """Adds two `String` values, either of which may be a `Rope`."""
+    if type(a) is Rope:
+        return a + b
+    if len(a) + len(b) < ROPE_THRESHOLD:
+        return a + str(b)
+    return Rope([a, str(b)], len(a) + len(b))
+
+
+_COMPARISONS = {'<': operator.lt, '<=': operator.le, '==': operator.eq}
+
+
+# ---------------------------------------------------------------------------------
+# Benchmarks
+
+BENCHMARK_LOOP = '''
+var i : Int = 0
+var total : Int = 0
+while i < 1000000 {
+    total = total + i * 2 - i / 3
+    i = i + 1
+}
+print total
+'''
+
+BENCHMARK_RECURSION = '''
+func fib(n : Int) -> Int {
+    if n < 2 { return n }
+    return fib(n - 1) + fib(n - 2)
+}
+print fib(24)
+'''
+
+
+def benchmark(repeat=3):
+    """Times compiling and running the benchmark scripts; returns {name: (compile s, best run s)}."""
+    results = {}
+    for name, source in [('arithmetic loop', BENCHMARK_LOOP), ('recursive calls', BENCHMARK_RECURSION)]:
+        tree = parse(source, 'script', NimbleLexer, NimbleParser)
+        type_of = check_script(tree)
+        start = time.perf_counter()
+        script = Compiler(type_of).compile_script(tree)
+        compile_time = time.perf_counter() - start
+        run_times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            script.run(lambda text: None)
+            run_times.append(time.perf_counter() - start)
+        results[name] = compile_time, min(run_times)
+    return results
+
+
+BENCHMARK_PRINT = '''
+var i : Int = 0
+while i < 200000 {
+    print i
+    print i < 100000
+    i = i + 1
+}
+'''
+
+
+def benchmark_output(repeat=3):
+    """
+    Times running the print loop benchmark with output to a temporary file, line-buffered
+    like `sys.stdout` at a terminal, once writing every print and once buffered; returns
+    {name: best throughput in bytes/s}.
+    """
+    import os
+    import tempfile
+    script = compile_source(BENCHMARK_PRINT)
+    results = {}
+    descriptor, path = tempfile.mkstemp(suffix='.txt')
+    os.close(descriptor)
+    try:
+        for name, capacity in [('unbuffered', 0), ('buffered', DEFAULT_CAPACITY)]:
+            best = 0
+            for _ in range(repeat):
+                with open(path, 'w', buffering=1, encoding='utf-8') as file:
+                    start = time.perf_counter()
+                    script.run(file.write, capacity)
+                    file.flush()
+                    elapsed = time.perf_counter() - start
+                best = max(best, os.path.getsize(path) / elapsed)
+            results[name] = best
+    finally:
+        os.remove(path)
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Run a Nimble script')
+    arg_parser.add_argument('script', nargs='?', help='path of the Nimble script to run')
+    arg_parser.add_argument('--benchmark', action='store_true', help='time the built-in benchmarks')
+    arg_parser.add_argument('--tail-calls', action='store_true', help='turn self tail calls into jumps')
+    arg_parser.add_argument('--memoize', action='store_true', help='memoize calls of pure functions')
+    arg_parser.add_argument('--overflow', choices=['wrap', 'trap'], help='make Int 64 bits, wrapping or trapping')
+    args = arg_parser.parse_args()
+    if args.benchmark:
+        for name, (compile_time, run_time) in benchmark().items():
+            print(f'{name:16} compile {compile_time * 1000:8.3f} ms   run {run_time * 1000:10.3f} ms')
+        for name, throughput in benchmark_output().items():
+            print(f'print loop, {name:10} {throughput / 1e6:8.2f} MB/s')
+    elif args.script:
+        tree = parse(args.script, 'script', NimbleLexer, NimbleParser, from_file=True)
+        try:
+            type_of = check_script(tree)
+        except SemanticErrors as e:
+            sys.exit(f'{args.script} was not run, as it has semantic errors:\n{e.error_log}')
+        # Imported here, as nimbleoptimizer itself depends on this module
+        from nimbleoptimizer import pure_functions
+        memoize = pure_functions(tree) if args.memoize else ()
+        Compiler(type_of, tail_calls=args.tail_calls, memoize=memoize,
+                 overflow=args.overflow).compile_script(tree).run()
+    else:
+        arg_parser.error('a script path or --benchmark is required')
+
+
+if __name__ == '__main__':
+    main()
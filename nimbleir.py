@@ -0,0 +1,1137 @@
+"""
+A register-based intermediate representation for Nimble, in SSA form, with
+optimizations over it and virtual machines to run it.
+
+`lower_script` turns each `funcDef` and the `main` of a parse tree into an
+`IRFunction`: a control flow graph of `Block`s, one per straight-line run of
+code, with `while` and `if` becoming branches between blocks. Every
+`Instruction` defines a new value, and no value is ever redefined; where a
+variable has different values on different incoming edges of a block, a
+`Phi` in the block selects the value according to the edge taken. SSA form
+is built directly during lowering, with the algorithm of Braun et al.,
+"Simple and Efficient Construction of Static Single Assignment Form" (2013).
+
+Lowering is deliberately naive: each assignment emits a `copy`. `optimize`
+then runs, to a fixed point:
+
+- unreachable block removal;
+- copy propagation, which also removes phis whose operands are all the same
+  value (or the phi itself);
+- common subexpression elimination, which replaces a pure instruction by an
+  identical one in the same block or a dominating block;
+- dead code elimination of pure instructions whose values are never used.
+
+`RegisterVM` runs optimized IR: phis become register moves on the incoming
+edges, constants are preloaded into each frame's registers, and each
+instruction reads and writes registers directly. `StackVM` runs the naive
+stack bytecode `StackCompiler` generates straight from the parse tree, and is
+the baseline the benchmark compares against. Both have the run-time
+semantics of `nimbleinterpreter`.
+
+As with the interpreter, only scripts that pass semantic analysis are
+lowered or compiled: `Lowering`, `lower_script` and `StackCompiler` require
+the `type_of` map of an error-free analysis, and the command line and
+benchmarks run `testhelpers.check_script` first, refusing a script with
+errors.
+
+Run with `python nimbleir.py SCRIPT [--dump]`, or
+`python nimbleir.py --benchmark` to compare the two machines.
+
+Version: 2026-10-19
+"""
+
+import argparse
+import sys
+import time
+
+from generic_parser import parse
+from nimble import NimbleLexer, NimbleParser
+from nimbleinterpreter import BENCHMARK_LOOP, BENCHMARK_RECURSION, CompileError, decode_string, divide
+from nimbleoutput import BufferedOutput
+from symboltable import FunctionType, PrimitiveType, Scope
+from testhelpers import SemanticErrors, check_script
+
+_TYPES = {'Int': PrimitiveType.Int, 'Bool': PrimitiveType.Bool, 'String': PrimitiveType.String}
+_INITIAL_VALUES = {PrimitiveType.Int: 0, PrimitiveType.Bool: False, PrimitiveType.String: ''}
+_BINARY_OPS = {'*': 'mul', '/': 'div', '+': 'add', '-': 'sub', '<': 'lt', '<=': 'le', '==': 'eq'}
+
+# Instructions without side effects, which may be shared or removed
+_PURE_OPS = {'const', 'copy', 'neg', 'not', 'add', 'sub', 'mul', 'div', 'lt', 'le', 'eq'}
+
+# Pure instructions that must still execute when unused, since they can fail
+_FALLIBLE_OPS = {'div'}
+
+_COMMUTATIVE_OPS = {'add', 'mul', 'eq'}
+
+
+# ---------------------------------------------------------------------------------
+# The IR
+
+
+class Value:
+    """Something that defines an SSA value: an `Instruction` or a `Phi`."""
+    __slots__ = ()
+
+
+class Instruction(Value):
+    """
+    An operation on the values in `args`. `value` holds the operation's literal
+    operand: the constant for `const`, the parameter number for `param`, the
+    function name for `call`, and the value's type for `print`.
+    """
+    __slots__ = ('op', 'args', 'value', 'block')
+
+    def __init__(self, op, args=(), value=None):
+        self.op = op
+        self.args = list(args)
+        self.value = value
+        self.block = None
+
+
+class Phi(Value):
+    """Selects `args[i]` when control arrives from `block.predecessors[i]`."""
+    __slots__ = ('args', 'block', 'variable')
+
+    def __init__(self, block, variable):
+        self.args = []
+        self.block = block
+        self.variable = variable
+
+
+class Terminator:
+    """Ends a block: `jump` to `targets[0]`, `branch` on `args[0]` to `targets[0]` or
+    `targets[1]`, or `return` `args[0]` if there is one."""
+    __slots__ = ('op', 'args', 'targets')
+
+    def __init__(self, op, args=(), targets=()):
+        self.op = op
+        self.args = list(args)
+        self.targets = list(targets)
+
+
+class Block:
+    __slots__ = ('predecessors', 'phis', 'instructions', 'terminator')
+
+    def __init__(self):
+        self.predecessors = []
+        self.phis = []
+        self.instructions = []
+        self.terminator = None
+
+
+class IRFunction:
+    """A function (or the main, named `$main`) as a control flow graph; `blocks[0]` is the entry."""
+
+    def __init__(self, name, parameter_count, blocks):
+        self.name = name
+        self.parameter_count = parameter_count
+        self.blocks = blocks
+
+    def instruction_count(self):
+        return sum(len(b.phis) + len(b.instructions) + 1 for b in self.blocks)
+
+    def __str__(self):
+        numbers = {}
+
+        def name(value):
+            return f'v{numbers.setdefault(value, len(numbers))}'
+
+        labels = {block: f'b{i}' for i, block in enumerate(self.blocks)}
+        lines = [f'{self.name}({self.parameter_count} parameters):']
+        for block in self.blocks:
+            lines.append(f'{labels[block]}:')
+            for phi in block.phis:
+                sources = ', '.join(f'{name(a)} from {labels[p]}' for a, p in zip(phi.args, block.predecessors))
+                lines.append(f'  {name(phi)} = phi {sources}')
+            for instruction in block.instructions:
+                operands = [repr(instruction.value)] if instruction.value is not None else []
+                operands += [name(a) for a in instruction.args]
+                lines.append(f'  {name(instruction)} = {instruction.op} {", ".join(operands)}')
+            terminator = block.terminator
+            operands = [name(a) for a in terminator.args] + [labels[t] for t in terminator.targets]
+            lines.append(f'  {terminator.op} {", ".join(operands)}')
+        return '\n'.join(lines)
+
+
+class IRProgram:
+    """The functions of a lowered script, by name, including `$main`."""
+
+    def __init__(self, functions):
+        self.functions = functions
+
+    def instruction_count(self):
+        return sum(f.instruction_count() for f in self.functions.values())
+
+    def __str__(self):
+        return '\n\n'.join(str(f) for f in self.functions.values())
+
+
+# ---------------------------------------------------------------------------------
+# Lowering
+
+
+class Lowering:
+    """
+    Lowers a Nimble parse tree into SSA form IR. Each `lower...` method lowers one
+    kind of context, named as in `NimbleListener`; expression methods return the
+    expression's value and type.
+
+    :param type_of: The node types inferred by semantic analysis of the script, which
+        must have found no errors
+    """
+
+    def __init__(self, type_of):
+        self.type_of = type_of
+        self.global_scope = Scope('$global', None, None)
+        self.__scope = None
+        self.__block = None
+        self.__blocks = []
+        self.__definitions = {}
+        self.__sealed = set()
+        self.__incomplete = {}
+
+    def lower_script(self, ctx: NimbleParser.ScriptContext) -> IRProgram:
+        for func_def in ctx.funcDef():
+            name = func_def.ID().getText()
+            if self.global_scope.resolve_locally(name) is not None:
+                raise CompileError(f'function {name} is defined more than once')
+            parameter_types = [_TYPES[p.TYPE().getText()] for p in func_def.parameterDef()]
+            return_type = _TYPES[func_def.TYPE().getText()] if func_def.TYPE() else PrimitiveType.Void
+            self.global_scope.define(name, FunctionType(parameter_types, return_type))
+        functions = {}
+        for func_def in ctx.funcDef():
+            functions[func_def.ID().getText()] = self.lowerFuncDef(func_def)
+        functions['$main'] = self.lowerMain(ctx.main())
+        return IRProgram(functions)
+
+    # ---------------------------------------------------------------------------------
+    # Program structure
+
+    def lowerFuncDef(self, ctx: NimbleParser.FuncDefContext):
+        name = ctx.ID().getText()
+        symbol = self.global_scope.resolve_locally(name)
+        scope = self.global_scope.create_child_scope(name, symbol.type.return_type)
+        for parameter in ctx.parameterDef():
+            parameter_name = parameter.ID().getText()
+            if scope.resolve_locally(parameter_name) is not None:
+                raise CompileError(f'parameter {parameter_name} of {name} is defined more than once')
+            scope.define(parameter_name, _TYPES[parameter.TYPE().getText()], is_param=True)
+        return self.__lower_unit(name, scope, ctx.body())
+
+    def lowerMain(self, ctx: NimbleParser.MainContext):
+        scope = self.global_scope.create_child_scope('$main', PrimitiveType.Void)
+        return self.__lower_unit('$main', scope, ctx.body())
+
+    def __lower_unit(self, name, scope, body):
+        self.__scope = scope
+        self.__definitions = {}
+        self.__sealed = set()
+        self.__incomplete = {}
+        self.__blocks = blocks = []
+        self.__block = self.__new_block(sealed=True)
+        for parameter in scope.parameters():
+            self.__write(parameter.name, self.__emit('param', value=parameter.index))
+        for var_dec in body.varBlock().varDec():
+            self.lowerVarDec(var_dec)
+        self.lowerBlock(body.block())
+        if self.__block.terminator is None:
+            self.__terminate(Terminator('return'))
+        return IRFunction(name, len(scope.parameters()), blocks)
+
+    def lowerVarDec(self, ctx: NimbleParser.VarDecContext):
+        name = ctx.ID().getText()
+        if self.__scope.resolve_locally(name) is not None:
+            raise CompileError(f'line {ctx.start.line}: {name} is defined more than once')
+        declared_type = _TYPES[ctx.TYPE().getText()]
+        if ctx.expr() is not None:
+            value = self.__emit('copy', [self.lower_expr(ctx.expr())[0]])
+        else:
+            value = self.__emit('const', value=_INITIAL_VALUES[declared_type])
+        self.__scope.define(name, declared_type)
+        self.__write(name, value)
+
+    def lowerBlock(self, ctx: NimbleParser.BlockContext):
+        for statement in ctx.statement():
+            getattr(self, 'lower' + type(statement).__name__[:-len('Context')])(statement)
+
+    # ---------------------------------------------------------------------------------
+    # Statements
+
+    def lowerAssignment(self, ctx: NimbleParser.AssignmentContext):
+        name = self.__variable(ctx.ID())
+        self.__write(name, self.__emit('copy', [self.lower_expr(ctx.expr())[0]]))
+
+    def lowerWhile(self, ctx: NimbleParser.WhileContext):
+        header = self.__new_block(sealed=False)
+        self.__jump(header)
+        self.__block = header
+        condition = self.lower_expr(ctx.expr())[0]
+        body, exit_block = self.__new_block(sealed=False), self.__new_block(sealed=False)
+        self.__branch(condition, body, exit_block)
+        self.__seal(body)
+        self.__block = body
+        self.lowerBlock(ctx.block())
+        self.__jump(header)
+        self.__seal(header)
+        self.__seal(exit_block)
+        self.__block = exit_block
+
+    def lowerIf(self, ctx: NimbleParser.IfContext):
+        condition = self.lower_expr(ctx.expr())[0]
+        then_block, join = self.__new_block(sealed=False), self.__new_block(sealed=False)
+        else_block = self.__new_block(sealed=False) if ctx.block(1) is not None else join
+        self.__branch(condition, then_block, else_block)
+        self.__seal(then_block)
+        self.__block = then_block
+        self.lowerBlock(ctx.block(0))
+        self.__jump(join)
+        if else_block is not join:
+            self.__seal(else_block)
+            self.__block = else_block
+            self.lowerBlock(ctx.block(1))
+            self.__jump(join)
+        self.__seal(join)
+        self.__block = join
+
+    def lowerPrint(self, ctx: NimbleParser.PrintContext):
+        value, value_type = self.lower_expr(ctx.expr())
+        self.__emit('print', [value], value=value_type)
+
+    def lowerReturn(self, ctx: NimbleParser.ReturnContext):
+        args = [self.lower_expr(ctx.expr())[0]] if ctx.expr() is not None else []
+        self.__terminate(Terminator('return', args))
+        # Anything after a return is lowered into a block that can't be reached
+        self.__block = self.__new_block(sealed=True)
+
+    def lowerFuncCallStmt(self, ctx: NimbleParser.FuncCallStmtContext):
+        self.lowerFuncCall(ctx.funcCall())
+
+    # ---------------------------------------------------------------------------------
+    # Expressions
+
+    def lower_expr(self, ctx):
+        value, inferred_type = getattr(self, 'lower' + type(ctx).__name__[:-len('Context')])(ctx)
+        return value, self.type_of.get(ctx, inferred_type)
+
+    def lowerParens(self, ctx: NimbleParser.ParensContext):
+        return self.lower_expr(ctx.expr())
+
+    def lowerNeg(self, ctx: NimbleParser.NegContext):
+        operand = self.lower_expr(ctx.expr())[0]
+        if ctx.op.text == '-':
+            return self.__emit('neg', [operand]), PrimitiveType.Int
+        return self.__emit('not', [operand]), PrimitiveType.Bool
+
+    def lowerMulDiv(self, ctx: NimbleParser.MulDivContext):
+        return self.__binary(ctx), PrimitiveType.Int
+
+    def lowerAddSub(self, ctx: NimbleParser.AddSubContext):
+        return self.__binary(ctx), PrimitiveType.Int
+
+    def lowerCompare(self, ctx: NimbleParser.CompareContext):
+        return self.__binary(ctx), PrimitiveType.Bool
+
+    def lowerFuncCallExpr(self, ctx: NimbleParser.FuncCallExprContext):
+        return self.lowerFuncCall(ctx.funcCall())
+
+    def lowerVariable(self, ctx: NimbleParser.VariableContext):
+        name = self.__variable(ctx.ID())
+        return self.__read(name, self.__block), self.__scope.resolve_locally(name).type
+
+    def lowerStringLiteral(self, ctx: NimbleParser.StringLiteralContext):
+        return self.__emit('const', value=decode_string(ctx.getText())), PrimitiveType.String
+
+    def lowerIntLiteral(self, ctx: NimbleParser.IntLiteralContext):
+        return self.__emit('const', value=int(ctx.getText())), PrimitiveType.Int
+
+    def lowerBoolLiteral(self, ctx: NimbleParser.BoolLiteralContext):
+        return self.__emit('const', value=ctx.getText() == 'true'), PrimitiveType.Bool
+
+    def lowerFuncCall(self, ctx: NimbleParser.FuncCallContext):
+        name = ctx.ID().getText()
+        symbol = self.global_scope.resolve_locally(name)
+        if symbol is None:
+            raise CompileError(f'line {ctx.start.line}: {name} is not a defined function')
+        arguments = [self.lower_expr(e)[0] for e in ctx.expr()]
+        if len(arguments) != len(symbol.type.parameter_types):
+            raise CompileError(f'line {ctx.start.line}: {name} takes '
+                               f'{len(symbol.type.parameter_types)} arguments, not {len(arguments)}')
+        return self.__emit('call', arguments, value=name), symbol.type.return_type
+
+    # ---------------------------------------------------------------------------------
+    # Blocks and SSA construction
+
+    def __new_block(self, sealed):
+        block = Block()
+        if sealed:
+            self.__sealed.add(block)
+        self.__blocks.append(block)
+        return block
+
+    def __emit(self, op, args=(), value=None):
+        instruction = Instruction(op, args, value)
+        instruction.block = self.__block
+        self.__block.instructions.append(instruction)
+        return instruction
+
+    def __terminate(self, terminator):
+        self.__block.terminator = terminator
+        for target in terminator.targets:
+            target.predecessors.append(self.__block)
+
+    def __jump(self, target):
+        self.__terminate(Terminator('jump', targets=[target]))
+
+    def __branch(self, condition, if_true, if_false):
+        self.__terminate(Terminator('branch', [condition], [if_true, if_false]))
+
+    def __variable(self, id_node):
+        name = id_node.getText()
+        if self.__scope.resolve_locally(name) is None:
+            raise CompileError(f'line {id_node.symbol.line}: {name} is not a defined variable')
+        return name
+
+    def __binary(self, ctx):
+        left = self.lower_expr(ctx.expr(0))[0]
+        right = self.lower_expr(ctx.expr(1))[0]
+        return self.__emit(_BINARY_OPS[ctx.op.text], [left, right])
+
+    def __write(self, variable, value):
+        self.__definitions.setdefault(variable, {})[self.__block] = value
+
+    def __write_in(self, variable, block, value):
+        self.__definitions.setdefault(variable, {})[block] = value
+
+    def __read(self, variable, block):
+        value = self.__definitions.get(variable, {}).get(block)
+        if value is not None:
+            return value
+        if block not in self.__sealed:
+            # Not all predecessors are known yet; the phi is completed on sealing
+            value = Phi(block, variable)
+            block.phis.append(value)
+            self.__incomplete.setdefault(block, []).append(value)
+        elif len(block.predecessors) == 1:
+            value = self.__read(variable, block.predecessors[0])
+        elif not block.predecessors:
+            # Only in unreachable code, which is removed by `optimize`
+            value = Instruction('const', value=_INITIAL_VALUES[self.__scope.resolve_locally(variable).type])
+            value.block = block
+            block.instructions.insert(0, value)
+        else:
+            value = Phi(block, variable)
+            block.phis.append(value)
+            # Written before the operands are read, so that loops terminate on the phi
+            self.__write_in(variable, block, value)
+            self.__add_phi_operands(value)
+        self.__write_in(variable, block, value)
+        return value
+
+    def __add_phi_operands(self, phi):
+        for predecessor in phi.block.predecessors:
+            phi.args.append(self.__read(phi.variable, predecessor))
+
+    def __seal(self, block):
+        for phi in self.__incomplete.pop(block, []):
+            self.__add_phi_operands(phi)
+        self.__sealed.add(block)
+
+
+def lower_script(tree, type_of) -> IRProgram:
+    """Lowers a parse tree to IR, given `type_of` from an analysis that found no errors."""
+    return Lowering(type_of).lower_script(tree)
+
+
+# ---------------------------------------------------------------------------------
+# Optimization
+
+
+def optimize(program: IRProgram):
+    """
+    Optimizes every function of the program in place, returning the number of
+    instructions (including phis and terminators) before and after.
+    """
+    before = program.instruction_count()
+    for function in program.functions.values():
+        optimize_function(function)
+    return before, program.instruction_count()
+
+
+def optimize_function(function: IRFunction):
+    remove_unreachable_blocks(function)
+    while True:
+        changed = propagate_copies(function)
+        changed = eliminate_common_subexpressions(function) or changed
+        changed = eliminate_dead_code(function) or changed
+        if not changed:
+            return
+
+
+def remove_unreachable_blocks(function: IRFunction):
+    reachable = set()
+    stack = [function.blocks[0]]
+    while stack:
+        block = stack.pop()
+        if block not in reachable:
+            reachable.add(block)
+            stack.extend(block.terminator.targets)
+    function.blocks = [b for b in function.blocks if b in reachable]
+    for block in function.blocks:
+        kept = [i for i, p in enumerate(block.predecessors) if p in reachable]
+        if len(kept) != len(block.predecessors):
+            block.predecessors = [block.predecessors[i] for i in kept]
+            for phi in block.phis:
+                phi.args = [phi.args[i] for i in kept]
+
+
+def propagate_copies(function: IRFunction):
+    """Replaces each copy by its operand, and each trivial phi by its one operand."""
+    forward = {}
+    changed = True
+    while changed:
+        changed = False
+        for block in function.blocks:
+            for phi in block.phis:
+                if phi in forward:
+                    continue
+                operands = {_resolve(forward, a) for a in phi.args} - {phi}
+                if len(operands) == 1:
+                    forward[phi] = operands.pop()
+                    changed = True
+            for instruction in block.instructions:
+                if instruction.op == 'copy' and instruction not in forward:
+                    forward[instruction] = instruction.args[0]
+                    changed = True
+    if not forward:
+        return False
+    for block in function.blocks:
+        block.phis = [p for p in block.phis if p not in forward]
+        block.instructions = [i for i in block.instructions if i not in forward]
+    _rewrite(function, forward)
+    return True
+
+
+def eliminate_common_subexpressions(function: IRFunction):
+    """
+    Replaces each pure instruction by an identical one that dominates it, and each phi
+    by an identical phi in the same block.
+    """
+    children = _dominator_tree(function)
+    forward = {}
+    available = {}
+    # Depth-first over the dominator tree; keys added in a block are dropped on leaving it
+    stack = [(function.blocks[0], False)]
+    added = []
+    while stack:
+        block, leaving = stack.pop()
+        if leaving:
+            for key in added.pop():
+                del available[key]
+            continue
+        keys = []
+        for phi in block.phis:
+            key = ('phi', id(block), tuple(id(_resolve(forward, a)) for a in phi.args))
+            if key in available:
+                forward[phi] = available[key]
+            else:
+                available[key] = phi
+                keys.append(key)
+        for instruction in block.instructions:
+            if instruction.op not in _PURE_OPS:
+                continue
+            key = _expression_key(instruction, forward)
+            if key in available:
+                forward[instruction] = available[key]
+            else:
+                available[key] = instruction
+                keys.append(key)
+        added.append(keys)
+        stack.append((block, True))
+        stack.extend((child, False) for child in children.get(block, ()))
+    if not forward:
+        return False
+    for block in function.blocks:
+        block.phis = [p for p in block.phis if p not in forward]
+        block.instructions = [i for i in block.instructions if i not in forward]
+    _rewrite(function, forward)
+    return True
+
+
+def eliminate_dead_code(function: IRFunction):
+    """Removes phis and pure, infallible instructions whose values are never used."""
+    changed = False
+    while True:
+        used = set()
+        for block in function.blocks:
+            for phi in block.phis:
+                used.update(phi.args)
+            for instruction in block.instructions:
+                used.update(instruction.args)
+            used.update(block.terminator.args)
+        removed = False
+        for block in function.blocks:
+            phis = [p for p in block.phis if p in used]
+            instructions = [i for i in block.instructions
+                            if i in used or i.op not in _PURE_OPS or i.op in _FALLIBLE_OPS]
+            if len(phis) != len(block.phis) or len(instructions) != len(block.instructions):
+                block.phis, block.instructions = phis, instructions
+                removed = True
+        if not removed:
+            return changed
+        changed = True
+
+
+def _resolve(forward, value):
+    while value in forward:
+        value = forward[value]
+    return value
+
+
+def _rewrite(function, forward):
+    for block in function.blocks:
+        for phi in block.phis:
+            phi.args = [_resolve(forward, a) for a in phi.args]
+        for instruction in block.instructions:
+            instruction.args = [_resolve(forward, a) for a in instruction.args]
+        block.terminator.args = [_resolve(forward, a) for a in block.terminator.args]
+
+
+def _expression_key(instruction, forward):
+    if instruction.op == 'const':
+        # 1 == True in Python, so the type is part of the key
+        return 'const', type(instruction.value), instruction.value
+    operands = [id(_resolve(forward, a)) for a in instruction.args]
+    if instruction.op in _COMMUTATIVE_OPS:
+        operands.sort()
+    return (instruction.op, *operands)
+
+
+def _reverse_postorder(function):
+    order = []
+    visited = set()
+    stack = [(function.blocks[0], iter(function.blocks[0].terminator.targets))]
+    visited.add(function.blocks[0])
+    while stack:
+        block, successors = stack[-1]
+        for successor in successors:
+            if successor not in visited:
+                visited.add(successor)
+                stack.append((successor, iter(successor.terminator.targets)))
+                break
+        else:
+            order.append(block)
+            stack.pop()
+    order.reverse()
+    return order
+
+
+def _dominator_tree(function):
+    """
+    Returns {block: blocks it immediately dominates}, using the algorithm of Cooper,
+    Harvey and Kennedy, "A Simple, Fast Dominance Algorithm" (2001).
+    """
+    order = _reverse_postorder(function)
+    position = {block: i for i, block in enumerate(order)}
+    entry = order[0]
+    idom = {entry: entry}
+
+    def intersect(a, b):
+        while a is not b:
+            while position[a] > position[b]:
+                a = idom[a]
+            while position[b] > position[a]:
+                b = idom[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            processed = [p for p in block.predecessors if p in idom]
+            new_idom = processed[0]
+            for predecessor in processed[1:]:
+                new_idom = intersect(predecessor, new_idom)
+            if idom.get(block) is not new_idom:
+                idom[block] = new_idom
+                changed = True
+    children = {}
+    for block, dominator in idom.items():
+        if block is not entry:
+            children.setdefault(dominator, []).append(block)
+    return children
+
+
+# ---------------------------------------------------------------------------------
+# The register machine
+
+# Register machine opcodes; every instruction is a tuple (opcode, a, b, c)
+(R_MOVE, R_ADD, R_SUB, R_MUL, R_DIV, R_LT, R_LE, R_EQ, R_NEG, R_NOT, R_JUMP, R_JUMP_IF_FALSE,
+ R_CALL, R_PRINT, R_RETURN) = range(15)
+
+_REGISTER_OPS = {'add': R_ADD, 'sub': R_SUB, 'mul': R_MUL, 'div': R_DIV, 'lt': R_LT, 'le': R_LE,
+                 'eq': R_EQ, 'neg': R_NEG, 'not': R_NOT}
+
+
+class RegisterCode:
+    """A function compiled for the `RegisterVM`."""
+    __slots__ = ('name', 'parameter_count', 'registers', 'code')
+
+    def __init__(self, name, parameter_count):
+        self.name = name
+        self.parameter_count = parameter_count
+        # The initial register contents, with every constant preloaded
+        self.registers = None
+        self.code = None
+
+
+class RegisterVM:
+    """
+    Runs an `IRProgram`, normally one that has been `optimize`d.
+
+    :param program: The program to run
+    """
+
+    def __init__(self, program: IRProgram):
+        self.functions = {name: RegisterCode(name, f.parameter_count) for name, f in program.functions.items()}
+        for name, function in program.functions.items():
+            _generate_register_code(function, self.functions[name], self.functions)
+        self.write = sys.stdout.write
+
+    def run(self, write=None):
+        with BufferedOutput(write) as output:
+            self.write = output.write
+            self.execute(self.functions['$main'], [])
+
+    def execute(self, function, arguments):
+        registers = function.registers.copy()
+        registers[:len(arguments)] = arguments
+        code = function.code
+        pc = 0
+        while True:
+            op, a, b, c = code[pc]
+            pc += 1
+            if op == R_MOVE:
+                registers[a] = registers[b]
+            elif op == R_ADD:
+                registers[a] = registers[b] + registers[c]
+            elif op == R_JUMP_IF_FALSE:
+                if not registers[a]:
+                    pc = b
+            elif op == R_JUMP:
+                pc = a
+            elif op == R_LT:
+                registers[a] = registers[b] < registers[c]
+            elif op == R_SUB:
+                registers[a] = registers[b] - registers[c]
+            elif op == R_MUL:
+                registers[a] = registers[b] * registers[c]
+            elif op == R_LE:
+                registers[a] = registers[b] <= registers[c]
+            elif op == R_EQ:
+                registers[a] = registers[b] == registers[c]
+            elif op == R_DIV:
+                registers[a] = divide(registers[b], registers[c])
+            elif op == R_CALL:
+                registers[a] = self.execute(b, [registers[r] for r in c])
+            elif op == R_RETURN:
+                return registers[a] if a >= 0 else None
+            elif op == R_NEG:
+                registers[a] = -registers[b]
+            elif op == R_NOT:
+                registers[a] = not registers[b]
+            elif op == R_PRINT:
+                self.write(_format(registers[a], b))
+
+
+def _format(value, value_type):
+    if value_type == PrimitiveType.Bool:
+        return 'true\n' if value else 'false\n'
+    return f'{value}\n'
+
+
+def _generate_register_code(function, compiled, functions):
+    order = _reverse_postorder(function)
+    registers = {}
+    initial = [None] * function.parameter_count
+    for block in order:
+        for value in block.phis + block.instructions:
+            if isinstance(value, Instruction) and value.op == 'param':
+                registers[value] = value.value
+            else:
+                registers[value] = len(initial)
+                initial.append(value.value if isinstance(value, Instruction) and value.op == 'const' else None)
+    scratch = len(initial)
+    initial.append(None)
+
+    code = []
+    labels = {}
+    # (position in code, block or edge stub) of each jump target to fill in
+    fixups = []
+    stubs = []
+    for i, block in enumerate(order):
+        labels[block] = len(code)
+        for instruction in block.instructions:
+            op = instruction.op
+            if op in ('param', 'const'):
+                continue
+            args = [registers[a] for a in instruction.args]
+            if op == 'call':
+                code.append((R_CALL, registers[instruction], functions[instruction.value], tuple(args)))
+            elif op == 'print':
+                code.append((R_PRINT, args[0], instruction.value, None))
+            else:
+                code.append((_REGISTER_OPS[op], registers[instruction], *args, *[None] * (2 - len(args))))
+        terminator = block.terminator
+        following = order[i + 1] if i + 1 < len(order) else None
+        if terminator.op == 'return':
+            code.append((R_RETURN, registers[terminator.args[0]] if terminator.args else -1, None, None))
+            continue
+        edges = [(t, _edge_moves(block, t, registers, scratch)) for t in terminator.targets]
+        if terminator.op == 'branch':
+            (if_true, true_moves), (if_false, false_moves) = edges
+            fixups.append((len(code), 1, _edge_label(if_false, false_moves, stubs)))
+            code.append((R_JUMP_IF_FALSE, registers[terminator.args[0]], None, None))
+            edges = [(if_true, true_moves)]
+        (target, moves), = edges
+        code.extend((R_MOVE, d, s, None) for d, s in moves)
+        if target is not following:
+            fixups.append((len(code), 0, target))
+            code.append((R_JUMP, None, None, None))
+    for stub, target, moves in stubs:
+        labels[stub] = len(code)
+        code.extend((R_MOVE, d, s, None) for d, s in moves)
+        fixups.append((len(code), 0, target))
+        code.append((R_JUMP, None, None, None))
+    for position, field, label in fixups:
+        instruction = list(code[position])
+        instruction[1 + field] = labels[label]
+        code[position] = tuple(instruction)
+    compiled.registers = initial
+    compiled.code = code
+
+
+def _edge_label(target, moves, stubs):
+    """The label to jump to for an edge: the target itself, or a stub making the edge's moves."""
+    if not moves:
+        return target
+    stub = object()
+    stubs.append((stub, target, moves))
+    return stub
+
+
+def _edge_moves(predecessor, block, registers, scratch):
+    """The register moves implementing the block's phis on the edge from the predecessor, in order."""
+    index = block.predecessors.index(predecessor)
+    pending = [(registers[phi], registers[phi.args[index]]) for phi in block.phis]
+    pending = [(d, s) for d, s in pending if d != s]
+    moves = []
+    # The phis are a parallel copy: sequence it so no source is overwritten before it's read
+    while pending:
+        sources = {s for _, s in pending}
+        for i, (destination, source) in enumerate(pending):
+            if destination not in sources:
+                moves.append((destination, source))
+                del pending[i]
+                break
+        else:
+            # Every destination is still to be read: a cycle, broken through the scratch register
+            destination = pending[0][0]
+            moves.append((scratch, destination))
+            pending = [(d, scratch if s == destination else s) for d, s in pending]
+    return moves
+
+
+# ---------------------------------------------------------------------------------
+# The stack machine
+
+(S_LOAD, S_STORE, S_CONST, S_ADD, S_SUB, S_MUL, S_DIV, S_LT, S_LE, S_EQ, S_NEG, S_NOT, S_JUMP,
+ S_JUMP_IF_FALSE, S_CALL, S_PRINT, S_RETURN, S_POP) = range(18)
+
+_STACK_OPS = {'*': S_MUL, '/': S_DIV, '+': S_ADD, '-': S_SUB, '<': S_LT, '<=': S_LE, '==': S_EQ}
+
+
+class StackCode:
+    """A function compiled for the `StackVM`: `frame` holds parameters, then variables."""
+    __slots__ = ('name', 'parameter_count', 'frame', 'code')
+
+    def __init__(self, name, parameter_count):
+        self.name = name
+        self.parameter_count = parameter_count
+        self.frame = None
+        self.code = None
+
+
+class StackCompiler:
+    """
+    Compiles a Nimble parse tree straight to bytecode for the `StackVM`, with no
+    optimization: each instruction is a tuple (opcode, operand).
+
+    :param type_of: The node types inferred by semantic analysis of the script, which
+        must have found no errors
+    """
+
+    def __init__(self, type_of):
+        self.type_of = type_of
+        self.functions = {}
+        self.__return_types = {}
+        self.__code = None
+        self.__slots = None
+        self.__types = None
+
+    def compile_script(self, ctx: NimbleParser.ScriptContext):
+        for func_def in ctx.funcDef():
+            name = func_def.ID().getText()
+            self.functions[name] = StackCode(name, len(func_def.parameterDef()))
+            self.__return_types[name] = _TYPES[func_def.TYPE().getText()] if func_def.TYPE() else PrimitiveType.Void
+        self.functions['$main'] = StackCode('$main', 0)
+        for func_def in ctx.funcDef():
+            parameters = [(p.ID().getText(), _TYPES[p.TYPE().getText()]) for p in func_def.parameterDef()]
+            self.__compile_unit(self.functions[func_def.ID().getText()], parameters, func_def.body())
+        self.__compile_unit(self.functions['$main'], [], ctx.main().body())
+        return self.functions
+
+    def __compile_unit(self, function, parameters, body):
+        self.__code = []
+        self.__slots = {name: i for i, (name, _) in enumerate(parameters)}
+        self.__types = dict(parameters)
+        frame = [None] * len(parameters)
+        for var_dec in body.varBlock().varDec():
+            name, declared_type = var_dec.ID().getText(), _TYPES[var_dec.TYPE().getText()]
+            if var_dec.expr() is not None:
+                self.__expr(var_dec.expr())
+                self.__code.append((S_STORE, len(frame)))
+            self.__slots[name] = len(frame)
+            self.__types[name] = declared_type
+            frame.append(_INITIAL_VALUES[declared_type])
+        self.__block(body.block())
+        self.__code.append((S_CONST, None))
+        self.__code.append((S_RETURN, None))
+        function.frame = frame
+        function.code = self.__code
+
+    def __block(self, ctx):
+        code = self.__code
+        for statement in ctx.statement():
+            if isinstance(statement, NimbleParser.AssignmentContext):
+                self.__expr(statement.expr())
+                code.append((S_STORE, self.__slot(statement.ID())))
+            elif isinstance(statement, NimbleParser.WhileContext):
+                start = len(code)
+                self.__expr(statement.expr())
+                exit_jump = len(code)
+                code.append(None)
+                self.__block(statement.block())
+                code.append((S_JUMP, start))
+                code[exit_jump] = (S_JUMP_IF_FALSE, len(code))
+            elif isinstance(statement, NimbleParser.IfContext):
+                self.__expr(statement.expr())
+                else_jump = len(code)
+                code.append(None)
+                self.__block(statement.block(0))
+                if statement.block(1) is None:
+                    code[else_jump] = (S_JUMP_IF_FALSE, len(code))
+                else:
+                    end_jump = len(code)
+                    code.append(None)
+                    code[else_jump] = (S_JUMP_IF_FALSE, len(code))
+                    self.__block(statement.block(1))
+                    code[end_jump] = (S_JUMP, len(code))
+            elif isinstance(statement, NimbleParser.PrintContext):
+                code.append((S_PRINT, self.__expr(statement.expr())))
+            elif isinstance(statement, NimbleParser.ReturnContext):
+                if statement.expr() is not None:
+                    self.__expr(statement.expr())
+                else:
+                    code.append((S_CONST, None))
+                code.append((S_RETURN, None))
+            else:
+                self.__call(statement.funcCall())
+                code.append((S_POP, None))
+
+    def __expr(self, ctx):
+        """Compiles the expression, returning its type."""
+        code = self.__code
+        if isinstance(ctx, NimbleParser.ParensContext):
+            inferred = self.__expr(ctx.expr())
+        elif isinstance(ctx, NimbleParser.NegContext):
+            self.__expr(ctx.expr())
+            code.append((S_NEG if ctx.op.text == '-' else S_NOT, None))
+            inferred = PrimitiveType.Int if ctx.op.text == '-' else PrimitiveType.Bool
+        elif isinstance(ctx, (NimbleParser.MulDivContext, NimbleParser.AddSubContext, NimbleParser.CompareContext)):
+            self.__expr(ctx.expr(0))
+            self.__expr(ctx.expr(1))
+            code.append((_STACK_OPS[ctx.op.text], None))
+            inferred = PrimitiveType.Bool if isinstance(ctx, NimbleParser.CompareContext) else PrimitiveType.Int
+        elif isinstance(ctx, NimbleParser.FuncCallExprContext):
+            inferred = self.__call(ctx.funcCall())
+        elif isinstance(ctx, NimbleParser.VariableContext):
+            code.append((S_LOAD, self.__slot(ctx.ID())))
+            inferred = self.__types[ctx.ID().getText()]
+        elif isinstance(ctx, NimbleParser.StringLiteralContext):
+            code.append((S_CONST, decode_string(ctx.getText())))
+            inferred = PrimitiveType.String
+        elif isinstance(ctx, NimbleParser.IntLiteralContext):
+            code.append((S_CONST, int(ctx.getText())))
+            inferred = PrimitiveType.Int
+        else:
+            code.append((S_CONST, ctx.getText() == 'true'))
+            inferred = PrimitiveType.Bool
+        return self.type_of.get(ctx, inferred)
+
+    def __call(self, ctx):
+        name = ctx.ID().getText()
+        if name not in self.functions or name == '$main':
+            raise CompileError(f'line {ctx.start.line}: {name} is not a defined function')
+        for expr in ctx.expr():
+            self.__expr(expr)
+        self.__code.append((S_CALL, self.functions[name]))
+        return self.__return_types[name]
+
+    def __slot(self, id_node):
+        slot = self.__slots.get(id_node.getText())
+        if slot is None:
+            raise CompileError(f'line {id_node.symbol.line}: {id_node.getText()} is not a defined variable')
+        return slot
+
+
+class StackVM:
+    """Runs the bytecode produced by `StackCompiler`."""
+
+    def __init__(self, functions):
+        self.functions = functions
+        self.write = sys.stdout.write
+
+    def run(self, write=None):
+        with BufferedOutput(write) as output:
+            self.write = output.write
+            self.execute(self.functions['$main'], [])
+
+    def execute(self, function, arguments):
+        frame = function.frame.copy()
+        frame[:len(arguments)] = arguments
+        code = function.code
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+        while True:
+            op, operand = code[pc]
+            pc += 1
+            if op == S_LOAD:
+                push(frame[operand])
+            elif op == S_CONST:
+                push(operand)
+            elif op == S_STORE:
+                frame[operand] = pop()
+            elif op == S_ADD:
+                b = pop()
+                stack[-1] = stack[-1] + b
+            elif op == S_JUMP_IF_FALSE:
+                if not pop():
+                    pc = operand
+            elif op == S_JUMP:
+                pc = operand
+            elif op == S_LT:
+                b = pop()
+                stack[-1] = stack[-1] < b
+            elif op == S_SUB:
+                b = pop()
+                stack[-1] = stack[-1] - b
+            elif op == S_MUL:
+                b = pop()
+                stack[-1] = stack[-1] * b
+            elif op == S_LE:
+                b = pop()
+                stack[-1] = stack[-1] <= b
+            elif op == S_EQ:
+                b = pop()
+                stack[-1] = stack[-1] == b
+            elif op == S_DIV:
+                b = pop()
+                stack[-1] = divide(stack[-1], b)
+            elif op == S_CALL:
+                count = operand.parameter_count
+                arguments = stack[len(stack) - count:]
+                del stack[len(stack) - count:]
+                push(self.execute(operand, arguments))
+            elif op == S_RETURN:
+                return pop()
+            elif op == S_NEG:
+                stack[-1] = -stack[-1]
+            elif op == S_NOT:
+                stack[-1] = not stack[-1]
+            elif op == S_PRINT:
+                self.write(_format(pop(), operand))
+            elif op == S_POP:
+                pop()
+
+
+# ---------------------------------------------------------------------------------
+# Benchmarks
+
+BENCHMARK_COMMON_SUBEXPRESSIONS = '''
+var i : Int = 0
+var total : Int = 0
+while i < 300000 {
+    total = total + (i * i + 1) * (i * i + 1) - (i * i + 1)
+    i = i + 1
+}
+print total
+'''
+
+
+def benchmark(repeat=3):
+    """
+    Runs the benchmark scripts on both machines; returns {name: (stack VM s, register VM s,
+    IR instructions before optimization, after)}.
+    """
+    results = {}
+    for name, source in [('arithmetic loop', BENCHMARK_LOOP), ('recursive calls', BENCHMARK_RECURSION),
+                         ('common subexpressions', BENCHMARK_COMMON_SUBEXPRESSIONS)]:
+        tree = parse(source, 'script', NimbleLexer, NimbleParser)
+        type_of = check_script(tree)
+        stack_machine = StackVM(StackCompiler(type_of).compile_script(tree))
+        program = lower_script(tree, type_of)
+        before, after = optimize(program)
+        register_machine = RegisterVM(program)
+        times = []
+        for machine in (stack_machine, register_machine):
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                machine.run(lambda text: None)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            times.append(best)
+        results[name] = times[0], times[1], before, after
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Run a Nimble script on the register machine')
+    arg_parser.add_argument('script', nargs='?', help='path of the Nimble script to run')
+    arg_parser.add_argument('--dump', action='store_true', help='print the optimized IR instead')
+    arg_parser.add_argument('--benchmark', action='store_true', help='compare the stack and register machines')
+    args = arg_parser.parse_args()
+    if args.benchmark:
+        for name, (stack_time, register_time, before, after) in benchmark().items():
+            print(f'{name:22} stack {stack_time * 1000:9.1f} ms   register {register_time * 1000:9.1f} ms'
+                  f'   IR {before} -> {after} instructions')
+    elif args.script:
+        tree = parse(args.script, 'script', NimbleLexer, NimbleParser, from_file=True)
+        try:
+            type_of = check_script(tree)
+        except SemanticErrors as e:
+            sys.exit(f'{args.script} was not run, as it has semantic errors:\n{e.error_log}')
+        program = lower_script(tree, type_of)
+        optimize(program)
+        if args.dump:
+            print(program)
+        else:
+            RegisterVM(program).run()
+    else:
+        arg_parser.error('a script path or --benchmark is required')
+
+
+if __name__ == '__main__':
+    main()
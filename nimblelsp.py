@@ -0,0 +1,583 @@
+"""
+An LSP-compatible diagnostics server for Nimble, with incremental updates.
+
+Each open document keeps the tokens and parse tree of its previous version.
+On an incremental `textDocument/didChange`:
+
+- only the edited region is re-lexed: lexing restarts one token before the
+  edit and stops as soon as it produces a token matching one of the previous
+  version's tokens after the edit, from which point the previous tokens are
+  reused, shifted in place;
+- only the smallest enclosing node that can be parsed on its own is re-parsed
+  from the token list and spliced back into the tree: a `statement` or
+  `varDec`, else the items of the enclosing `block` or `varBlock` lying
+  between those left untouched, else the enclosing `funcDef` or `main`. A re-parse that does not
+  reproduce the node's boundaries cleanly escalates to the next enclosing
+  such node, and finally to a full parse of the (still reused) tokens.
+  Statement-level re-parsing is what keeps multi-thousand-line `main` bodies
+  within budget: re-parsing a whole unit costs as much as the full parse.
+
+Semantic analysis then runs over the whole tree, since a change in one unit
+can affect the names visible in others, and the resulting `errorlog.ErrorLog`
+entries and `generic_parser.SyntaxErrorLog` records are published as
+`textDocument/publishDiagnostics`.
+
+Publishing is debounced: diagnostics are sent `debounce` seconds after the
+latest edit, but never later than `budget` seconds after the first
+unpublished edit, less the expected time to compute them.
+
+Positions are treated as code point offsets; Nimble source is ASCII, for which
+these coincide with LSP's UTF-16 code units.
+
+Run with `python nimblelsp.py`; the server speaks LSP over stdio.
+
+Version: 2026-10-19
+"""
+
+import asyncio
+import json
+import sys
+import time
+from bisect import bisect_left, bisect_right
+
+from antlr4 import CommonTokenStream, InputStream, ParserRuleContext, Token
+from antlr4.ListTokenSource import ListTokenSource
+from generic_parser import SyntaxErrorLog
+from nimble import NimbleLexer, NimbleParser
+from testhelpers import analyze_tree
+
+# LSP constants
+_SYNC_INCREMENTAL = 2
+_SEVERITY_ERROR = 1
+
+
+class _TextWindow(InputStream):
+    """
+    An InputStream over a string that can start part way through it, without
+    converting the whole string to a list of code points first.
+    """
+
+    def __init__(self, text, offset=0):
+        self.name = '<document>'
+        self.strdata = text
+        self._index = offset
+        self._size = len(text)
+
+    def LA(self, offset):
+        if offset == 0:
+            return 0
+        if offset < 0:
+            offset += 1
+        pos = self._index + offset - 1
+        if pos < 0 or pos >= self._size:
+            return Token.EOF
+        return ord(self.strdata[pos])
+
+
+class IncrementalDocument:
+    """
+    A Nimble document that tracks its tokens and parse tree across edits, re-lexing
+    and re-parsing as little as possible. `stats` records the work done by the most
+    recent change and update.
+    """
+
+    def __init__(self, uri, text, version=None):
+        self.uri = uri
+        self.version = version
+        self.stats = {}
+        self.tree = None
+        self.syntax_errors = []
+        self.__set_text(text)
+        self.__relex_all()
+
+    # ---------------------------------------------------------------------------------
+    # Edits
+
+    def apply_change(self, change):
+        """Applies one LSP TextDocumentContentChangeEvent."""
+        if 'range' not in change:
+            self.__set_text(change['text'])
+            self.__relex_all()
+            return
+
+        start = self.offset_at(change['range']['start'])
+        end = self.offset_at(change['range']['end'])
+        inserted = change['text']
+        delta = len(inserted) - (end - start)
+        old_end_line, old_end_column = self.position_at(end)
+        self.__replace_text(start, end, inserted)
+        new_end_line, new_end_column = self.position_at(start + len(inserted))
+
+        if self.__lexer_errors:
+            # Lexer errors can't be tracked through a partial re-lex
+            self.__relex_all()
+            return
+
+        tokens = self.tokens
+        # Re-lex from the first token touching the edit, or whose one character of
+        # lookahead (the most any Nimble token needs) falls in it. Lexing restarts just
+        # after the previous token, so skipped comments and whitespace are re-lexed too.
+        restart = bisect_left(_Stops(tokens), start - 1)
+        resync = bisect_left(_Starts(tokens), end)
+        lexer, errors = self.__lexer(tokens[restart - 1].stop + 1 if restart > 0 else 0)
+        edited_end = start + len(inserted)
+        relexed = []
+        while True:
+            token = lexer.nextToken()
+            token.text = token.text
+            if token.start >= edited_end:
+                while resync < len(tokens) and tokens[resync].start + delta < token.start:
+                    resync += 1
+                if resync < len(tokens):
+                    old = tokens[resync]
+                    if old.type == token.type and old.start + delta == token.start \
+                            and old.stop + delta == token.stop:
+                        break
+            relexed.append(token)
+            if token.type == Token.EOF:
+                resync = len(tokens)
+                break
+        self.__lexer_errors = errors.syntax_errors
+
+        reused = tokens[resync:]
+        line_delta = new_end_line - old_end_line
+        column_delta = new_end_column - old_end_column
+        for token in reused:
+            if token.line == old_end_line + 1:
+                token.column += column_delta
+            token.line += line_delta
+            token.start += delta
+            token.stop += delta
+
+        self.__mark_dirty(restart, resync)
+        self.tokens = tokens[:restart] + relexed + reused
+        for i in range(restart, len(self.tokens)):
+            self.tokens[i].tokenIndex = i
+        self.stats = {'relexed_tokens': len(relexed), 'reused_tokens': len(tokens) - (resync - restart)}
+
+    def offset_at(self, position):
+        """Converts an LSP Position to an offset in the text."""
+        line = min(position['line'], len(self.__line_starts) - 1)
+        line_end = self.__line_starts[line + 1] - 1 if line + 1 < len(self.__line_starts) \
+            else len(self.text)
+        return min(self.__line_starts[line] + position['character'], line_end)
+
+    def position_at(self, offset):
+        """Converts an offset in the text to a 0-based (line, column) pair."""
+        line = bisect_right(self.__line_starts, offset) - 1
+        return line, offset - self.__line_starts[line]
+
+    def __set_text(self, text):
+        self.text = text
+        self.__line_starts = [0] + [i + 1 for i, c in enumerate(text) if c == '\n']
+
+    def __replace_text(self, start, end, inserted):
+        self.text = self.text[:start] + inserted + self.text[end:]
+        first = bisect_right(self.__line_starts, start)
+        last = bisect_right(self.__line_starts, end)
+        delta = len(inserted) - (end - start)
+        self.__line_starts[first:] = \
+            [start + i + 1 for i, c in enumerate(inserted) if c == '\n'] + \
+            [s + delta for s in self.__line_starts[last:]]
+
+    def __lexer(self, offset):
+        lexer = NimbleLexer(_TextWindow(self.text, offset))
+        line, column = self.position_at(offset)
+        lexer.line = line + 1
+        lexer.column = column
+        errors = SyntaxErrorLog()
+        lexer.removeErrorListeners()
+        lexer.addErrorListener(errors)
+        return lexer, errors
+
+    def __relex_all(self):
+        lexer, errors = self.__lexer(0)
+        tokens = []
+        while True:
+            token = lexer.nextToken()
+            token.text = token.text
+            token.tokenIndex = len(tokens)
+            tokens.append(token)
+            if token.type == Token.EOF:
+                break
+        self.tokens = tokens
+        self.__lexer_errors = errors.syntax_errors
+        self.__dirty = None
+        self.stats = {'relexed_tokens': len(tokens), 'reused_tokens': 0}
+
+    def __mark_dirty(self, first, end):
+        """
+        Records the smallest re-parseable node enclosing replaced tokens [first, end), or
+        that a full parse is needed (a dirty set of None).
+        """
+        if self.tree is None or self.__dirty is None:
+            self.__dirty = None
+            return
+        tokens = self.tokens
+        enclosing = None
+        node = self.tree
+        while True:
+            for child in node.children or []:
+                if not isinstance(child, ParserRuleContext) or child.start.type == Token.EOF:
+                    continue
+                if child.start.tokenIndex >= first or not _live(tokens, child.start):
+                    continue
+                # Only nodes whose boundary tokens survive the change can enclose it, except
+                # that the main, and its body and block, run to the end of the script
+                if (child.stop.tokenIndex >= end and _live(tokens, child.stop)) or _runs_to_eof(child):
+                    node = child
+                    break
+            else:
+                break
+            if isinstance(node, _REPARSEABLE):
+                enclosing = node
+        if enclosing is None:
+            self.__dirty = None
+        else:
+            self.__dirty.add(enclosing)
+
+    # ---------------------------------------------------------------------------------
+    # Parsing and analysis
+
+    def update(self):
+        """
+        Brings the parse tree up to date with the tokens and analyzes it, returning the
+        document's LSP diagnostics.
+        """
+        parsed = []
+        if self.__dirty is not None and self.tree is not None:
+            # Nodes whose subtrees hold stale tokens, which must not be kept as they are
+            stale = set(self.__dirty)
+            for node in self.__dirty:
+                stale.update(_ancestors(node))
+            # Outermost first; nodes inside an already re-parsed node are then detached
+            for node in sorted(self.__dirty, key=lambda n: n.depth()):
+                if not _attached(node):
+                    continue
+                for candidate in [node] + [a for a in _ancestors(node) if isinstance(a, _REPARSEABLE)]:
+                    if self.__reparse(candidate, stale):
+                        parsed.append(type(candidate).__name__)
+                        break
+                else:
+                    self.__dirty = None
+                    break
+        if self.__dirty is None or self.tree is None:
+            self.tree, self.syntax_errors = self.__parse('script', 0)[:2]
+            if self.syntax_errors:
+                self.tree = None
+            parsed = ['ScriptContext']
+        self.__dirty = set()
+        self.stats['parsed'] = parsed
+
+        syntax_errors = self.__lexer_errors + self.syntax_errors
+        if syntax_errors or self.tree is None:
+            return [_syntax_diagnostic(record) for record in syntax_errors]
+        try:
+            error_log = analyze_tree(self.tree)[0]
+        except Exception as e:
+            # A failing analysis must not take the server down with it; report it instead
+            return [_failure_diagnostic(self.tree, e)]
+        return [_semantic_diagnostic(entry) for entry in error_log.entries()]
+
+    def __parse(self, rule_name, start_index):
+        source = ListTokenSource(self.tokens)
+        source.pos = start_index
+        stream = CommonTokenStream(source)
+        parser = NimbleParser(stream)
+        errors = SyntaxErrorLog()
+        parser.removeErrorListeners()
+        parser.addErrorListener(errors)
+        ctx = getattr(parser, rule_name)()
+        at_eof = stream.LA(1) == Token.EOF
+        # The stream numbers tokens from zero; restore their document positions
+        for i, token in enumerate(stream.tokens):
+            token.tokenIndex = start_index + i
+        return ctx, errors.syntax_errors, at_eof
+
+    def __reparse(self, node, stale):
+        """
+        Re-parses one node in place; returns False if the result might not be the same
+        as a full parse's.
+        """
+        if not _live(self.tokens, node.start):
+            return False
+        start = node.start.tokenIndex
+        if isinstance(node, NimbleParser.MainContext):
+            ctx, errors, at_eof = self.__parse('main', start)
+            if errors or ctx.start is not node.start or not at_eof:
+                return False
+        elif isinstance(node, (NimbleParser.BlockContext, NimbleParser.VarBlockContext)):
+            return self.__reparse_items(node, stale)
+        else:
+            if self.__follows_return(start):
+                return False
+            rule_name = next(name for c, name in _RULE_NAMES.items() if isinstance(node, c))
+            ctx, errors, _ = self.__parse(rule_name, start)
+            if errors or ctx.start is not node.start or ctx.stop is not node.stop:
+                return False
+        parent = node.parentCtx
+        ctx.parentCtx = parent
+        ctx.invokingState = node.invokingState
+        parent.children[parent.children.index(node)] = ctx
+        return True
+
+    def __reparse_items(self, block, stale):
+        """
+        Re-parses only the statements (or varDecs) of a block lying in the gaps between
+        its surviving items, leaving the surviving items in place. Survivors are items
+        with no stale nodes in them and whose boundary tokens are unchanged.
+        """
+        tokens = self.tokens
+        item_rule = 'statement' if isinstance(block, NimbleParser.BlockContext) else 'varDec'
+        if _runs_to_eof(block):
+            end = len(tokens) - 1
+        elif _live(tokens, block.stop):
+            end = block.stop.tokenIndex + 1
+        else:
+            return False
+
+        items = []
+        position = block.start.tokenIndex
+        survivors = [c for c in block.children or []
+                     if c not in stale and _live(tokens, c.start) and _live(tokens, c.stop)]
+        for target, survivor in [(c.start.tokenIndex, c) for c in survivors] + [(end, None)]:
+            if target < position:
+                return False
+            while position < target:
+                if self.__follows_return(position):
+                    return False
+                ctx, errors, _ = self.__parse(item_rule, position)
+                if errors or ctx.stop is None or ctx.stop.tokenIndex < position:
+                    return False
+                ctx.parentCtx = block
+                ctx.invokingState = survivors[0].invokingState if survivors else -1
+                items.append(ctx)
+                position = ctx.stop.tokenIndex + 1
+            if position != target:
+                return False
+            if survivor is not None:
+                items.append(survivor)
+                position = survivor.stop.tokenIndex + 1
+        block.children = items or None
+        block.stop = tokens[end - 1]
+        return True
+
+    def __follows_return(self, index):
+        """
+        True if the token before index is `return`: it may look ahead into the following
+        statement to decide whether it has an expression, so that statement can't be
+        parsed alone.
+        """
+        return index > 0 and self.tokens[index - 1].text == 'return'
+
+
+# Nodes that can be re-parsed on their own, and their rules
+_RULE_NAMES = {NimbleParser.StatementContext: 'statement', NimbleParser.VarDecContext: 'varDec',
+               NimbleParser.BlockContext: 'block', NimbleParser.VarBlockContext: 'varBlock',
+               NimbleParser.FuncDefContext: 'funcDef', NimbleParser.MainContext: 'main'}
+_REPARSEABLE = tuple(_RULE_NAMES)
+
+
+
+def _runs_to_eof(node):
+    """True for the main, and the body and block of the main, which end where the script does."""
+    while isinstance(node, (NimbleParser.BlockContext, NimbleParser.BodyContext)):
+        node = node.parentCtx
+        if isinstance(node, NimbleParser.WhileContext) or isinstance(node, NimbleParser.IfContext) \
+                or isinstance(node, NimbleParser.FuncDefContext):
+            return False
+    return isinstance(node, NimbleParser.MainContext)
+
+
+def _live(tokens, token):
+    """True if the token is still in the token list at its recorded index."""
+    return 0 <= token.tokenIndex < len(tokens) and tokens[token.tokenIndex] is token
+
+
+def _attached(node):
+    """True if the node is still reachable from the root by following children."""
+    while node.parentCtx is not None:
+        if not any(child is node for child in node.parentCtx.children):
+            return False
+        node = node.parentCtx
+    return True
+
+
+def _ancestors(node):
+    node = node.parentCtx
+    while node is not None:
+        yield node
+        node = node.parentCtx
+
+
+# ---------------------------------------------------------------------------------
+# Diagnostics
+
+
+def _semantic_diagnostic(entry):
+    start, stop = entry.ctx.start, entry.ctx.stop
+    return {'range': {'start': {'line': start.line - 1, 'character': start.column},
+                      'end': {'line': stop.line - 1, 'character': stop.column + len(stop.text)}},
+            'severity': _SEVERITY_ERROR, 'code': str(entry.category), 'source': 'nimble',
+            'message': entry.message}
+
+
+def _failure_diagnostic(tree, exception):
+    return {'range': {'start': {'line': tree.start.line - 1, 'character': tree.start.column},
+                      'end': {'line': tree.start.line - 1, 'character': tree.start.column}},
+            'severity': _SEVERITY_ERROR, 'code': 'ANALYSIS_FAILED', 'source': 'nimble',
+            'message': f'semantic analysis failed with {type(exception).__name__}'}
+
+
+def _syntax_diagnostic(record):
+    width = len(record.offending_symbol.text) \
+        if record.offending_symbol is not None and record.offending_symbol.type != Token.EOF else 1
+    return {'range': {'start': {'line': record.line - 1, 'character': record.column},
+                      'end': {'line': record.line - 1, 'character': record.column + width}},
+            'severity': _SEVERITY_ERROR, 'code': 'SYNTAX', 'source': 'nimble',
+            'message': record.message}
+
+
+class _Starts:
+    """A sequence view of token start offsets, for bisecting a token list."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __getitem__(self, i):
+        return self.tokens[i].start
+
+
+class _Stops(_Starts):
+    """A sequence view of token stop offsets, for bisecting a token list."""
+
+    def __getitem__(self, i):
+        return self.tokens[i].stop
+
+
+# ---------------------------------------------------------------------------------
+# Server
+
+
+class DiagnosticsServer:
+    """
+    Handles LSP messages for open Nimble documents, publishing debounced diagnostics
+    through `send`, a coroutine function taking one JSON-RPC message.
+
+    :param debounce: Seconds of quiet after an edit before publishing
+    :param budget: Maximum seconds from the first unpublished edit to publishing
+    """
+
+    def __init__(self, send, debounce=0.05, budget=0.25):
+        self.send = send
+        self.debounce = debounce
+        self.budget = budget
+        self.documents = {}
+        self.running = True
+        self.update_seconds = 0.0
+        self.__deadlines = {}
+        self.__timers = {}
+
+    async def handle(self, message):
+        method = message.get('method')
+        params = message.get('params') or {}
+        request_id = message.get('id')
+        result = None
+        if method == 'initialize':
+            result = {'capabilities': {'textDocumentSync': {'openClose': True,
+                                                            'change': _SYNC_INCREMENTAL}},
+                      'serverInfo': {'name': 'nimble-diagnostics'}}
+        elif method == 'textDocument/didOpen':
+            document = params['textDocument']
+            self.documents[document['uri']] = IncrementalDocument(
+                document['uri'], document['text'], document.get('version'))
+            self.__schedule(document['uri'])
+        elif method == 'textDocument/didChange':
+            uri = params['textDocument']['uri']
+            document = self.documents[uri]
+            document.version = params['textDocument'].get('version')
+            for change in params['contentChanges']:
+                document.apply_change(change)
+            self.__schedule(uri)
+        elif method == 'textDocument/didClose':
+            uri = params['textDocument']['uri']
+            self.documents.pop(uri, None)
+            self.__cancel(uri)
+            await self.__publish(uri, [], None)
+        elif method == 'exit':
+            self.running = False
+        elif method != 'shutdown' and request_id is not None:
+            await self.send({'jsonrpc': '2.0', 'id': request_id,
+                             'error': {'code': -32601, 'message': f'unknown method {method!r}'}})
+            return
+        if request_id is not None:
+            await self.send({'jsonrpc': '2.0', 'id': request_id, 'result': result})
+
+    def __schedule(self, uri):
+        now = time.perf_counter()
+        deadline = self.__deadlines.setdefault(uri, now + self.budget)
+        delay = max(0.0, min(self.debounce, deadline - now - self.update_seconds))
+        self.__cancel(uri, keep_deadline=True)
+        self.__timers[uri] = asyncio.create_task(self.__publish_after(uri, delay))
+
+    def __cancel(self, uri, keep_deadline=False):
+        timer = self.__timers.pop(uri, None)
+        if timer is not None:
+            timer.cancel()
+        if not keep_deadline:
+            self.__deadlines.pop(uri, None)
+
+    async def __publish_after(self, uri, delay):
+        await asyncio.sleep(delay)
+        del self.__timers[uri]
+        self.__deadlines.pop(uri, None)
+        document = self.documents.get(uri)
+        if document is None:
+            return
+        start = time.perf_counter()
+        diagnostics = document.update()
+        # Smoothed cost of an update, subtracted from the budget when scheduling
+        self.update_seconds = 0.8 * self.update_seconds + 0.2 * (time.perf_counter() - start)
+        await self.__publish(uri, diagnostics, document.version)
+
+    async def __publish(self, uri, diagnostics, version):
+        params = {'uri': uri, 'diagnostics': diagnostics}
+        if version is not None:
+            params['version'] = version
+        await self.send({'jsonrpc': '2.0', 'method': 'textDocument/publishDiagnostics',
+                         'params': params})
+
+
+async def serve_stdio(debounce=0.05, budget=0.25):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    async def send(message):
+        body = json.dumps(message).encode('utf-8')
+        sys.stdout.buffer.write(b'Content-Length: %d\r\n\r\n' % len(body) + body)
+        sys.stdout.buffer.flush()
+
+    server = DiagnosticsServer(send, debounce, budget)
+    while server.running:
+        length = None
+        while True:
+            header = await reader.readline()
+            if not header:
+                return
+            header = header.strip()
+            if not header:
+                break
+            name, _, value = header.decode('ascii').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        if length is None:
+            continue
+        await server.handle(json.loads(await reader.readexactly(length)))
+
+
+if __name__ == '__main__':
+    asyncio.run(serve_stdio())
@@ -0,0 +1,252 @@
+"""
+Profiles the memory used in parsing and analyzing a Nimble script.
+
+`profile_memory` runs the steps of `testhelpers.do_semantic_analysis`, lex,
+parse, both semantic analysis phases and indexing, under `tracemalloc`,
+and reports:
+
+- for each step, its peak memory and the memory it leaves allocated;
+- the number and approximate size of each structure still held at the end:
+  the input characters, tokens, parse tree nodes, parser and lexer DFA states, `PredictionContext`
+  cache entries, scopes and symbols, and `type_of` and indexed type entries;
+- the number of `ATNConfig` and `ATNConfigSet` objects created while parsing,
+  most of which are garbage by the end of each prediction;
+- the objects retained, counted by type, and the memory retained, by the
+  source file that allocated it.
+
+Sizes are shallow `sys.getsizeof` sizes of each object, its `__dict__` and
+the lists and dictionaries it owns, so strings and other objects shared
+between structures aren't counted twice. The DFA states and prediction
+context cache are shared by every parser in a process and grow over its
+lifetime, so by default the profile is of a fresh process; with `warm`, a
+warm-up script is parsed first, by `testhelpers.warm_up`, so they only show
+what this script adds.
+
+Run with `python nimblememory.py [SCRIPT] [--warm] [--top N]`; without a
+script, a program generated by `nimblebench.generate_program` is profiled.
+
+Version: 2026-10-19
+"""
+
+import argparse
+import gc
+import sys
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from antlr4 import CommonTokenStream, InputStream, ParserRuleContext
+from antlr4.atn.ATNConfig import ATNConfig
+from antlr4.atn.ATNConfigSet import ATNConfigSet
+from nimble import NimbleLexer, NimbleParser
+from nimblebench import generate_program
+from testhelpers import analyze_tree, index, warm_up
+
+STEPS = ('lex', 'parse', 'analyze', 'index')
+
+
+@dataclass
+class Structure:
+    """How many of a kind of object there are, and their approximate total size."""
+    count: int = 0
+    bytes: int = 0
+
+    def add(self, *objects):
+        self.count += 1
+        self.bytes += sum(_size(o) for o in objects)
+
+
+@dataclass
+class MemoryProfile:
+    lines: int
+    tokens: int
+    # Highest memory allocated, over all the steps
+    peak_bytes: int = 0
+    # Step -> (peak bytes, retained bytes)
+    steps: dict = field(default_factory=dict)
+    # Structure name -> Structure
+    structures: dict = field(default_factory=dict)
+    # Class name -> instances created while parsing
+    created: dict = field(default_factory=dict)
+    # (type name, change in count) pairs, most retained first
+    retained_by_type: list = field(default_factory=list)
+    # (file name, bytes, blocks) triples, most retained first
+    retained_by_file: list = field(default_factory=list)
+
+    @property
+    def retained_bytes(self):
+        return sum(retained for _, retained in self.steps.values())
+
+
+def _size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+@contextmanager
+def _counting_instances(*classes):
+    """Counts the instances of the classes, and their subclasses, created in the block."""
+    counts = Counter()
+    originals = {cls: cls.__init__ for cls in classes}
+
+    def counting(cls, original):
+        def __init__(self, *args, **kwargs):
+            counts[cls.__name__] += 1
+            original(self, *args, **kwargs)
+        return __init__
+
+    for cls, original in originals.items():
+        cls.__init__ = counting(cls, original)
+    try:
+        yield counts
+    finally:
+        for cls, original in originals.items():
+            cls.__init__ = original
+
+
+def _lex(source):
+    stream = CommonTokenStream(NimbleLexer(InputStream(source)))
+    stream.fill()
+    return stream
+
+
+def _type_counts():
+    return Counter(type(o).__name__ for o in gc.get_objects())
+
+
+def _measure_structures(stream, tree, global_scope, node_types, indexed_types):
+    structures = {name: Structure() for name in (
+        'input characters', 'tokens', 'parse tree nodes', 'parser DFA states', 'lexer DFA states',
+        'prediction context cache', 'scopes', 'symbols', 'type_of entries', 'indexed type entries')}
+
+    # InputStream keeps the source as a list of code points
+    characters = stream.tokenSource._input.data
+    structures['input characters'] = Structure(len(characters), sys.getsizeof(characters))
+    for token in stream.tokens:
+        structures['tokens'].add(token)
+
+    nodes = [tree]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, ParserRuleContext):
+            structures['parse tree nodes'].add(node, node.children or [])
+            nodes.extend(node.children or [])
+        else:
+            structures['parse tree nodes'].add(node)
+
+    for name, dfas in (('parser DFA states', NimbleParser.decisionsToDFA),
+                       ('lexer DFA states', NimbleLexer.decisionsToDFA)):
+        for dfa in dfas:
+            for state in dfa._states:
+                configs = state.configs
+                structures[name].add(state, state.edges or [], configs, configs.configs,
+                                     configs.configLookup or {}, *configs.configs)
+
+    cache = NimbleParser.sharedContextCache.cache
+    for context in cache:
+        structures['prediction context cache'].add(context)
+    structures['prediction context cache'].bytes += sys.getsizeof(cache)
+
+    scopes = [global_scope]
+    while scopes:
+        scope = scopes.pop()
+        structures['scopes'].add(scope, scope.child_scopes)
+        for symbol in scope.parameters() + scope.local_variables() + scope.functions():
+            structures['symbols'].add(symbol)
+        scopes.extend(scope.child_scopes.values())
+
+    structures['type_of entries'] = Structure(len(node_types), sys.getsizeof(node_types))
+    entries = structures['indexed type entries']
+    entries.bytes += sys.getsizeof(indexed_types)
+    for line_types in indexed_types.values():
+        entries.count += len(line_types)
+        entries.bytes += sys.getsizeof(line_types)
+    return structures
+
+
+def profile_memory(source, warm=False, top=10) -> MemoryProfile:
+    """
+    Parses and analyzes the source, returning its `MemoryProfile`.
+
+    :param warm: If true, parse a warm-up script first to populate the parser's shared caches
+    :param top: Number of types and files to report retained memory for
+    """
+    if warm:
+        warm_up()
+    gc.collect()
+    types_before = _type_counts()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        steps = {}
+        start = current = tracemalloc.get_traced_memory()[0]
+        overall_peak = 0
+
+        def step(name, function):
+            nonlocal current, overall_peak
+            tracemalloc.reset_peak()
+            result = function()
+            now, peak = tracemalloc.get_traced_memory()
+            steps[name] = (peak - current, now - current)
+            overall_peak = max(overall_peak, peak - start)
+            current = now
+            return result
+
+        stream = step('lex', lambda: _lex(source))
+        with _counting_instances(ATNConfig, ATNConfigSet) as created:
+            tree = step('parse', NimbleParser(stream).script)
+        _, global_scope, node_types = step('analyze', lambda: analyze_tree(tree))
+        indexed_types = step('index', lambda: index(node_types))
+
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    by_file = after.compare_to(before, 'filename')
+    types_after = _type_counts()
+    types_after.subtract(types_before)
+    return MemoryProfile(
+        source.count('\n') + 1, len(stream.tokens), overall_peak, steps,
+        _measure_structures(stream, tree, global_scope, node_types, indexed_types), dict(created),
+        [(name, count) for name, count in types_after.most_common(top) if count > 0],
+        [(stat.traceback[0].filename, stat.size_diff, stat.count_diff) for stat in by_file[:top]])
+
+
+def report(profile: MemoryProfile) -> str:
+    lines = [f'{profile.lines} lines, {profile.tokens} tokens: peak {profile.peak_bytes / 1024:,.1f} KiB, '
+             f'retained {profile.retained_bytes / 1024:,.1f} KiB',
+             f'{"step":10} {"peak KiB":>12} {"retained KiB":>14}']
+    for name, (peak, retained) in profile.steps.items():
+        lines.append(f'{name:10} {peak / 1024:12,.1f} {retained / 1024:14,.1f}')
+    lines.append(f'{"structure":26} {"count":>9} {"KiB":>10}')
+    for name, structure in sorted(profile.structures.items(), key=lambda item: -item[1].bytes):
+        lines.append(f'{name:26} {structure.count:9,} {structure.bytes / 1024:10,.1f}')
+    lines.append('created while parsing: ' + ', '.join(f'{count:,} {name}' for name, count in profile.created.items()))
+    lines.append('retained objects by type: ' + ', '.join(f'{count:,} {name}'
+                                                          for name, count in profile.retained_by_type))
+    lines.append('retained memory by file:')
+    for filename, size, blocks in profile.retained_by_file:
+        lines.append(f'  {size / 1024:10,.1f} KiB {blocks:8,} blocks  {filename}')
+    return '\n'.join(lines)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Profile the memory used to parse and analyze a Nimble script')
+    arg_parser.add_argument('script', nargs='?', help='path of the script; by default a generated one')
+    arg_parser.add_argument('--warm', action='store_true', help='populate the parser caches first')
+    arg_parser.add_argument('--top', type=int, default=10, help='number of types and files to list')
+    args = arg_parser.parse_args()
+    if args.script:
+        with open(args.script, encoding='utf-8') as file:
+            source = file.read()
+    else:
+        source = generate_program()
+    print(report(profile_memory(source, args.warm, args.top)))
+
+
+if __name__ == '__main__':
+    main()
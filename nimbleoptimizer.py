@@ -0,0 +1,356 @@
+"""
+Optimization passes over type-checked Nimble parse trees.
+
+The passes never modify the tree. Instead they record their results in
+`SideTables`, which the execution engines (`nimbleinterpreter.Compiler` and
+`nimbletranspiler.Transpiler`) consult as they compile each node:
+
+- `constant_value` maps an expression node to the value it always has, so it
+  is executed as a literal;
+- `replacement` maps an expression node to an operand node it is equivalent
+  to, e.g. `x * 1` to `x`, so only the operand is executed;
+- `unreachable` holds the statement nodes that can never execute, which are
+  skipped by execution and, walked with `PruningWalker`, by re-analysis.
+
+`FoldConstants` is a `NimbleListener` to be walked after
+`nimblesemantics.InferTypesAndCheckConstraints`. It folds `IntLiteral` and
+`BoolLiteral` subtrees through `mulDiv`, `addSub`, `compare`, `neg` and
+`parens`, and applies the algebraic identities `x * 1`, `1 * x`, `x / 1`,
+`x + 0`, `0 + x`, `x - 0`, `-(-x)` and `!(!x)`. Identities that would discard
+an operand, like `x * 0`, are not applied, since the operand may call a
+function that prints. Nodes typed `ERROR` and divisions by zero are left
+alone, so they behave at run time exactly as they did before folding. For
+scripts run with 64-bit `Int` (see `nimbleinterpreter.Compiler`), folding
+with the same `overflow` wraps folded values, or leaves an overflowing
+expression unfolded so it traps at run time.
+
+`MarkUnreachable`, walked after `FoldConstants`, marks the statements of the
+branch an `if` with a constant condition never takes, the body of a `while`
+whose condition is constant `false`, and the statements of a `block` that
+follow one that always returns: a `return`, or an `if` all of whose possible
+branches always return.
+
+`pure_functions` finds the functions with no side effects, using the call
+graph `FindCalls` builds from `funcDef` and `funcCall` nodes. Nimble values
+are only ever `Int`, `Bool` or `String`, and functions can't see any
+variables but their own, so a function is pure unless it prints or calls a
+function that isn't pure. A pure function's result depends only on its
+arguments, so its calls may be memoized.
+
+Version: 2026-10-19
+"""
+
+from dataclasses import dataclass, field
+
+from antlr4 import ParseTreeWalker
+from nimble import NimbleListener, NimbleParser
+from nimbleinterpreter import INT_MAX, INT_MIN, divide, wrap_int
+from symboltable import PrimitiveType
+
+_FOLDABLE_OPERATORS = {
+    '*': lambda a, b: a * b,
+    '/': divide,
+    '+': lambda a, b: a + b,
+    '-': lambda a, b: a - b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '==': lambda a, b: a == b,
+}
+
+
+@dataclass
+class SideTables:
+    """Results of the optimization passes, keyed by parse tree node."""
+
+    # Expression node -> the constant value it always evaluates to
+    constant_value: dict = field(default_factory=dict)
+
+    # Expression node -> an operand node equivalent to it
+    replacement: dict = field(default_factory=dict)
+
+    # Statement nodes that never execute
+    unreachable: set = field(default_factory=set)
+
+
+@dataclass
+class FoldingReport:
+    """How much constant folding saved, counted in expression nodes executed."""
+
+    # Expression nodes executed before and after folding
+    expressions_before: int
+    expressions_after: int
+
+    # Expressions folded to a constant, not counting literals or parentheses
+    folded: int
+
+    # Expressions replaced by one of their operands, not counting parentheses
+    simplified: int
+
+    @property
+    def eliminated(self):
+        return self.expressions_before - self.expressions_after
+
+    def __str__(self):
+        return (f'{self.folded} expressions folded, {self.simplified} simplified: '
+                f'{self.eliminated} of {self.expressions_before} expression nodes eliminated')
+
+
+class FoldConstants(NimbleListener):
+    """
+    Records the value of each constant expression in `tables.constant_value`, and each
+    expression equivalent to one of its operands in `tables.replacement`. `overflow` is
+    that of the `nimbleinterpreter.Compiler` the tree will be compiled with.
+    """
+
+    def __init__(self, type_of: dict, tables: SideTables, overflow=None):
+        self.type_of = type_of
+        self.tables = tables
+        self.overflow = overflow
+        self.folded = 0
+        self.simplified = 0
+
+    def exitIntLiteral(self, ctx: NimbleParser.IntLiteralContext):
+        value = self.__fit(int(ctx.getText()))
+        if value is not None:
+            self.tables.constant_value[ctx] = value
+
+    def exitBoolLiteral(self, ctx: NimbleParser.BoolLiteralContext):
+        self.tables.constant_value[ctx] = ctx.getText() == 'true'
+
+    def exitParens(self, ctx: NimbleParser.ParensContext):
+        operand = self.__operand(ctx.expr())
+        if operand in self.tables.constant_value:
+            self.__fold(ctx, self.tables.constant_value[operand])
+        else:
+            self.__replace(ctx, operand)
+
+    def exitNeg(self, ctx: NimbleParser.NegContext):
+        operand = self.__operand(ctx.expr())
+        if operand in self.tables.constant_value:
+            value = self.tables.constant_value[operand]
+            if ctx.op.text == '-' and _is_int(value):
+                self.__fold(ctx, -value)
+            elif ctx.op.text == '!' and isinstance(value, bool):
+                self.__fold(ctx, not value)
+            return
+        # -(-x) and !(!x) are x; the inner operand has already been resolved. When
+        # overflow traps, -x may trap, so it must still execute.
+        if isinstance(operand, NimbleParser.NegContext) and operand.op.text == ctx.op.text and \
+                not (ctx.op.text == '-' and self.overflow == 'trap'):
+            self.__replace(ctx, self.__operand(operand.expr()))
+
+    def exitMulDiv(self, ctx: NimbleParser.MulDivContext):
+        self.__binary(ctx)
+
+    def exitAddSub(self, ctx: NimbleParser.AddSubContext):
+        self.__binary(ctx)
+
+    def exitCompare(self, ctx: NimbleParser.CompareContext):
+        self.__binary(ctx)
+
+    # ---------------------------------------------------------------------------------
+
+    def __operand(self, ctx):
+        """The node that will actually be executed in place of `ctx`."""
+        return self.tables.replacement.get(ctx, ctx)
+
+    def __fit(self, value):
+        """An Int value as it is at run time, or None if computing it traps."""
+        if self.overflow == 'wrap':
+            return wrap_int(value)
+        if self.overflow == 'trap' and not INT_MIN <= value <= INT_MAX:
+            return None
+        return value
+
+    def __fold(self, ctx, value):
+        if self.type_of.get(ctx) == PrimitiveType.ERROR:
+            return
+        if _is_int(value):
+            value = self.__fit(value)
+            if value is None:
+                return
+        self.tables.constant_value[ctx] = value
+        if not isinstance(ctx, NimbleParser.ParensContext):
+            self.folded += 1
+
+    def __replace(self, ctx, operand):
+        if self.type_of.get(ctx) == PrimitiveType.ERROR:
+            return
+        self.tables.replacement[ctx] = operand
+        if not isinstance(ctx, NimbleParser.ParensContext):
+            self.simplified += 1
+
+    def __binary(self, ctx):
+        left, right = self.__operand(ctx.expr(0)), self.__operand(ctx.expr(1))
+        constants = self.tables.constant_value
+        op = ctx.op.text
+        if left in constants and right in constants:
+            a, b = constants[left], constants[right]
+            # Only Int operands fold; anything else is an ERROR the run time must see
+            if _is_int(a) and _is_int(b) and not (op == '/' and b == 0):
+                self.__fold(ctx, _FOLDABLE_OPERATORS[op](a, b))
+            return
+        if right in constants and _is_int(constants[right]):
+            identity = {'*': 1, '/': 1, '+': 0, '-': 0}.get(op)
+            if constants[right] == identity:
+                self.__replace(ctx, left)
+        elif left in constants and _is_int(constants[left]):
+            identity = {'*': 1, '+': 0}.get(op)
+            if constants[left] == identity:
+                self.__replace(ctx, right)
+
+
+class MarkUnreachable(NimbleListener):
+    """
+    Adds the statements that can never execute to `tables.unreachable`, using the
+    constant conditions found by `FoldConstants`.
+    """
+
+    def __init__(self, tables: SideTables):
+        self.tables = tables
+        self.marked = 0
+
+    def exitBlock(self, ctx: NimbleParser.BlockContext):
+        statements = ctx.statement()
+        for i, statement in enumerate(statements):
+            if self.__always_returns(statement):
+                self.__mark(statements[i + 1:])
+                return
+
+    def exitWhile(self, ctx: NimbleParser.WhileContext):
+        if self.__condition(ctx) is False:
+            self.__mark(ctx.block().statement())
+
+    def exitIf(self, ctx: NimbleParser.IfContext):
+        condition = self.__condition(ctx)
+        if condition is True and ctx.block(1) is not None:
+            self.__mark(ctx.block(1).statement())
+        elif condition is False:
+            self.__mark(ctx.block(0).statement())
+
+    # ---------------------------------------------------------------------------------
+
+    def __condition(self, ctx):
+        """The constant value of a statement's condition, or None if it isn't constant."""
+        expr = self.tables.replacement.get(ctx.expr(), ctx.expr())
+        return self.tables.constant_value.get(expr)
+
+    def __mark(self, statements):
+        for statement in statements:
+            if statement not in self.tables.unreachable:
+                self.tables.unreachable.add(statement)
+                self.marked += 1
+
+    def __always_returns(self, statement):
+        if isinstance(statement, NimbleParser.ReturnContext):
+            return True
+        if not isinstance(statement, NimbleParser.IfContext):
+            return False
+        condition = self.__condition(statement)
+        branches = [statement.block(0)] if condition is True else \
+            [statement.block(1)] if condition is False else \
+            [statement.block(0), statement.block(1)]
+        return all(block is not None and any(self.__always_returns(s) for s in block.statement())
+                   for block in branches)
+
+
+class FindCalls(NimbleListener):
+    """
+    Builds the call graph: `calls` maps each function name (and `$main`) to the
+    names it calls, and `prints` holds the names of those containing a `print`.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.prints = set()
+        self.__current = None
+
+    def enterFuncDef(self, ctx: NimbleParser.FuncDefContext):
+        self.__current = ctx.ID().getText()
+        self.calls.setdefault(self.__current, set())
+
+    def enterMain(self, ctx: NimbleParser.MainContext):
+        self.__current = '$main'
+        self.calls.setdefault(self.__current, set())
+
+    def exitFuncCall(self, ctx: NimbleParser.FuncCallContext):
+        self.calls[self.__current].add(ctx.ID().getText())
+
+    def exitPrint(self, ctx: NimbleParser.PrintContext):
+        self.prints.add(self.__current)
+
+
+class PruningWalker(ParseTreeWalker):
+    """
+    A `ParseTreeWalker` that doesn't walk the given nodes or their subtrees, e.g. the
+    `unreachable` statements, so listeners like the semantic analysis passes skip them.
+    """
+
+    def __init__(self, skip):
+        self.skip = skip
+
+    def walk(self, listener, t):
+        if t not in self.skip:
+            super().walk(listener, t)
+
+
+def fold_constants(tree, type_of, tables=None, overflow=None):
+    """
+    Runs `FoldConstants` over a type-checked tree, returning the side tables (the
+    ones given, if any, updated in place) and a `FoldingReport`.
+    """
+    tables = tables if tables is not None else SideTables()
+    folder = FoldConstants(type_of, tables, overflow)
+    ParseTreeWalker().walk(folder, tree)
+    before, after = _count_executed(tree, None), _count_executed(tree, tables)
+    return tables, FoldingReport(before, after, folder.folded, folder.simplified)
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _count_executed(tree, tables):
+    """Counts the expression nodes executed for a tree, honouring the side tables if given."""
+    count = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, NimbleParser.ExprContext):
+            if tables is not None:
+                node = tables.replacement.get(node, node)
+            count += 1
+            if tables is not None and node in tables.constant_value:
+                continue
+        if hasattr(node, 'children') and node.children:
+            stack.extend(node.children)
+    return count
+
+
+def mark_unreachable(tree, tables):
+    """
+    Runs `MarkUnreachable` over a tree already folded by `fold_constants`, updating the
+    side tables in place; returns the number of statements newly marked unreachable.
+    """
+    marker = MarkUnreachable(tables)
+    ParseTreeWalker().walk(marker, tree)
+    return marker.marked
+
+
+def pure_functions(tree, skip=None):
+    """
+    Returns the names of the script's pure functions. Statements in `skip`, e.g. the
+    `unreachable` ones, are ignored.
+    """
+    finder = FindCalls()
+    (PruningWalker(skip) if skip else ParseTreeWalker()).walk(finder, tree)
+    impure = set(finder.prints)
+    # Impurity spreads from callee to caller; calls of undefined functions are impure
+    changed = True
+    while changed:
+        changed = False
+        for name, callees in finder.calls.items():
+            if name not in impure and any(c in impure or c not in finder.calls for c in callees):
+                impure.add(name)
+                changed = True
+    return {name for name in finder.calls if name not in impure and name != '$main'}
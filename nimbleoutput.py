@@ -0,0 +1,94 @@
+"""
+Buffered output for running Nimble scripts.
+
+Every engine (`nimbleinterpreter`, `nimbletranspiler`, `nimbleir`) sends
+printed text to a `BufferedOutput`, which collects it in memory and passes it
+on to its sink in large chunks: whenever `capacity` characters have built up,
+and when the script ends, even by raising an exception. A print in a hot
+loop therefore costs a list append, not a write to a file or terminal.
+
+A sink is any callable taking a string, e.g. `sys.stdout.write`, the `write`
+method of an open file, or the `append` method of a list. `MemorySink`
+collects output for tests, and `open_output` buffers output to a file.
+
+Version: 2026-10-19
+"""
+
+import sys
+
+# Characters buffered before output is passed on to the sink
+DEFAULT_CAPACITY = 1 << 16
+
+
+class BufferedOutput:
+    """
+    Collects text and passes it on to a sink in large chunks, counting the
+    characters and chunks passed on.
+
+    :param sink: Called with each chunk of text; by default `sys.stdout.write`
+    :param capacity: Number of characters to collect before passing them on
+    """
+
+    def __init__(self, sink=None, capacity=DEFAULT_CAPACITY):
+        self.sink = sink or sys.stdout.write
+        self.capacity = capacity
+        self.characters_written = 0
+        self.flushes = 0
+        self.__chunks = []
+        self.__size = 0
+
+    def write(self, text):
+        self.__chunks.append(text)
+        self.__size += len(text)
+        if self.__size >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        """Passes everything collected so far on to the sink."""
+        if self.__chunks:
+            text = ''.join(self.__chunks)
+            self.__chunks.clear()
+            self.__size = 0
+            self.sink(text)
+            self.characters_written += len(text)
+            self.flushes += 1
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class MemorySink:
+    """A sink keeping everything written to it, e.g. for tests."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def __call__(self, text):
+        self.chunks.append(text)
+
+    def getvalue(self):
+        return ''.join(self.chunks)
+
+
+class _FileOutput(BufferedOutput):
+
+    def __init__(self, file, capacity):
+        super().__init__(file.write, capacity)
+        self.file = file
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.file.close()
+
+
+def open_output(path, capacity=DEFAULT_CAPACITY, encoding='utf-8'):
+    """Returns a `BufferedOutput` writing to the named file, which it closes when closed."""
+    return _FileOutput(open(path, 'w', encoding=encoding), capacity)
@@ -40,7 +40,29 @@ Version:    March 2nd, 2023
 
 from errorlog import ErrorLog, Category
 from nimble import NimbleListener, NimbleParser
-from symboltable import PrimitiveType, Scope
+from symboltable import FunctionType, PrimitiveType, Scope
+
+TYPES = {'Int': PrimitiveType.Int, 'Bool': PrimitiveType.Bool, 'String': PrimitiveType.String}
+
+
+def function_scope_name(ctx: NimbleParser.FuncDefContext, duplicate: bool) -> str:
+    """
+    The name of a function's scope: the function's name, or for a second definition of
+    the same name, a name that can't clash with it.
+    """
+    name = ctx.ID().getText()
+    return f'{name}${ctx.start.line}:{ctx.start.column}' if duplicate else name
+
+
+def always_returns(ctx: NimbleParser.BlockContext) -> bool:
+    """True if every path through the block ends in a return statement."""
+    for statement in ctx.statement():
+        if isinstance(statement, NimbleParser.ReturnContext):
+            return True
+        if isinstance(statement, NimbleParser.IfContext) and len(statement.block()) == 2 and \
+                all(always_returns(block) for block in statement.block()):
+            return True
+    return False
 
 # --- Defining Classes that contain exit and enter functions ---
 
@@ -58,6 +80,29 @@ class DefineScopesAndSymbols(NimbleListener):
     def exitMain(self, ctx: NimbleParser.MainContext):
         self.current_scope = self.current_scope.enclosing_scope
 
+    def enterFuncDef(self, ctx: NimbleParser.FuncDefContext):
+        # Functions are defined here, in the first phase, so they may be called before their definition
+        name = ctx.ID().getText()
+        parameter_types = [TYPES[p.TYPE().getText()] for p in ctx.parameterDef()]
+        return_type = TYPES[ctx.TYPE().getText()] if ctx.TYPE() else PrimitiveType.Void
+        duplicate = self.current_scope.resolve_locally(name) is not None
+        if duplicate:
+            self.error_log.add(ctx, Category.DUPLICATE_NAME, "Function [{}] is already defined.", name)
+        else:
+            self.current_scope.define(name, FunctionType(parameter_types, return_type))
+        self.current_scope = self.current_scope.create_child_scope(function_scope_name(ctx, duplicate),
+                                                                   return_type)
+        for parameter, parameter_type in zip(ctx.parameterDef(), parameter_types):
+            parameter_name = parameter.ID().getText()
+            if self.current_scope.resolve_locally(parameter_name) is not None:
+                self.error_log.add(parameter, Category.DUPLICATE_NAME,
+                                   "Function [{}] already has a parameter named [{}].", name, parameter_name)
+            else:
+                self.current_scope.define(parameter_name, parameter_type, True)
+
+    def exitFuncDef(self, ctx: NimbleParser.FuncDefContext):
+        self.current_scope = self.current_scope.enclosing_scope
+
 
 class InferTypesAndCheckConstraints(NimbleListener):
     """
@@ -70,12 +115,23 @@ class InferTypesAndCheckConstraints(NimbleListener):
 
     Any semantic errors detected, e.g., undefined variable names,
     type mismatches, etc., are logged in the `error_log`
+
+    With `suppress_cascades`, errors that only follow from an error already logged,
+    e.g. an `INVALID_BINARY_OP` for an operator whose operand is of type ERROR, are
+    not logged; the node is still given type ERROR.
     """
 
-    def __init__(self, error_log: ErrorLog, global_scope: Scope, types: dict):
+    def __init__(self, error_log: ErrorLog, global_scope: Scope, types: dict, suppress_cascades=False):
         self.error_log = error_log
         self.current_scope = global_scope
         self.type_of = types
+        self.suppress_cascades = suppress_cascades
+        # Names of the functions whose definitions have been entered
+        self.functions_seen = set()
+
+    def is_cascade(self, *operands) -> bool:
+        """True if errors are suppressed when caused by an operand of type ERROR, and one is."""
+        return self.suppress_cascades and any(self.type_of.get(o) == PrimitiveType.ERROR for o in operands)
 
     # --------------------------------------------------------
     # Program structure
@@ -93,6 +149,19 @@ class InferTypesAndCheckConstraints(NimbleListener):
         # Change current_scope field from $main -> $global
         self.current_scope = self.current_scope.enclosing_scope
 
+    def enterFuncDef(self, ctx: NimbleParser.FuncDefContext):
+        # Change current_scope field from $global -> the function's scope, named as in the first phase
+        name = ctx.ID().getText()
+        self.current_scope = self.current_scope.child_scope_named(function_scope_name(ctx, name in self.functions_seen))
+        self.functions_seen.add(name)
+
+    def exitFuncDef(self, ctx: NimbleParser.FuncDefContext):
+        # A function returning a value must not be able to reach the end of its body
+        if self.current_scope.return_type != PrimitiveType.Void and not always_returns(ctx.body().block()):
+            self.error_log.add(ctx, Category.MISSING_RETURN, "Function [{}] can end without returning a {}.",
+                               ctx.ID(), self.current_scope.return_type.name)
+        self.current_scope = self.current_scope.enclosing_scope
+
     def exitBody(self, ctx: NimbleParser.BodyContext):
         # Doesn't need any semantic analysis or constraint checking.
         pass
@@ -111,20 +180,17 @@ class InferTypesAndCheckConstraints(NimbleListener):
     # --------------------------------------------------------
 
     def exitVarDec(self, ctx: NimbleParser.VarDecContext):
-        # Creating mini-lookup dictionary for verification
-        type_dict = {'Int': PrimitiveType.Int, 'Bool': PrimitiveType.Bool, 'String': PrimitiveType.String}
-
         # Extracting variable type declared, its primitive type,
         # and the ID declared
         var_text = ctx.TYPE().getText()
-        var_primtype = type_dict[var_text]
+        var_primtype = TYPES[var_text]
         this_ID = ctx.ID().getText()
 
         # First thing to check is if we're declaring a duplicated variable name. Set ERROR if so and stop function.
         if self.current_scope.resolve(this_ID) is not None:
             self.current_scope.define(this_ID, PrimitiveType.ERROR, False)
-            self.error_log.add(ctx, Category.DUPLICATE_NAME, f"Previously declared variable already has name"
-                                                             f"[{this_ID}]. No duplicates are allowed.")
+            self.error_log.add(ctx, Category.DUPLICATE_NAME, "Previously declared variable already has name"
+                                                             "[{}]. No duplicates are allowed.", this_ID)
             return
 
         # If no duplicate name, and if there was an assignment,
@@ -139,8 +205,9 @@ class InferTypesAndCheckConstraints(NimbleListener):
 
                 self.current_scope.define(this_ID, PrimitiveType.ERROR, False)
                 self.type_of[ctx] = PrimitiveType.ERROR
-                self.error_log.add(ctx, Category.ASSIGN_TO_WRONG_TYPE,
-                                   f"Can't assign {str(expr_type)} to variable of type {var_text}")
+                if not self.is_cascade(ctx.expr()):
+                    self.error_log.add(ctx, Category.ASSIGN_TO_WRONG_TYPE,
+                                       "Can't assign {} to variable of type {}", expr_type, var_text)
                 return
 
         # If all input conditions met, create the symbol with the inuptted typeset the variable type accordingly
@@ -161,30 +228,47 @@ class InferTypesAndCheckConstraints(NimbleListener):
 
         # Checking if variable under ID has been declared. If not, record the error
         if symbol is None:
-            self.error_log.add(ctx, Category.UNDEFINED_NAME, f"Can't assign value to undefined variable [{this_ID}]")
+            self.error_log.add(ctx, Category.UNDEFINED_NAME, "Can't assign value to undefined variable [{}]", this_ID)
             return
 
         # Otherwise, check if expr_type does not match variable type. If not, record the error
-        if symbol.type != expr_type:
-            self.error_log.add(ctx, Category.ASSIGN_TO_WRONG_TYPE, f"Can't assign value of type {expr_type} to variable"
-                                                                   f" [{this_ID}] of type {symbol.type}.")
+        if symbol.type != expr_type and not self.is_cascade(ctx.expr()):
+            self.error_log.add(ctx, Category.ASSIGN_TO_WRONG_TYPE, "Can't assign value of type {} to variable"
+                                                                   " [{}] of type {}.", expr_type, this_ID, symbol.type)
 
     def exitWhile(self, ctx: NimbleParser.WhileContext):
-        if self.type_of[ctx.expr()] != PrimitiveType.Bool:
-            self.error_log.add(ctx, Category.CONDITION_NOT_BOOL, f"Type {self.type_of[ctx.expr()]} is not of type bool")
+        if self.type_of[ctx.expr()] != PrimitiveType.Bool and not self.is_cascade(ctx.expr()):
+            self.error_log.add(ctx, Category.CONDITION_NOT_BOOL, "Type {} is not of type bool", self.type_of[ctx.expr()])
 
     def exitIf(self, ctx: NimbleParser.IfContext):
         # Simply check if the expr child is of type boolean. If not, record error
-        if self.type_of[ctx.expr()] != PrimitiveType.Bool:
-            self.error_log.add(ctx, Category.CONDITION_NOT_BOOL, f"if-statement condition [{ctx.expr().getText()}] "
-                                                                 f"can only be of type {PrimitiveType.Bool}, not "
-                                                                 f"{self.type_of[ctx.expr()]}.")
+        if self.type_of[ctx.expr()] != PrimitiveType.Bool and not self.is_cascade(ctx.expr()):
+            self.error_log.add(ctx, Category.CONDITION_NOT_BOOL, "if-statement condition [{}] "
+                                                                 "can only be of type {}, not {}.",
+                               ctx.expr(), PrimitiveType.Bool, self.type_of[ctx.expr()])
 
     def exitPrint(self, ctx: NimbleParser.PrintContext):
-        # If expression to print is of type ERROR, record accordingly in error log.
-        if self.type_of[ctx.expr()] == PrimitiveType.ERROR:
-            self.error_log.add(ctx, Category.UNPRINTABLE_EXPRESSION, f"Can't print expression of type "
-                                                                     f"{PrimitiveType.ERROR}.")
+        # If expression to print is of type ERROR, or a call of a Void function, record accordingly in error log.
+        if self.type_of[ctx.expr()] in (PrimitiveType.ERROR, PrimitiveType.Void) and not self.is_cascade(ctx.expr()):
+            self.error_log.add(ctx, Category.UNPRINTABLE_EXPRESSION, "Can't print expression of type {}.",
+                               self.type_of[ctx.expr()])
+
+    def exitReturn(self, ctx: NimbleParser.ReturnContext):
+        # The value returned, if any, must match the return type of the enclosing function or main
+        return_type = self.current_scope.return_type
+        if ctx.expr() is None:
+            if return_type != PrimitiveType.Void:
+                self.error_log.add(ctx, Category.INVALID_RETURN, "Must return a value of type {}.", return_type.name)
+        elif return_type == PrimitiveType.Void:
+            self.error_log.add(ctx, Category.INVALID_RETURN, "Can't return a value from [{}], which returns nothing.",
+                               self.current_scope.name)
+        elif self.type_of[ctx.expr()] != return_type and not self.is_cascade(ctx.expr()):
+            self.error_log.add(ctx, Category.INVALID_RETURN, "Can't return {} from a function returning {}.",
+                               self.type_of[ctx.expr()], return_type.name)
+
+    def exitFuncCallStmt(self, ctx: NimbleParser.FuncCallStmtContext):
+        # Any errors in the call are logged by exitFuncCall, and a statement may discard any value.
+        pass
 
     # --------------------------------------------------------
     # Expressions
@@ -205,12 +289,13 @@ class InferTypesAndCheckConstraints(NimbleListener):
         # If none, then error had occurred.
         else:
             self.type_of[ctx] = PrimitiveType.ERROR
-            self.error_log.add(ctx, Category.INVALID_NEGATION,
-                               f"Can't apply {ctx.op.text} to [{self.type_of[ctx].name}]")
+            if not self.is_cascade(ctx.expr()):
+                self.error_log.add(ctx, Category.INVALID_NEGATION,
+                                   "Can't apply {} to [{}]", ctx.op.text, self.type_of[ctx].name)
 
     def exitParens(self, ctx: NimbleParser.ParensContext):
         self.type_of[ctx] = self.type_of[ctx.expr()]
-        if self.type_of[ctx.expr()] == PrimitiveType.ERROR:
+        if self.type_of[ctx.expr()] == PrimitiveType.ERROR and not self.is_cascade(ctx.expr()):
             self.error_log.add(ctx, Category.INVALID_BINARY_OP, f"Parentheses contain expression of "
                                                                 f"type {PrimitiveType.ERROR}.")
 
@@ -221,9 +306,10 @@ class InferTypesAndCheckConstraints(NimbleListener):
             self.type_of[ctx] = PrimitiveType.Int
         else:
             self.type_of[ctx] = PrimitiveType.ERROR
-            self.error_log.add(ctx, Category.INVALID_BINARY_OP,
-                               f"Can't multiply or divide {self.type_of[ctx.expr(0)]} "
-                               f"with/by {self.type_of[ctx.expr(1)]}")
+            if not self.is_cascade(ctx.expr(0), ctx.expr(1)):
+                self.error_log.add(ctx, Category.INVALID_BINARY_OP,
+                                   "Can't multiply or divide {} with/by {}", self.type_of[ctx.expr(0)],
+                                   self.type_of[ctx.expr(1)])
 
     def exitAddSub(self, ctx: NimbleParser.AddSubContext):
         # If children types correct, set type of this token to Int
@@ -235,8 +321,9 @@ class InferTypesAndCheckConstraints(NimbleListener):
         # Otherwise, set as error.
         else:
             self.type_of[ctx] = PrimitiveType.ERROR
-            self.error_log.add(ctx, Category.INVALID_BINARY_OP,
-                               f"Can't apply {ctx.op.text} between non-integer type expression(s).")
+            if not self.is_cascade(ctx.expr(0), ctx.expr(1)):
+                self.error_log.add(ctx, Category.INVALID_BINARY_OP,
+                                   "Can't apply {} between non-integer type expression(s).", ctx.op.text)
 
     def exitCompare(self, ctx: NimbleParser.CompareContext):
         # Both left and right expressions must be integers. Results in a boolean type.
@@ -247,7 +334,34 @@ class InferTypesAndCheckConstraints(NimbleListener):
             self.type_of[ctx] = PrimitiveType.Bool
         else:
             self.type_of[ctx] = PrimitiveType.ERROR
-            self.error_log.add(ctx, Category.INVALID_BINARY_OP, f"Can't compare two non-integer type expressions.")
+            if not self.is_cascade(ctx.expr(0), ctx.expr(1)):
+                self.error_log.add(ctx, Category.INVALID_BINARY_OP, f"Can't compare two non-integer type expressions.")
+
+    def exitFuncCallExpr(self, ctx: NimbleParser.FuncCallExprContext):
+        self.type_of[ctx] = self.type_of[ctx.funcCall()]
+
+    def exitFuncCall(self, ctx: NimbleParser.FuncCallContext):
+        # The ID must name a function, called with arguments matching its parameters in number
+        # and type. The call has the function's return type, or ERROR if any of this isn't so.
+        this_ID = ctx.ID().getText()
+        symbol = self.current_scope.resolve(this_ID)
+        arguments = ctx.expr()
+        self.type_of[ctx] = PrimitiveType.ERROR
+
+        if symbol is None:
+            self.error_log.add(ctx, Category.UNDEFINED_NAME, "Function [{}] is undefined.", this_ID)
+        elif not isinstance(symbol.type, FunctionType):
+            self.error_log.add(ctx, Category.INVALID_CALL, "Can't call [{}], which is not a function.", this_ID)
+        elif len(arguments) != len(symbol.type.parameter_types):
+            self.error_log.add(ctx, Category.INVALID_CALL, "Function [{}] takes {} arguments, not {}.",
+                               this_ID, len(symbol.type.parameter_types), len(arguments))
+        elif any(self.type_of[a] != p for a, p in zip(arguments, symbol.type.parameter_types)):
+            if not self.is_cascade(*arguments):
+                self.error_log.add(ctx, Category.INVALID_CALL, "Function [{}] takes arguments of types {}, not {}.",
+                                   this_ID, [p.name for p in symbol.type.parameter_types],
+                                   [self.type_of[a].name for a in arguments])
+        else:
+            self.type_of[ctx] = symbol.type.return_type
 
     def exitVariable(self, ctx: NimbleParser.VariableContext):
         # Simply check if ID is an existing var, or non-error type var.
@@ -257,8 +371,14 @@ class InferTypesAndCheckConstraints(NimbleListener):
 
         if symbol is None or symbol.type == PrimitiveType.ERROR:
             self.type_of[ctx] = PrimitiveType.ERROR
-            self.error_log.add(ctx, Category.UNDEFINED_NAME,
-                               f"Variable [{this_ID}] is undefined.")
+            # A variable of type ERROR had its declaration error logged already
+            if symbol is None or not self.suppress_cascades:
+                self.error_log.add(ctx, Category.UNDEFINED_NAME,
+                                   "Variable [{}] is undefined.", this_ID)
+        elif isinstance(symbol.type, FunctionType):
+            # Functions are only called, never used as values
+            self.type_of[ctx] = PrimitiveType.ERROR
+            self.error_log.add(ctx, Category.UNDEFINED_NAME, "[{}] is a function, not a variable.", this_ID)
         else:
             self.type_of[ctx] = symbol.type
 
@@ -0,0 +1,412 @@
+"""
+Translates Nimble scripts into Python source, so they run as CPython bytecode
+with no interpretive layer.
+
+Each `funcDef` becomes a Python function and `main` becomes the function
+`_main`, called at the end of the generated module. Nimble parameters and
+variables become Python locals. Names are prefixed (`f_` for functions, `v_`
+for parameters and variables) so they can't clash with Python keywords or
+with the run-time support names, which all begin with an underscore.
+`print` writes to a `nimbleoutput.BufferedOutput`, which passes the text on
+in large chunks.
+
+The generated code has the run-time semantics of `nimbleinterpreter`:
+unbounded `Int`, `/` truncating towards zero, and `Bool` values printed as
+`true` or `false`. As with the interpreter, only scripts that pass semantic
+analysis are translated: the `Transpiler` requires the `type_of` map, and
+`translate`, and so `TranspileCache`, run `testhelpers.check_script`
+first, raising `SemanticErrors` for a script with errors. Expression types
+come from `type_of`, where it has an entry, and are inferred otherwise.
+
+`TranspileCache` keeps the compiled code objects on disk, keyed by a hash of
+the Nimble source and `TRANSLATOR_DIGEST`, a digest of the source of the
+transpiler and the analysis, so changing either makes every cached entry
+stale. Running a cached script skips lexing, parsing, analysis and
+translation entirely. Only scripts that passed analysis are cached, and an
+entry that doesn't load as a code object is deleted and translated afresh.
+
+Run with `python nimbletranspiler.py SCRIPT [--cache DIR] [--show]`.
+
+Version: 2026-10-19
+"""
+
+import argparse
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+import types
+
+import nimblesemantics
+import symboltable
+from generic_parser import parse
+from nimble import NimbleLexer, NimbleParser
+from nimbleinterpreter import CompileError, decode_string, divide
+from nimbleoutput import BufferedOutput
+from symboltable import FunctionType, PrimitiveType, Scope
+from testhelpers import SemanticErrors, check_script
+
+# Bump whenever the generated code, or what is accepted for translation, changes;
+# old cache entries are then ignored.
+FORMAT_VERSION = 2
+
+
+def _translator_digest():
+    """A digest of the source of the modules whose behaviour the cached code depends on."""
+    digest = hashlib.sha256()
+    for path in (__file__, nimblesemantics.__file__, symboltable.__file__):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+TRANSLATOR_DIGEST = _translator_digest()
+
+_TYPES = {'Int': PrimitiveType.Int, 'Bool': PrimitiveType.Bool, 'String': PrimitiveType.String}
+_INITIAL_VALUES = {PrimitiveType.Int: '0', PrimitiveType.Bool: 'False', PrimitiveType.String: "''"}
+_BINARY_OPERATORS = {'*': '*', '+': '+', '-': '-', '<': '<', '<=': '<=', '==': '=='}
+_INDENT = '    '
+
+
+class Transpiler:
+    """
+    Generates Python source from a Nimble parse tree. Each `translate...` method
+    translates one kind of context, named as in `NimbleListener`: statement methods
+    append lines to the output, and expression methods return the expression's Python
+    source together with its type.
+
+    :param type_of: The node types inferred by semantic analysis of the script, which
+        must have found no errors
+    :param tables: `nimbleoptimizer.SideTables` from the optimization passes, or None
+    """
+
+    def __init__(self, type_of, tables=None):
+        self.type_of = type_of
+        self.constant_value = tables.constant_value if tables else {}
+        self.replacement = tables.replacement if tables else {}
+        self.unreachable = tables.unreachable if tables else set()
+        self.global_scope = Scope('$global', None, None)
+        self.__lines = []
+        self.__depth = 0
+        self.__scope = None
+
+    def translate_script(self, ctx: NimbleParser.ScriptContext) -> str:
+        """Returns the Python source of a module that runs the script when executed."""
+        self.__lines = []
+        for func_def in ctx.funcDef():
+            self.declare_function(func_def)
+        for func_def in ctx.funcDef():
+            self.translateFuncDef(func_def)
+        self.translateMain(ctx.main())
+        self.__lines.append('_main()')
+        return '\n'.join(self.__lines) + '\n'
+
+    def declare_function(self, ctx: NimbleParser.FuncDefContext):
+        name = ctx.ID().getText()
+        if self.global_scope.resolve_locally(name) is not None:
+            raise CompileError(f'function {name} is defined more than once')
+        parameter_types = [_TYPES[p.TYPE().getText()] for p in ctx.parameterDef()]
+        return_type = _TYPES[ctx.TYPE().getText()] if ctx.TYPE() else PrimitiveType.Void
+        self.global_scope.define(name, FunctionType(parameter_types, return_type))
+
+    # ---------------------------------------------------------------------------------
+    # Program structure
+
+    def translateFuncDef(self, ctx: NimbleParser.FuncDefContext):
+        name = ctx.ID().getText()
+        symbol = self.global_scope.resolve_locally(name)
+        self.__scope = self.global_scope.create_child_scope(name, symbol.type.return_type)
+        for parameter in ctx.parameterDef():
+            parameter_name = parameter.ID().getText()
+            if self.__scope.resolve_locally(parameter_name) is not None:
+                raise CompileError(f'parameter {parameter_name} of {name} is defined more than once')
+            self.__scope.define(parameter_name, _TYPES[parameter.TYPE().getText()], is_param=True)
+        parameters = ', '.join(f'v_{p.name}' for p in self.__scope.parameters())
+        self.__emit(f'def f_{name}({parameters}):')
+        self.translateBody(ctx.body())
+
+    def translateMain(self, ctx: NimbleParser.MainContext):
+        self.__scope = self.global_scope.create_child_scope('$main', PrimitiveType.Void)
+        self.__emit('def _main():')
+        self.translateBody(ctx.body())
+
+    def translateBody(self, ctx: NimbleParser.BodyContext):
+        self.__depth += 1
+        for var_dec in ctx.varBlock().varDec():
+            self.translateVarDec(var_dec)
+        self.translateBlock(ctx.block())
+        self.__depth -= 1
+
+    def translateVarDec(self, ctx: NimbleParser.VarDecContext):
+        name = ctx.ID().getText()
+        if self.__scope.resolve_locally(name) is not None:
+            raise CompileError(f'line {ctx.start.line}: {name} is defined more than once')
+        declared_type = _TYPES[ctx.TYPE().getText()]
+        # The initial value is translated before the variable is in scope
+        value = self.translate_expr(ctx.expr())[0] if ctx.expr() else _INITIAL_VALUES[declared_type]
+        self.__scope.define(name, declared_type)
+        self.__emit(f'v_{name} = {value}')
+
+    def translateBlock(self, ctx: NimbleParser.BlockContext):
+        line_count = len(self.__lines)
+        for statement in ctx.statement():
+            if statement not in self.unreachable:
+                getattr(self, 'translate' + type(statement).__name__[:-len('Context')])(statement)
+        if len(self.__lines) == line_count:
+            self.__emit('pass')
+
+    # ---------------------------------------------------------------------------------
+    # Statements
+
+    def translateAssignment(self, ctx: NimbleParser.AssignmentContext):
+        self.__emit(f'{self.__variable(ctx.ID())} = {self.translate_expr(ctx.expr())[0]}')
+
+    def translateWhile(self, ctx: NimbleParser.WhileContext):
+        if self.__constant(ctx.expr()) is False:
+            return
+        self.__emit(f'while {self.translate_expr(ctx.expr())[0]}:')
+        self.__nested_block(ctx.block())
+
+    def translateIf(self, ctx: NimbleParser.IfContext):
+        constant = self.__constant(ctx.expr())
+        if constant is not None:
+            # Only the branch taken is translated, in line
+            taken = ctx.block(0) if constant else ctx.block(1)
+            if taken is not None:
+                self.translateBlock(taken)
+            return
+        self.__emit(f'if {self.translate_expr(ctx.expr())[0]}:')
+        self.__nested_block(ctx.block(0))
+        if ctx.block(1) is not None:
+            self.__emit('else:')
+            self.__nested_block(ctx.block(1))
+
+    def translatePrint(self, ctx: NimbleParser.PrintContext):
+        value, value_type = self.translate_expr(ctx.expr())
+        if value_type == PrimitiveType.Bool:
+            self.__emit(f"_emit('true\\n' if {value} else 'false\\n')")
+        elif value_type == PrimitiveType.String:
+            self.__emit(f"_emit({value} + '\\n')")
+        else:
+            self.__emit(f"_emit(str({value}) + '\\n')")
+
+    def translateReturn(self, ctx: NimbleParser.ReturnContext):
+        if ctx.expr() is None:
+            self.__emit('return')
+        else:
+            self.__emit(f'return {self.translate_expr(ctx.expr())[0]}')
+
+    def translateFuncCallStmt(self, ctx: NimbleParser.FuncCallStmtContext):
+        self.__emit(self.translateFuncCall(ctx.funcCall())[0])
+
+    # ---------------------------------------------------------------------------------
+    # Expressions
+
+    def translate_expr(self, ctx):
+        """Returns the Python source of the expression, and the expression's type."""
+        ctx = self.replacement.get(ctx, ctx)
+        if ctx in self.constant_value:
+            value = self.constant_value[ctx]
+            if isinstance(value, bool):
+                return repr(value), PrimitiveType.Bool
+            return f'({value})', PrimitiveType.Int
+        source, inferred_type = getattr(self, 'translate' + type(ctx).__name__[:-len('Context')])(ctx)
+        return source, self.type_of.get(ctx, inferred_type)
+
+    def translateParens(self, ctx: NimbleParser.ParensContext):
+        return self.translate_expr(ctx.expr())
+
+    def translateNeg(self, ctx: NimbleParser.NegContext):
+        operand = self.translate_expr(ctx.expr())[0]
+        if ctx.op.text == '-':
+            return f'(-{operand})', PrimitiveType.Int
+        return f'(not {operand})', PrimitiveType.Bool
+
+    def translateMulDiv(self, ctx: NimbleParser.MulDivContext):
+        if ctx.op.text == '/':
+            left, right = self.translate_expr(ctx.expr(0))[0], self.translate_expr(ctx.expr(1))[0]
+            return f'_divide({left}, {right})', PrimitiveType.Int
+        return self.__binary(ctx), PrimitiveType.Int
+
+    def translateAddSub(self, ctx: NimbleParser.AddSubContext):
+        return self.__binary(ctx), PrimitiveType.Int
+
+    def translateCompare(self, ctx: NimbleParser.CompareContext):
+        return self.__binary(ctx), PrimitiveType.Bool
+
+    def translateFuncCallExpr(self, ctx: NimbleParser.FuncCallExprContext):
+        return self.translateFuncCall(ctx.funcCall())
+
+    def translateVariable(self, ctx: NimbleParser.VariableContext):
+        source = self.__variable(ctx.ID())
+        return source, self.__scope.resolve_locally(ctx.ID().getText()).type
+
+    def translateStringLiteral(self, ctx: NimbleParser.StringLiteralContext):
+        return repr(decode_string(ctx.getText())), PrimitiveType.String
+
+    def translateIntLiteral(self, ctx: NimbleParser.IntLiteralContext):
+        return str(int(ctx.getText())), PrimitiveType.Int
+
+    def translateBoolLiteral(self, ctx: NimbleParser.BoolLiteralContext):
+        return ('True' if ctx.getText() == 'true' else 'False'), PrimitiveType.Bool
+
+    def translateFuncCall(self, ctx: NimbleParser.FuncCallContext):
+        name = ctx.ID().getText()
+        symbol = self.global_scope.resolve_locally(name)
+        if symbol is None:
+            raise CompileError(f'line {ctx.start.line}: {name} is not a defined function')
+        arguments = [self.translate_expr(e)[0] for e in ctx.expr()]
+        if len(arguments) != len(symbol.type.parameter_types):
+            raise CompileError(f'line {ctx.start.line}: {name} takes '
+                               f'{len(symbol.type.parameter_types)} arguments, not {len(arguments)}')
+        return f'f_{name}({", ".join(arguments)})', symbol.type.return_type
+
+    # ---------------------------------------------------------------------------------
+
+    def __emit(self, line):
+        self.__lines.append(_INDENT * self.__depth + line)
+
+    def __constant(self, ctx):
+        """The constant value of an expression, or None if it isn't constant."""
+        return self.constant_value.get(self.replacement.get(ctx, ctx))
+
+    def __nested_block(self, ctx):
+        self.__depth += 1
+        self.translateBlock(ctx)
+        self.__depth -= 1
+
+    def __variable(self, id_node):
+        name = id_node.getText()
+        if self.__scope.resolve_locally(name) is None:
+            raise CompileError(f'line {id_node.symbol.line}: {name} is not a defined variable')
+        return f'v_{name}'
+
+    def __binary(self, ctx):
+        left = self.translate_expr(ctx.expr(0))[0]
+        right = self.translate_expr(ctx.expr(1))[0]
+        return f'({left} {_BINARY_OPERATORS[ctx.op.text]} {right})'
+
+
+def translate(source) -> str:
+    """
+    Parses and analyzes a Nimble script and returns its Python translation; raises
+    `SyntaxErrors` if it doesn't parse, or `testhelpers.SemanticErrors` if it has
+    semantic errors.
+    """
+    tree = parse(source, 'script', NimbleLexer, NimbleParser)
+    return Transpiler(check_script(tree)).translate_script(tree)
+
+
+class TranspileCache:
+    """
+    Compiles Nimble scripts to Python code objects, caching them in memory and,
+    optionally, on disk.
+
+    :param directory: Directory for the on-disk cache, or None for memory only
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.__memory = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def code_for(self, source):
+        """
+        Returns the code object for the Nimble source, translating it only on a miss.
+        Raises `SyntaxErrors` or `testhelpers.SemanticErrors` if the source can't be
+        translated; nothing is cached for it.
+        """
+        key = self.__key(source)
+        code = self.__memory.get(key)
+        if code is not None:
+            self.hits += 1
+            return code
+        if self.directory is not None:
+            code = self.__load(self.__path(key))
+            if code is not None:
+                self.disk_hits += 1
+                self.__memory[key] = code
+                return code
+        self.misses += 1
+        code = compile(translate(source), '<nimble>', 'exec')
+        self.__memory[key] = code
+        if self.directory is not None:
+            # Write to a temporary file and rename, so concurrent runs never see a partial file
+            fd, temp_path = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump(code, f)
+            os.replace(temp_path, self.__path(key))
+        return code
+
+    def run(self, source, write=None):
+        """
+        Runs the Nimble script, once it has passed semantic analysis; raises
+        `testhelpers.SemanticErrors`, having run nothing, if it has errors.
+
+        :param write: Called with the script's printed text; by default `sys.stdout.write`
+        """
+        run_code(self.code_for(source), write)
+
+    @staticmethod
+    def __load(path):
+        """The code object stored at `path`, or None; an entry that isn't one is deleted."""
+        try:
+            with open(path, 'rb') as f:
+                code = marshal.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError, TypeError):
+            code = None
+        if isinstance(code, types.CodeType):
+            return code
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+    @staticmethod
+    def __key(source):
+        # Code objects are specific to the Python version, so it is part of the key
+        digest = hashlib.sha256()
+        digest.update(f'{FORMAT_VERSION}\0{TRANSLATOR_DIGEST}\0{sys.implementation.cache_tag}\0'.encode())
+        digest.update(source.encode())
+        return digest.hexdigest()
+
+    def __path(self, key):
+        return os.path.join(self.directory, f'{key}.nimblepyc')
+
+
+def run_code(code, write=None):
+    """
+    Executes a code object compiled from a `Transpiler` translation, as returned by
+    `TranspileCache.code_for`, and so of a script that passed semantic analysis.
+    """
+    with BufferedOutput(write) as output:
+        exec(code, {'__name__': '__nimble__', '_emit': output.write, '_divide': divide})
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Run a Nimble script as Python')
+    arg_parser.add_argument('script', help='path of the Nimble script to run')
+    arg_parser.add_argument('--cache', help='directory in which to cache compiled scripts')
+    arg_parser.add_argument('--show', action='store_true', help='print the Python translation instead')
+    args = arg_parser.parse_args()
+    with open(args.script) as f:
+        source = f.read()
+    try:
+        if args.show:
+            print(translate(source), end='')
+        else:
+            TranspileCache(args.cache).run(source)
+    except SemanticErrors as e:
+        sys.exit(f'{args.script} was not run, as it has semantic errors:\n{e.error_log}')
+
+
+if __name__ == '__main__':
+    main()
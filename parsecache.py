@@ -0,0 +1,189 @@
+"""
+Provides a content-addressed cache in front of `generic_parser.parse` and
+`testhelpers.do_semantic_analysis`, so that re-analyzing an unchanged Nimble
+source costs only a hash and a load.
+
+The cache has two tiers:
+
+- an in-memory LRU tier holding the live results (parse tree, `ErrorLog`,
+  global `Scope` and indexed types), and
+- an optional on-disk tier, holding the parse tree in the compact `treecodec`
+  format together with the logged errors and inferred types, so results survive
+  across processes and builds.
+
+Keys are SHA-256 digests of the source text, the start rule name, the kind
+of analysis requested and `ANALYZER_DIGEST`, a digest of the source of the
+analysis modules, so changing the analysis makes every cached result stale.
+Records that can't be loaded, for whatever reason, are deleted and computed
+afresh. Sources with syntax errors are never cached; the
+`SyntaxErrors` exception propagates to the caller exactly as it would from
+`generic_parser.parse`.
+
+Results returned from the cache are shared, not copied: callers must treat
+them as read-only.
+
+Version: 2026-10-19
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+
+import errorlog
+import nimblesemantics
+import symboltable
+import treecodec
+from errorlog import ErrorLog
+from generic_parser import parse
+from nimble import NimbleLexer, NimbleParser
+from testhelpers import analyze_tree, index
+
+# Bump whenever the on-disk record layout changes; old records are then ignored.
+FORMAT_VERSION = 2
+
+
+def _analyzer_digest():
+    """A digest of the source of the modules whose behaviour the cached analyses depend on."""
+    digest = hashlib.sha256()
+    for module in (nimblesemantics, symboltable, errorlog):
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+ANALYZER_DIGEST = _analyzer_digest()
+
+
+class ParseCache:
+    """
+    A two-tier cache of parse and semantic analysis results, keyed by source content.
+
+    :param directory: Directory for the on-disk tier, or None for memory only
+    :param capacity: Maximum number of results held in the in-memory tier
+    """
+
+    def __init__(self, directory=None, capacity=128):
+        self.directory = directory
+        self.capacity = capacity
+        self.__memory = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def parse(self, source, start_rule_name):
+        """
+        Returns the parse tree for the source, as `generic_parser.parse` would.
+        """
+        key = self.__key('parse', source, start_rule_name)
+        result = self.__lookup(key)
+        if result is None:
+            result = parse(source, start_rule_name, NimbleLexer, NimbleParser)
+            self.__store(key, result, _encode_tree(result, None, None))
+        return result
+
+    def do_semantic_analysis(self, source, start_rule_name, first_phase_only=False):
+        """
+        Returns `(error_log, global_scope, indexed_types)` for the source, as
+        `testhelpers.do_semantic_analysis` would.
+        """
+        kind = 'phase1' if first_phase_only else 'analysis'
+        key = self.__key(kind, source, start_rule_name)
+        result = self.__lookup(key)
+        if result is None:
+            tree = parse(source, start_rule_name, NimbleLexer, NimbleParser)
+            error_log, global_scope, node_types = analyze_tree(tree, first_phase_only)
+            result = error_log, global_scope, index(node_types)
+            self.__store(key, result, _encode_tree(tree, error_log, node_types, global_scope))
+        return result
+
+    def clear(self):
+        """Empties the in-memory tier. The on-disk tier is left untouched."""
+        self.__memory.clear()
+
+    # ---------------------------------------------------------------------------------
+
+    @staticmethod
+    def __key(kind, source, start_rule_name):
+        digest = hashlib.sha256()
+        digest.update(f'{FORMAT_VERSION}\0{ANALYZER_DIGEST}\0{kind}\0{start_rule_name}\0'.encode())
+        digest.update(source.encode())
+        return digest.hexdigest()
+
+    def __path(self, key):
+        return os.path.join(self.directory, f'{key}.nimblecache')
+
+    def __lookup(self, key):
+        if key in self.__memory:
+            self.__memory.move_to_end(key)
+            self.hits += 1
+            return self.__memory[key]
+        if self.directory is not None:
+            path = self.__path(key)
+            try:
+                with open(path, 'rb') as f:
+                    result = _decode_record(pickle.load(f))
+            except FileNotFoundError:
+                result = None
+            except Exception:
+                # A truncated, corrupt or outdated record is evicted, and recomputed by the caller
+                result = None
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            if result is not None:
+                self.disk_hits += 1
+                self.__remember(key, result)
+                return result
+        self.misses += 1
+        return None
+
+    def __store(self, key, result, record):
+        self.__remember(key, result)
+        if self.directory is not None:
+            # Write to a temporary file and rename, so concurrent builds never see a partial record
+            fd, temp_path = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.__path(key))
+
+    def __remember(self, key, result):
+        self.__memory[key] = result
+        self.__memory.move_to_end(key)
+        while len(self.__memory) > self.capacity:
+            self.__memory.popitem(last=False)
+
+
+# ---------------------------------------------------------------------------------
+
+# A record is a dictionary holding:
+#
+#  - 'tree': the parse tree, encoded by `treecodec.encode`;
+#  - 'errors': (node number, category, message) for each ErrorLog entry, or None for
+#    a parse-only record, where node numbers index the tree's nodes in preorder;
+#  - 'types': (node number, type) for each inferred node type;
+#  - 'scope': the global Scope.
+
+
+def _encode_tree(tree, error_log, node_types, global_scope=None):
+    record = {'tree': treecodec.encode(tree), 'errors': None, 'types': None, 'scope': global_scope}
+    if error_log is not None:
+        numbering = {node: i for i, node in enumerate(treecodec.preorder(tree))}
+        record['errors'] = [(numbering[e.ctx], e.category, e.message) for e in error_log.entries()]
+        record['types'] = [(numbering[ctx], t) for ctx, t in node_types.items()]
+    return record
+
+
+def _decode_record(record):
+    nodes = treecodec.decode_nodes(record['tree'])
+    if record['errors'] is None:
+        return nodes[0]
+    error_log = ErrorLog()
+    for number, category, message in record['errors']:
+        error_log.add(nodes[number], category, message)
+    node_types = {nodes[number]: t for number, t in record['types']}
+    return error_log, record['scope'], index(node_types)
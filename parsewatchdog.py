@@ -0,0 +1,154 @@
+"""
+Guards parsing against pathological inputs.
+
+Some inputs make ANTLR's adaptive prediction slow, e.g. long operator chains
+that defeat the DFA cache and send `ParserATNSimulator.closure_` and
+`PredictionContext.merge` through large configuration sets. Others, such as
+deeply nested parentheses, recurse deep enough to raise `RecursionError`.
+Either lets a single file tie up, or crash, a shared analysis server.
+
+`WatchdogATNSimulator` takes the place of a parser's `ParserATNSimulator`
+and enforces a `ParseBudget`:
+
+- `decision_seconds`: the time of any one `adaptivePredict` call;
+- `total_seconds`: the time spent in prediction over the whole parse;
+- `max_depth`: the depth of the rule context stack at a decision.
+
+When a budget is exceeded it raises `BudgetExceeded`, giving the decision
+and the span of tokens it was predicting over. `generic_parser.parse` takes
+a `budget`, installs the watchdog and turns `BudgetExceeded` into a syntax
+error at the start of the span, raising `SyntaxErrors` as for any other.
+
+The watchdog also records, for each decision, the number of predictions and
+their total and longest times, in its `decision_stats`.
+
+Version: 2026-10-19
+"""
+
+import time
+from dataclasses import dataclass
+
+from antlr4.atn.ParserATNSimulator import ParserATNSimulator
+
+# Closure steps between checks of the clock
+_CHECK_INTERVAL = 256
+
+
+@dataclass(frozen=True)
+class ParseBudget:
+    """Limits on a parse; None is no limit."""
+    decision_seconds: float = 0.25
+    total_seconds: float = None
+    max_depth: int = 300
+
+
+# The budget for parses of untrusted source, e.g. in `analysisservice`
+DEFAULT_BUDGET = ParseBudget()
+
+
+@dataclass
+class DecisionStats:
+    predictions: int = 0
+    seconds: float = 0.0
+    longest: float = 0.0
+
+
+class BudgetExceeded(Exception):
+    """
+    Raised when a parse exceeds its `ParseBudget`.
+
+    :param message: Which budget was exceeded, and by how much
+    :param decision: The number of the ATN decision being predicted
+    :param start: The first token of the span being predicted over
+    :param stop: The last token read, so far, in predicting
+    """
+
+    def __init__(self, message, decision, start, stop):
+        super().__init__(message)
+        self.message = message
+        self.decision = decision
+        self.start = start
+        self.stop = stop
+
+    def span(self):
+        """The ((line, column), (line, column)) span of the tokens, end exclusive."""
+        return ((self.start.line, self.start.column),
+                (self.stop.line, self.stop.column + len(self.stop.text or '')))
+
+
+class WatchdogATNSimulator(ParserATNSimulator):
+    """
+    A `ParserATNSimulator` raising `BudgetExceeded` when prediction exceeds a budget.
+
+    :param parser: The parser the simulator is for
+    :param budget: The `ParseBudget` to enforce
+    """
+
+    def __init__(self, parser, budget: ParseBudget = DEFAULT_BUDGET):
+        super().__init__(parser, parser.atn, parser.decisionsToDFA, parser.sharedContextCache)
+        self.budget = budget
+        self.decision_stats = {}
+        self.seconds = 0.0
+        self.__decision = None
+        self.__deadline = None
+        self.__reason = None
+        self.__steps = 0
+
+    def adaptivePredict(self, input, decision, outerContext):
+        if self.budget.max_depth is not None:
+            self.__check_depth(input, decision, outerContext)
+        start = time.perf_counter()
+        self.__deadline, self.__reason = None, None
+        if self.budget.decision_seconds is not None:
+            self.__deadline = start + self.budget.decision_seconds
+            self.__reason = f'Predicting decision {decision} took more than {self.budget.decision_seconds:g} s'
+        if self.budget.total_seconds is not None and \
+                (self.__deadline is None or start + self.budget.total_seconds - self.seconds < self.__deadline):
+            self.__deadline = start + self.budget.total_seconds - self.seconds
+            self.__reason = f'Parsing took more than {self.budget.total_seconds:g} s'
+        self.__decision = decision
+        start_index = input.index
+        try:
+            prediction = super().adaptivePredict(input, decision, outerContext)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.seconds += elapsed
+            stats = self.decision_stats.get(decision)
+            if stats is None:
+                stats = self.decision_stats[decision] = DecisionStats()
+            stats.predictions += 1
+            stats.seconds += elapsed
+            stats.longest = max(stats.longest, elapsed)
+        # Predictions that never took a closure step are checked once they're done
+        if self.__deadline is not None and start + elapsed > self.__deadline:
+            self.__exceeded(input, start_index, input.index)
+        return prediction
+
+    def closure_(self, config, configs, closureBusy, collectPredicates, fullCtx, depth, treatEofAsEpsilon):
+        self.__steps += 1
+        if self.__steps >= _CHECK_INTERVAL and self.__deadline is not None:
+            self.__steps = 0
+            if time.perf_counter() > self.__deadline:
+                input = self._input
+                self.__exceeded(input, self._startIndex, input.index)
+        super().closure_(config, configs, closureBusy, collectPredicates, fullCtx, depth, treatEofAsEpsilon)
+
+    def __check_depth(self, input, decision, outerContext):
+        depth = 0
+        ctx = outerContext
+        while ctx is not None:
+            depth += 1
+            if depth > self.budget.max_depth:
+                raise BudgetExceeded(f'Rules nested more than {self.budget.max_depth} deep',
+                                     decision, outerContext.start, input.LT(1))
+            ctx = ctx.parentCtx
+
+    def __exceeded(self, input, start_index, stop_index):
+        raise BudgetExceeded(self.__reason, self.__decision, input.get(start_index),
+                             input.get(max(start_index, stop_index)))
+
+
+def install_watchdog(parser, budget: ParseBudget = DEFAULT_BUDGET) -> WatchdogATNSimulator:
+    """Replaces the parser's ATN simulator with a `WatchdogATNSimulator`, and returns it."""
+    parser._interp = WatchdogATNSimulator(parser, budget)
+    return parser._interp
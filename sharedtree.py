@@ -0,0 +1,406 @@
+"""
+Zero-copy transfer of Nimble parse trees to worker processes, using
+`multiprocessing.shared_memory`.
+
+The owning process flattens a parse tree, and the tokens it refers to, into a
+single shared memory block with `SharedTree`. Only the block's name and size
+(a `SharedTreeDescriptor`) cross the process boundary. A worker attaches to
+the block with `SharedTreeView`, which presents the flattened tree as
+lightweight read-only views: view classes subclass the generated
+`NimbleParser.*Context` classes, so the accessors (`expr()`, `ID()`, ...), the
+`enterRule`/`exitRule` dispatch used by `ParseTreeWalker`, and the `op` labels
+used by the `NimbleListener` callbacks in `nimblesemantics` all work
+unchanged. Fields are read from the shared buffer on demand; nothing is
+unpickled and no token text is decoded until it is asked for.
+
+Typical use, with a `multiprocessing` pool:
+
+    with SharedTree(tree) as shared:
+        results = pool.map(analyze_shared, [shared.descriptor])
+    error_log, global_scope, node_types = collect(tree, results[0])
+
+Nodes are numbered in preorder, the same numbering as `treecodec.preorder`,
+which is how results computed on views are mapped back onto the owner's tree.
+
+Layout of the block (native int32 values, then a UTF-8 string blob):
+
+    header    magic, node count, token count, child count, label count, blob size
+    nodes     per node: kind (0 terminal, r+1 rule index r), alternative,
+              invokingState, parent, start token, stop token,
+              first child, child count, first label, label count
+    tokens    per token: tokenIndex, type, channel, start, stop, line, column,
+              text offset, text length
+    children  node numbers, each node's children contiguous
+    labels    per label: name offset, name length, token
+    blob      token texts and label names
+
+Token references are positions in the token table, or -1 for None; a
+terminal's token is stored in its start field.
+
+Version: 2026-10-19
+"""
+
+from array import array
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+
+import treecodec
+from antlr4.Token import CommonToken, Token
+from antlr4.tree.Tree import TerminalNodeImpl
+from errorlog import ErrorLog
+from testhelpers import analyze_tree
+
+_MAGIC = 0x4E534854  # 'NSHT'
+_HEADER_FIELDS = 6
+_NODE_FIELDS = 10
+_TOKEN_FIELDS = 9
+_LABEL_FIELDS = 3
+_ITEM_SIZE = array('i').itemsize
+
+# Node field offsets
+_KIND, _ALT, _INVOKING_STATE, _PARENT, _START, _STOP, _FIRST_CHILD, _CHILD_COUNT, \
+    _FIRST_LABEL, _LABEL_COUNT = range(_NODE_FIELDS)
+
+# Token field offsets
+_TOKEN_INDEX, _TYPE, _CHANNEL, _CHAR_START, _CHAR_STOP, _LINE, _COLUMN, _TEXT_OFFSET, \
+    _TEXT_LENGTH = range(_TOKEN_FIELDS)
+
+
+@dataclass(frozen=True)
+class SharedTreeDescriptor:
+    """The picklable handle sent to workers: everything needed to attach to a SharedTree."""
+    name: str
+    size: int
+
+
+class SharedTree:
+    """
+    Owns a shared memory block holding a flattened copy of a parse tree. The block
+    is released when the SharedTree is closed, or on leaving a `with` block; any
+    worker views must have been closed first.
+    """
+
+    def __init__(self, tree):
+        data = _flatten(tree)
+        self.__memory = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        self.__memory.buf[:len(data)] = data
+        self.descriptor = SharedTreeDescriptor(self.__memory.name, len(data))
+
+    def close(self):
+        if self.__memory is not None:
+            self.__memory.close()
+            self.__memory.unlink()
+            self.__memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SharedTreeView:
+    """
+    Attaches to a SharedTree block from any process. `root` is a read-only view of
+    the tree's root node. Views must not be used after the SharedTreeView is closed.
+    """
+
+    def __init__(self, descriptor: SharedTreeDescriptor):
+        self.__memory = _attach(descriptor.name)
+        buffer = self.__memory.buf[:descriptor.size]
+        header_bytes = _HEADER_FIELDS * _ITEM_SIZE
+        header = buffer[:header_bytes].cast('i')
+        magic, node_count, token_count, child_count, label_count, blob_size = header
+        header.release()
+        if magic != _MAGIC:
+            buffer.release()
+            self.__memory.close()
+            raise ValueError('shared memory block does not hold a Nimble parse tree')
+
+        self.__sections = []
+        offset = header_bytes
+        self.nodes, offset = self.__section(buffer, offset, node_count * _NODE_FIELDS)
+        self.tokens, offset = self.__section(buffer, offset, token_count * _TOKEN_FIELDS)
+        self.children, offset = self.__section(buffer, offset, child_count)
+        self.labels, offset = self.__section(buffer, offset, label_count * _LABEL_FIELDS)
+        self.blob = buffer[offset:offset + blob_size]
+        self.__sections.extend([self.blob, buffer])
+
+        self.__node_views = {}
+        self.__token_views = {}
+        self.root = self.node(0)
+
+    def __section(self, buffer, offset, length):
+        end = offset + length * _ITEM_SIZE
+        section = buffer[offset:end].cast('i')
+        self.__sections.append(section)
+        return section, end
+
+    def node(self, number):
+        """Returns the (unique) view of the node with the given preorder number."""
+        view = self.__node_views.get(number)
+        if view is None:
+            base = number * _NODE_FIELDS
+            kind = self.nodes[base + _KIND]
+            if kind == 0:
+                view = _TerminalView(self, number)
+            else:
+                view_class = _VIEW_CLASSES[kind - 1][self.nodes[base + _ALT]]
+                # Views are never initialised as contexts: every field comes from the buffer
+                view = view_class.__new__(view_class)
+                view._tree = self
+                view._number = number
+            self.__node_views[number] = view
+        return view
+
+    def token(self, reference):
+        """Returns the (unique) view of the token at the given position, or None for -1."""
+        if reference < 0:
+            return None
+        view = self.__token_views.get(reference)
+        if view is None:
+            view = self.__token_views[reference] = _TokenView(self, reference)
+        return view
+
+    def text(self, offset, length):
+        return str(self.blob[offset:offset + length], 'utf-8')
+
+    def close(self):
+        self.__node_views.clear()
+        self.__token_views.clear()
+        self.root = None
+        for section in self.__sections:
+            section.release()
+        self.__sections.clear()
+        self.__memory.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# ---------------------------------------------------------------------------------
+# Running analysis in a worker
+
+
+def analyze_shared(descriptor: SharedTreeDescriptor, first_phase_only=False):
+    """
+    Runs both semantic analysis phases over a shared tree; intended to be called in a
+    worker process. Returns a picklable result for `collect`: the logged errors as
+    (node number, category, message) triples, the inferred types as (node number,
+    type) pairs, and the global scope.
+    """
+    with SharedTreeView(descriptor) as view:
+        error_log, global_scope, node_types = analyze_tree(view.root, first_phase_only)
+        errors = [(e.ctx._number, e.category, e.message) for e in error_log.entries()]
+        types = [(ctx._number, t) for ctx, t in node_types.items()]
+        # Drop every reference to the views before the block is closed
+        del error_log, node_types
+    return errors, global_scope, types
+
+
+def collect(tree, result):
+    """
+    Maps a result from `analyze_shared` back onto the owner's tree, returning
+    `(error_log, global_scope, node_types)` as `testhelpers.analyze_tree` would.
+    """
+    errors, global_scope, types = result
+    nodes = treecodec.preorder(tree)
+    error_log = ErrorLog()
+    for number, category, message in errors:
+        error_log.add(nodes[number], category, message)
+    return error_log, global_scope, {nodes[number]: t for number, t in types}
+
+
+# ---------------------------------------------------------------------------------
+# Views
+
+
+class _RuleView:
+    """
+    Mixed in ahead of a generated context class, replacing its stored fields with
+    properties read from the shared buffer.
+    """
+
+    @property
+    def parentCtx(self):
+        parent = self._tree.nodes[self._number * _NODE_FIELDS + _PARENT]
+        return None if parent < 0 else self._tree.node(parent)
+
+    @property
+    def invokingState(self):
+        return self._tree.nodes[self._number * _NODE_FIELDS + _INVOKING_STATE]
+
+    @property
+    def start(self):
+        return self._tree.token(self._tree.nodes[self._number * _NODE_FIELDS + _START])
+
+    @property
+    def stop(self):
+        return self._tree.token(self._tree.nodes[self._number * _NODE_FIELDS + _STOP])
+
+    @property
+    def children(self):
+        children = self.__dict__.get('_children')
+        if children is None:
+            base = self._number * _NODE_FIELDS
+            first = self._tree.nodes[base + _FIRST_CHILD]
+            count = self._tree.nodes[base + _CHILD_COUNT]
+            if count == 0:
+                return None
+            node = self._tree.node
+            children = self.__dict__['_children'] = \
+                [node(n) for n in self._tree.children[first:first + count]]
+        return children
+
+    exception = None
+    parser = None
+
+    def __getattr__(self, name):
+        # Only reached for attributes not found normally: labelled tokens such as `op`
+        tree = self.__dict__.get('_tree')
+        if tree is None:
+            raise AttributeError(name)
+        base = self._number * _NODE_FIELDS
+        first = tree.nodes[base + _FIRST_LABEL]
+        for label in range(first, first + tree.nodes[base + _LABEL_COUNT]):
+            offset, length, token = tree.labels[label * _LABEL_FIELDS:(label + 1) * _LABEL_FIELDS]
+            if tree.text(offset, length) == name:
+                return tree.token(token)
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name in ('_tree', '_number', '_children'):
+            self.__dict__[name] = value
+        else:
+            raise AttributeError(f'shared parse tree views are read-only: cannot set {name}')
+
+
+class _TerminalView(TerminalNodeImpl):
+    __slots__ = ('_tree', '_number')
+
+    def __init__(self, tree, number):
+        object.__setattr__(self, '_tree', tree)
+        object.__setattr__(self, '_number', number)
+
+    @property
+    def symbol(self):
+        return self._tree.token(self._tree.nodes[self._number * _NODE_FIELDS + _START])
+
+    @property
+    def parentCtx(self):
+        return self._tree.node(self._tree.nodes[self._number * _NODE_FIELDS + _PARENT])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'shared parse tree views are read-only: cannot set {name}')
+
+
+class _TokenView(Token):
+    __slots__ = ('_tree', '_reference')
+
+    def __init__(self, tree, reference):
+        object.__setattr__(self, '_tree', tree)
+        object.__setattr__(self, '_reference', reference)
+
+    def __field(self, field):
+        return self._tree.tokens[self._reference * _TOKEN_FIELDS + field]
+
+    tokenIndex = property(lambda self: self.__field(_TOKEN_INDEX))
+    type = property(lambda self: self.__field(_TYPE))
+    channel = property(lambda self: self.__field(_CHANNEL))
+    start = property(lambda self: self.__field(_CHAR_START))
+    stop = property(lambda self: self.__field(_CHAR_STOP))
+    line = property(lambda self: self.__field(_LINE))
+    column = property(lambda self: self.__field(_COLUMN))
+    source = CommonToken.EMPTY_SOURCE
+
+    @property
+    def text(self):
+        return self._tree.text(self.__field(_TEXT_OFFSET), self.__field(_TEXT_LENGTH))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'shared parse tree views are read-only: cannot set {name}')
+
+    def __str__(self):
+        return self.text
+
+
+def _view_classes():
+    """A view class for every generated context class, indexed like treecodec's table."""
+    return {rule_index: [type(c.__name__.replace('Context', 'View'), (_RuleView, c), {})
+                         for c in classes]
+            for rule_index, classes in treecodec._ALTERNATIVES.items()}
+
+
+_VIEW_CLASSES = _view_classes()
+
+
+# ---------------------------------------------------------------------------------
+# Flattening
+
+
+def _flatten(tree):
+    nodes = treecodec.preorder(tree)
+    numbering = {node: i for i, node in enumerate(nodes)}
+    blob = bytearray()
+    blob_offsets = {}
+    tokens = {}
+
+    def blob_reference(text):
+        reference = blob_offsets.get(text)
+        if reference is None:
+            data = text.encode('utf-8')
+            reference = blob_offsets[text] = (len(blob), len(data))
+            blob.extend(data)
+        return reference
+
+    def token_reference(token):
+        if token is None:
+            return -1
+        return tokens.setdefault(token.tokenIndex, (len(tokens), token))[0]
+
+    node_fields = array('i')
+    children = array('i')
+    labels = array('i')
+    for node in nodes:
+        parent = numbering.get(node.parentCtx, -1)
+        if isinstance(node, TerminalNodeImpl):
+            node_fields.extend((0, 0, -1, parent, token_reference(node.symbol), -1, 0, 0, 0, 0))
+            continue
+        rule_index, alt = treecodec._CODES[type(node)]
+        first_child = len(children)
+        children.extend(numbering[child] for child in node.children or [])
+        first_label = len(labels) // _LABEL_FIELDS
+        for name, value in getattr(node, '__dict__', {}).items():
+            if isinstance(value, CommonToken):
+                labels.extend(blob_reference(name) + (token_reference(value),))
+        node_fields.extend((rule_index + 1, alt, node.invokingState, parent,
+                            token_reference(node.start), token_reference(node.stop),
+                            first_child, len(children) - first_child,
+                            first_label, len(labels) // _LABEL_FIELDS - first_label))
+
+    token_fields = array('i')
+    for _, token in tokens.values():
+        token_fields.extend((token.tokenIndex, token.type, token.channel, token.start, token.stop,
+                             token.line, token.column) + blob_reference(token.text))
+
+    header = array('i', (_MAGIC, len(nodes), len(tokens), len(children),
+                         len(labels) // _LABEL_FIELDS, len(blob)))
+    return b''.join((header.tobytes(), node_fields.tobytes(), token_fields.tobytes(),
+                     children.tobytes(), labels.tobytes(), bytes(blob)))
+
+
+def _attach(name):
+    """
+    Attaches to an existing block without asking this process's resource tracker to
+    clean it up; the owning SharedTree is responsible for unlinking it.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no `track` parameter. Attaching registers the name again,
+        # but multiprocessing workers share the owner's resource tracker, for which
+        # a repeated registration is harmless.
+        return shared_memory.SharedMemory(name=name)
@@ -0,0 +1,219 @@
+"""
+Runs the data-driven semantic analysis cases in `testcases_header` in
+parallel, timing each case.
+
+Every case is one row of a table such as `VALID_EXPRESSIONS` or
+`INVALID_PRINT`, checked as `testcases.TypeTests` checks it. The cases are
+split into one shard per worker process. Each worker is warmed up on start
+(see `testhelpers.warm_up`), so the parser's DFA cache, which every
+`NimbleParser` in a process shares, is already populated when its shard
+runs. With one worker the cases run in this process, warmed up the same way.
+
+Run with `python tablerunner.py [--workers N] [--slowest N]`; the exit status
+is 1 if any case fails.
+
+Version: 2026-10-19
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from errorlog import Category
+from generic_parser import parse
+from nimble import NimbleLexer, NimbleParser
+from symboltable import PrimitiveType
+from testhelpers import analyze_tree, warm_up
+import testcases_header as tc
+
+
+@dataclass
+class CaseResult:
+    """The outcome of one case: the table and row it came from, and how long it took."""
+    table: str
+    index: int
+    failure: str
+    seconds: float
+
+    @property
+    def passed(self):
+        return self.failure is None
+
+
+# ---------------------------------------------------------------------------------
+# Checks
+#
+# A check takes a table row and returns None if it passes, or a description of the failure.
+
+def _analyze(source, rule='script'):
+    tree = parse(source, rule, NimbleLexer, NimbleParser)
+    error_log, global_scope, node_types = analyze_tree(tree)
+    return tree, error_log, global_scope, node_types
+
+
+def _on_some_line(error_log, category, source):
+    return any(error_log.includes_on_line(category, i) for i in range(1, len(source.splitlines()) + 1))
+
+
+def _symbol_type(global_scope, variable):
+    symbol = global_scope.child_scope_named('$main').resolve(variable)
+    return symbol.type if symbol is not None else None
+
+
+def _check_valid_expression(row):
+    expression, expected_type = row
+    tree, error_log, _, node_types = _analyze(expression, 'expr')
+    if node_types.get(tree) != expected_type:
+        return f'{expression} has type {node_types.get(tree)}, not {expected_type}'
+    if error_log.total_entries():
+        return f'{expression} has errors:\n{error_log}'
+
+
+def _check_invalid_expression(row):
+    expression, expected_category = row
+    tree, error_log, _, node_types = _analyze(expression, 'expr')
+    if node_types.get(tree) != PrimitiveType.ERROR:
+        return f'{expression} has type {node_types.get(tree)}, not ERROR'
+    if not error_log.includes_exactly(expected_category, 1, expression):
+        return f'{expression} has no {expected_category} error'
+
+
+def _check_valid_symbol(row):
+    source, variable, expected_type = row
+    _, error_log, global_scope, _ = _analyze(source)
+    if error_log.total_entries():
+        return f'{source!r} has errors:\n{error_log}'
+    if _symbol_type(global_scope, variable) != expected_type:
+        return f'{variable} has type {_symbol_type(global_scope, variable)}, not {expected_type}'
+
+
+def _check_invalid_vardec(row):
+    source, variable, expected_category = row
+    _, error_log, global_scope, _ = _analyze(source)
+    if _symbol_type(global_scope, variable) != PrimitiveType.ERROR:
+        return f'{variable} has type {_symbol_type(global_scope, variable)}, not ERROR'
+    if not _on_some_line(error_log, expected_category, source):
+        return f'{source!r} has no {expected_category} error'
+
+
+def _check_invalid_variable(source):
+    _, error_log, _, _ = _analyze(source)
+    if not _on_some_line(error_log, Category.UNDEFINED_NAME, source):
+        return f'{source!r} has no UNDEFINED_NAME error'
+
+
+def _check_no_errors(source):
+    _, error_log, _, _ = _analyze(source)
+    if error_log.total_entries():
+        return f'{source!r} has errors:\n{error_log}'
+
+
+def _check_invalid_print(row):
+    source, expected_categories = row
+    _, error_log, _, _ = _analyze(source)
+    if error_log.total_entries() != len(expected_categories):
+        return f'{source!r} has {error_log.total_entries()} errors, not {len(expected_categories)}'
+    missing = [c for c in expected_categories if not error_log.includes_on_line(c, 1)]
+    if missing:
+        return f'{source!r} has no {missing[0]} error'
+
+
+def _check_invalid_assignment(row):
+    source, expected_category = row
+    _, error_log, _, _ = _analyze(source)
+    if not _on_some_line(error_log, expected_category, source):
+        return f'{source!r} has no {expected_category} error'
+
+
+def _check_invalid_condition(source):
+    _, error_log, _, _ = _analyze(source)
+    if not _on_some_line(error_log, Category.CONDITION_NOT_BOOL, source):
+        return f'{source!r} has no CONDITION_NOT_BOOL error'
+
+
+# Table name -> the check for each of its rows
+CHECKS = {
+    'VALID_EXPRESSIONS': _check_valid_expression,
+    'INVALID_EXPRESSIONS': _check_invalid_expression,
+    'VALID_VARDEC': _check_valid_symbol,
+    'INVALID_VARDEC': _check_invalid_vardec,
+    'VALID_VARIABLE': _check_valid_symbol,
+    'INVALID_VARIABLE': _check_invalid_variable,
+    'VALID_PRINT': _check_no_errors,
+    'INVALID_PRINT': _check_invalid_print,
+    'VALID_ASSIGNMENT': _check_valid_symbol,
+    'INVALID_ASSIGNMENT': _check_invalid_assignment,
+    'VALID_WHILE': _check_no_errors,
+    'INVALID_WHILE': _check_invalid_condition,
+    'VALID_IF': _check_no_errors,
+    'INVALID_IF': _check_invalid_condition,
+    'VALID_FUNCTIONS': _check_no_errors,
+    'INVALID_FUNCTIONS': _check_invalid_assignment,
+}
+
+
+# ---------------------------------------------------------------------------------
+# Running
+
+def all_cases():
+    """Returns every case as a (table name, row index) pair."""
+    return [(table, i) for table in CHECKS for i in range(len(getattr(tc, table)))]
+
+
+def run_shard(cases):
+    """Runs the given cases in this process, returning their `CaseResult`s."""
+    results = []
+    for table, index in cases:
+        row = getattr(tc, table)[index]
+        start = time.perf_counter()
+        try:
+            failure = CHECKS[table](row)
+        except Exception as e:
+            failure = f'{type(e).__name__}: {e}'
+        results.append(CaseResult(table, index, failure, time.perf_counter() - start))
+    return results
+
+
+def run_cases(cases=None, workers=None):
+    """
+    Runs the cases, by default all of them, sharded across `workers` processes (by
+    default one per CPU), and returns their `CaseResult`s in the order of `cases`.
+    """
+    cases = all_cases() if cases is None else list(cases)
+    workers = min(workers or os.cpu_count() or 1, len(cases)) or 1
+    if workers == 1:
+        warm_up()
+        return run_shard(cases)
+    # Interleaved shards spread each table, and its cost, across the workers
+    shards = [cases[i::workers] for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_up) as executor:
+        shard_results = list(executor.map(run_shard, shards))
+    results = [None] * len(cases)
+    for i, shard in enumerate(shard_results):
+        results[i::workers] = shard
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Run the testcases_header tables in parallel')
+    arg_parser.add_argument('--workers', type=int, help='number of worker processes; by default one per CPU')
+    arg_parser.add_argument('--slowest', type=int, default=5, help='number of slowest cases to report')
+    args = arg_parser.parse_args()
+    start = time.perf_counter()
+    results = run_cases(workers=args.workers)
+    elapsed = time.perf_counter() - start
+    failures = [r for r in results if not r.passed]
+    for result in failures:
+        print(f'FAIL {result.table}[{result.index}]: {result.failure}')
+    for result in sorted(results, key=lambda r: r.seconds, reverse=True)[:args.slowest]:
+        print(f'{result.seconds * 1000:8.3f} ms  {result.table}[{result.index}]')
+    print(f'{len(results) - len(failures)} of {len(results)} cases passed in {elapsed:.3f} s '
+          f'({sum(r.seconds for r in results):.3f} s of checks)')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -42,12 +42,44 @@ Notes:
 
 # --- Importing Modules ---
 
+import asyncio
+import io
+import json
+import marshal
+import os
+import pickle
 import sys
+import tempfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
+from antlr4 import CommonTokenStream, InputStream
+from antlr4.atn.ATNConfigSet import ATNConfigSet
+
+import sharedtree
+import treecodec
+from analysisservice import AnalysisService, analyze_source
+from benchgate import compare, report
+from diagnosticexport import export_file
 from errorlog import Category
+from generic_parser import SyntaxErrors, parse
+from nimblebench import STAGES, generate_program, load_results, run_benchmark, store_result
+from nimblefuzz import GrammarFuzzer, fuzz
+from nimbleinterpreter import CompileError, Compiler, NimbleRuntimeError, Rope, compile_source, concatenate
+from nimbleir import RegisterVM, StackCompiler, StackVM, lower_script, optimize
+from nimblememory import profile_memory, report as memory_report
+from nimblelsp import IncrementalDocument
+from nimbleoutput import BufferedOutput, MemorySink, open_output
+from nimbleoptimizer import PruningWalker, fold_constants, mark_unreachable, pure_functions
+from nimblesemantics import InferTypesAndCheckConstraints
+from nimbletranspiler import TranspileCache
+from nimble import NimbleLexer, NimbleParser
+from parsecache import ParseCache
+from parsewatchdog import BudgetExceeded, ParseBudget, install_watchdog
 from symboltable import PrimitiveType
-from testhelpers import do_semantic_analysis, pretty_types
+from tablerunner import CHECKS, run_cases
+from testhelpers import SemanticErrors, analyze_tree, check_script, do_semantic_analysis, pretty_types
 import testcases_header as tc
 
 
@@ -286,3 +318,703 @@ class TypeTests(unittest.TestCase):
         """ Wrapper function of if test cases. """
         self.while_if_test(tc.VALID_IF, False)
         self.while_if_test(tc.INVALID_IF, True)
+
+    def test_functions(self):
+        """ Function definitions, parameters, calls and returns. """
+        for script in tc.VALID_FUNCTIONS:
+            with self.subTest(script=script):
+                error_log, global_scope, indexed_types = do_semantic_analysis(script, 'script')
+                self.assertEqual(0, error_log.total_entries(), str(error_log))
+
+        for script, expected_category in tc.INVALID_FUNCTIONS:
+            with self.subTest(script=script, expected_category=expected_category):
+                error_log, global_scope, indexed_types = do_semantic_analysis(script, 'script')
+                self.assertTrue(any(error_log.includes_on_line(expected_category, i)
+                                    for i in range(1, len(script.splitlines()) + 1)), str(error_log))
+
+
+class TableRunnerTests(unittest.TestCase):
+
+    def test_every_table_case_passes(self):
+        results = run_cases(workers=1)
+        self.assertEqual(sum(len(getattr(tc, table)) for table in CHECKS), len(results))
+        self.assertEqual([], [(r.table, r.index, r.failure) for r in results if not r.passed])
+        self.assertTrue(all(r.seconds > 0 for r in results))
+
+
+class BenchmarkTests(unittest.TestCase):
+
+    def test_generated_programs(self):
+        source = generate_program(functions=3, statements=6, depth=2, seed=1)
+        self.assertEqual(source, generate_program(functions=3, statements=6, depth=2, seed=1))
+        error_log, _, _ = analyze_tree(parse(source, 'script', NimbleLexer, NimbleParser))
+        self.assertEqual(0, error_log.total_entries(), str(error_log))
+        source = generate_program(functions=3, statements=6, depth=2, error_density=0.5, seed=1)
+        error_log, _, _ = analyze_tree(parse(source, 'script', NimbleLexer, NimbleParser))
+        self.assertGreater(error_log.total_entries(), 0)
+
+    def test_run_benchmark(self):
+        source = generate_program(functions=2, statements=4, depth=1)
+        result = run_benchmark(source, repeat=1)
+        self.assertEqual(source.count('\n'), result['lines'])
+        self.assertEqual(set(STAGES), set(result['stages']))
+        for stats in result['stages'].values():
+            self.assertGreater(stats['seconds'], 0)
+            self.assertGreater(stats['peak_bytes'], 0)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/results.jsonl'
+            store_result(path, {'seed': 0}, result)
+            store_result(path, {'seed': 0}, result)
+            records = load_results(path)
+        self.assertEqual(2, len(records))
+        self.assertEqual(result['stages'], records[1]['stages'])
+
+    def test_regression_gate(self):
+        def record(seconds):
+            return {'parameters': {'seed': 0}, 'tokens': 1000,
+                    'stages': {stage: {'seconds': min(seconds), 'samples': seconds} for stage in STAGES}}
+
+        baseline = [record([1.0, 1.02, 0.98, 1.01, 0.99, 1.03, 0.97, 1.0, 1.01, 0.99])]
+        noisy = [record([1.1, 0.9, 1.2, 0.8, 1.0, 1.15, 0.85, 1.05, 0.95, 1.0])]
+        slower = [record([1.3, 1.32, 1.28, 1.31, 1.29, 1.33, 1.27, 1.3, 1.31, 1.29])]
+        self.assertFalse(any(c.regressed for c in compare(baseline, noisy)))
+        self.assertFalse(any(c.regressed for c in compare(baseline, baseline)))
+        comparisons = compare(baseline, slower)
+        self.assertTrue(all(c.regressed for c in comparisons))
+        self.assertAlmostEqual(1 / 1.3 - 1, comparisons[0].change)
+        self.assertLess(comparisons[0].p_value, 0.001)
+        self.assertIn('FAIL: lex, parse', report(comparisons, 0.1, 0.05))
+        self.assertFalse(any(c.regressed for c in compare(baseline, slower, threshold=0.3)))
+        with self.assertRaises(ValueError):
+            compare(baseline, [dict(slower[0], parameters={'seed': 1})])
+
+
+class FuzzTests(unittest.TestCase):
+
+    def test_generated_scripts_parse(self):
+        fuzzer = GrammarFuzzer(seed=3, max_depth=4)
+        for _ in range(20):
+            source = fuzzer.generate()
+            with self.subTest(source=source):
+                parse(source, 'script', NimbleLexer, NimbleParser)
+
+    def test_fuzz_report(self):
+        report = fuzz(count=20, seed=3, max_depth=4, slow_seconds=0, keep_slowest=3)
+        self.assertEqual(20, report.scripts)
+        self.assertEqual([], report.unparsable)
+        self.assertEqual(20, len(report.slow))
+        self.assertEqual(3, len(report.slowest))
+        self.assertGreater(report.tokens_per_s, 0)
+        self.assertEqual([], [f'{c.error} at {c.location}' for c in report.crashes.values()])
+
+
+class MemoryProfileTests(unittest.TestCase):
+
+    def test_profile(self):
+        source = 'var x : Int = (1 + 2) * 3\nvar s : String = "a"\nprint x\nprint s + s'
+        original_init = ATNConfigSet.__init__
+        profile = profile_memory(source, warm=True, top=5)
+        self.assertIs(original_init, ATNConfigSet.__init__)
+        self.assertEqual(4, profile.lines)
+        self.assertEqual(['lex', 'parse', 'analyze', 'index'], list(profile.steps))
+        self.assertGreaterEqual(profile.peak_bytes, max(peak for peak, _ in profile.steps.values()))
+        self.assertEqual(profile.tokens, profile.structures['tokens'].count)
+        self.assertEqual(2, profile.structures['symbols'].count)
+        self.assertEqual(2, profile.structures['scopes'].count)
+        self.assertGreater(profile.structures['parse tree nodes'].count, profile.tokens)
+        self.assertGreater(profile.structures['type_of entries'].count, 0)
+        self.assertIn('CommonToken', dict(profile.retained_by_type))
+        self.assertIn('parse tree nodes', memory_report(profile))
+
+
+class ErrorLogTests(unittest.TestCase):
+
+    SCRIPT = '''
+        var b : Bool = 1 + true
+        if (2 + x) * 3 { print y + y }
+        '''
+
+    def test_lazy_log_matches_eager_log(self):
+        tree = parse(self.SCRIPT, 'script', NimbleLexer, NimbleParser)
+        eager, lazy = analyze_tree(tree)[0], analyze_tree(tree, lazy_errors=True)[0]
+        self.assertEqual(str(eager), str(lazy))
+        self.assertEqual(eager.category_counts(), lazy.category_counts())
+        self.assertEqual(2, lazy.category_counts()[Category.UNDEFINED_NAME])
+        self.assertTrue(lazy.includes_exactly(Category.UNDEFINED_NAME, 3, 'y'))
+        self.assertFalse(lazy.includes_exactly(Category.INVALID_BINARY_OP, 3, 'y'))
+        condition = next(e for e in lazy.entries() if e.category == Category.CONDITION_NOT_BOOL)
+        self.assertEqual('if-statement condition [(2+x)*3] can only be of type PrimitiveType.Bool, '
+                         'not PrimitiveType.ERROR.', condition.message)
+
+    def test_cascades_are_suppressed_and_errors_capped(self):
+        tree = parse('print ((x + 1) * 2) < -(y)\nwhile z + 1 { }', 'script', NimbleLexer, NimbleParser)
+        full = analyze_tree(tree)[0]
+        self.assertEqual(13, full.total_entries())
+        suppressed = analyze_tree(tree, suppress_cascades=True)[0]
+        self.assertEqual(3, suppressed.total_entries())
+        self.assertEqual({Category.UNDEFINED_NAME: 3}, suppressed.category_counts())
+        capped = analyze_tree(tree, max_errors=2)[0]
+        self.assertEqual((2, True), (capped.total_entries(), capped.truncated))
+        self.assertFalse(full.truncated)
+
+    def test_indexed_queries(self):
+        source = '\n'.join(['var a : Int = 1'] + [f'print x{i} + {i}' for i in range(2, 300)])
+        log = analyze_tree(parse(source, 'script', NimbleLexer, NimbleParser))[0]
+        self.assertEqual(3 * 298, log.total_entries())
+        self.assertEqual([f'x{i}' for i in range(100, 201)],
+                         [e.ctx.getText() for e in log.entries_in_lines(100, 200)
+                          if e.category == Category.UNDEFINED_NAME])
+        self.assertEqual([], list(log.entries_in_lines(1, 1)))
+        self.assertTrue(log.includes_on_line(Category.UNPRINTABLE_EXPRESSION, 150))
+        self.assertFalse(log.includes_on_line(Category.INVALID_NEGATION, 150))
+        self.assertFalse(log.includes_on_line(Category.UNDEFINED_NAME, 1000))
+        self.assertEqual(298, len(log.entries_in_category(Category.INVALID_BINARY_OP)))
+        # Re-adding an entry for the same source replaces it in every index
+        entry = log.entries_in_category(Category.UNDEFINED_NAME)[0]
+        log.add(entry.ctx, Category.DUPLICATE_NAME, 'replaced')
+        self.assertEqual(3 * 298, log.total_entries())
+        self.assertEqual({Category.UNDEFINED_NAME: 297, Category.INVALID_BINARY_OP: 298,
+                          Category.UNPRINTABLE_EXPRESSION: 298, Category.DUPLICATE_NAME: 1},
+                         log.category_counts())
+        self.assertTrue(log.includes_on_line(Category.DUPLICATE_NAME, 2))
+        self.assertFalse(log.includes_on_line(Category.UNDEFINED_NAME, 2))
+
+
+class DiagnosticExportTests(unittest.TestCase):
+
+    def export(self, source, bulk):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/script.nimble'
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(source)
+            output = io.StringIO()
+            count = export_file(path, output, bulk)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(count, len(records))
+        return [{k: v for k, v in r.items() if k != 'file'} for r in records]
+
+    def test_streaming_and_bulk_exports_agree(self):
+        for source in ['var x : Int = true\nprint y + 1', 'var x : Int =\nprint (',
+                       'print y + y', 'var a : Int = true\nvar a : Int = 1']:
+            with self.subTest(source=source):
+                self.assertEqual(self.export(source, False), self.export(source, True))
+        self.assertEqual({'line': 2, 'column': 6, 'end_line': 2, 'end_column': 7, 'category': 'UNDEFINED_NAME',
+                          'message': 'Variable [y] is undefined.', 'source': 'y'},
+                         self.export('var x : Int = true\nprint y + 1', False)[1])
+        self.assertEqual(['SYNTAX', 'SYNTAX'], [r['category'] for r in self.export('var x : Int =\nprint (', False)])
+
+    def test_analysis_failure_is_a_record(self):
+        def crash(listener, ctx):
+            raise KeyError('x')
+
+        source = 'var x : Int = true\nprint 1'
+        failure = {'line': 1, 'column': 0, 'end_line': 1, 'end_column': 0, 'category': 'ANALYSIS_FAILED',
+                   'message': 'semantic analysis failed with KeyError', 'source': ''}
+        with mock.patch.object(InferTypesAndCheckConstraints, 'exitPrint', crash):
+            self.assertEqual(['ASSIGN_TO_WRONG_TYPE', 'ANALYSIS_FAILED'],
+                             [r['category'] for r in self.export(source, False)])
+            self.assertEqual(failure, self.export(source, False)[-1])
+            self.assertEqual([failure], self.export(source, True))
+
+
+class ParseCacheTests(unittest.TestCase):
+
+    SCRIPT = 'var x : Int = 3\nx = x + (2 * 3)\nif x < 4 { print y } else { print "hi" }\n'
+
+    def test_disk_tier_reproduces_analysis(self):
+        """
+        A result loaded from the on-disk tier by a fresh cache must match a
+        freshly computed analysis: same errors, same inferred types.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            ParseCache(directory).do_semantic_analysis(self.SCRIPT, 'script')
+            cache = ParseCache(directory)
+            error_log, global_scope, indexed_types = cache.do_semantic_analysis(self.SCRIPT, 'script')
+
+        expected_log, expected_scope, expected_types = do_semantic_analysis(self.SCRIPT, 'script')
+        self.assertEqual(1, cache.disk_hits)
+        self.assertEqual(str(expected_log), str(error_log))
+        self.assertEqual(pretty_types(expected_types), pretty_types(indexed_types))
+        self.assertTrue(error_log.includes_on_line(Category.UNDEFINED_NAME, 3))
+
+    def test_memory_tier_returns_shared_result(self):
+        cache = ParseCache(capacity=1)
+        first = cache.do_semantic_analysis(self.SCRIPT, 'script')
+        self.assertIs(first, cache.do_semantic_analysis(self.SCRIPT, 'script'))
+        cache.parse('1+2', 'expr')
+        self.assertIsNot(first, cache.do_semantic_analysis(self.SCRIPT, 'script'))
+
+    def test_unreadable_records_are_evicted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            expected = ParseCache(directory).do_semantic_analysis(self.SCRIPT, 'script')
+            [name] = os.listdir(directory)
+            for record in (b'not a pickle', pickle.dumps({'tree': b''})):
+                with open(os.path.join(directory, name), 'wb') as f:
+                    f.write(record)
+                cache = ParseCache(directory)
+                error_log = cache.do_semantic_analysis(self.SCRIPT, 'script')[0]
+                self.assertEqual((0, 1), (cache.disk_hits, cache.misses))
+                self.assertEqual(str(expected[0]), str(error_log))
+            cache = ParseCache(directory)
+            cache.do_semantic_analysis(self.SCRIPT, 'script')
+            self.assertEqual(1, cache.disk_hits)
+
+
+class ParseWatchdogTests(unittest.TestCase):
+
+    def test_budgets(self):
+        nested = 'var x : Int = ' + '(' * 1000 + '1' + ')' * 1000
+        with self.assertRaises(SyntaxErrors) as raised:
+            parse(nested, 'script', NimbleLexer, NimbleParser, budget=ParseBudget(max_depth=100))
+        [record] = raised.exception.error_log.syntax_errors
+        self.assertIsInstance(record.exception, BudgetExceeded)
+        self.assertIn('nested more than 100 deep', record.message)
+        self.assertEqual('(', record.offending_symbol.text)
+        self.assertIsNone(raised.exception.parse_tree)
+
+        chain = 'var x : Int = ' + ' + '.join(['1'] * 500)
+        with self.assertRaises(SyntaxErrors) as raised:
+            parse(chain, 'script', NimbleLexer, NimbleParser, budget=ParseBudget(decision_seconds=0))
+        self.assertIn('took more than 0 s', raised.exception.error_log.syntax_errors[0].message)
+        with self.assertRaises(SyntaxErrors) as raised:
+            parse(chain, 'script', NimbleLexer, NimbleParser,
+                  budget=ParseBudget(decision_seconds=None, total_seconds=0))
+        self.assertIn('Parsing took more than 0 s', raised.exception.error_log.syntax_errors[0].message)
+
+    def test_within_budget(self):
+        parser = NimbleParser(CommonTokenStream(NimbleLexer(InputStream('var x : Int = (1 + 2) * 3\nprint x'))))
+        watchdog = install_watchdog(parser)
+        parser.script()
+        self.assertEqual(0, parser.getNumberOfSyntaxErrors())
+        self.assertTrue(watchdog.decision_stats)
+        self.assertAlmostEqual(watchdog.seconds, sum(s.seconds for s in watchdog.decision_stats.values()))
+        # The analysis service parses within the default budget
+        [diagnostic] = analyze_source('var x : Int = ' + '(' * 1000 + '1' + ')' * 1000)
+        self.assertEqual('SYNTAX', diagnostic['category'])
+        self.assertTrue(diagnostic['message'].startswith('Rules nested more than 300 deep'))
+
+
+class TreeCodecTests(unittest.TestCase):
+
+    def test_round_trip(self):
+        """
+        A decoded tree must have the same shape, node classes, operator labels and
+        token positions as the tree that was encoded, and analyze identically.
+        """
+        source = 'func f(a : Int) -> Int { return a }\nvar x : Int = -3\nx = (x + 2) * 4\nprint !x'
+        tree = parse(source, 'script', NimbleLexer, NimbleParser)
+        decoded = treecodec.decode(treecodec.encode(tree))
+
+        def describe(node):
+            return (type(node), node.getText(), getattr(node, 'op', None) and node.op.text,
+                    getattr(node, 'start', None) and (node.start.line, node.start.column))
+
+        self.assertEqual([describe(n) for n in treecodec.preorder(tree)],
+                         [describe(n) for n in treecodec.preorder(decoded)])
+        self.assertEqual(str(analyze_tree(tree)[0]), str(analyze_tree(decoded)[0]))
+
+    def test_rejects_foreign_bytes(self):
+        with self.assertRaises(treecodec.TreeCodecError):
+            treecodec.decode(b'not a tree')
+
+    def test_rejects_corrupt_tables(self):
+        """A damaged string or token table must raise TreeCodecError, not a decoding error."""
+        encoded = treecodec.encode(parse('print 1', 'script', NimbleLexer, NimbleParser))
+        for data in (treecodec.MAGIC + b'\x01\x02\xff\xfe', treecodec.MAGIC + b'\x01\x05a',
+                     encoded[:len(treecodec.MAGIC) + 3]):
+            with self.subTest(data=data), self.assertRaises(treecodec.TreeCodecError):
+                treecodec.decode(data)
+
+
+class SharedTreeTests(unittest.TestCase):
+
+    def test_view_analysis_matches_tree(self):
+        """
+        Analysing the read-only shared memory views must log the same errors and infer
+        the same types as analysing the original tree.
+        """
+        source = 'var x : Int = 3\nvar b : Bool\nx = x + -(2 * 3)\nif x < y { print "hi" }\nwhile !b { b = 1 }'
+        tree = parse(source, 'script', NimbleLexer, NimbleParser)
+        expected_log, expected_scope, expected_types = analyze_tree(tree)
+
+        with sharedtree.SharedTree(tree) as shared:
+            error_log, global_scope, node_types = sharedtree.collect(
+                tree, sharedtree.analyze_shared(shared.descriptor))
+
+        self.assertEqual(str(expected_log), str(error_log))
+        self.assertEqual(expected_types, node_types)
+
+
+class AnalysisServiceTests(unittest.TestCase):
+
+    def test_rapid_edits_are_coalesced(self):
+        """
+        Two edits of one document arriving within the debounce window are analyzed
+        once, using the newer text, and both requests receive that result.
+        """
+        async def scenario():
+            with ThreadPoolExecutor(1) as executor:
+                service = AnalysisService(executor=executor, debounce=0.01)
+                first = service.analyze('a.nim', 'var x : Int = true', 1)
+                second = service.analyze('a.nim', 'print y', 2)
+                return service, await asyncio.gather(first, second)
+
+        service, (first, second) = asyncio.run(scenario())
+        self.assertEqual(1, service.analyses)
+        self.assertTrue(first['superseded'])
+        self.assertFalse(second['superseded'])
+        self.assertEqual(first['diagnostics'], second['diagnostics'])
+        self.assertEqual({'UNDEFINED_NAME', 'UNPRINTABLE_EXPRESSION'},
+                         {d['category'] for d in second['diagnostics']})
+
+    def test_superseded_without_versions(self):
+        async def scenario():
+            with ThreadPoolExecutor(1) as executor:
+                service = AnalysisService(executor=executor, debounce=0.01)
+                return await asyncio.gather(service.analyze('a.nim', 'print 1'),
+                                            service.analyze('a.nim', 'print 2'))
+
+        first, second = asyncio.run(scenario())
+        self.assertEqual((True, False), (first['superseded'], second['superseded']))
+
+    def test_non_object_messages_are_invalid_requests(self):
+        async def scenario():
+            with ThreadPoolExecutor(1) as executor:
+                service = AnalysisService(executor=executor, debounce=0)
+                reader = asyncio.StreamReader()
+                reader.feed_data(b'[{"jsonrpc": "2.0", "id": 1, "method": "metrics"}]\n7\n'
+                                 b'{"jsonrpc": "2.0", "id": 2, "method": "metrics"}\n')
+                reader.feed_eof()
+                responses = []
+
+                async def write(line):
+                    responses.append(json.loads(line))
+
+                await service.serve(reader, write)
+                return responses
+
+        responses = asyncio.run(scenario())
+        self.assertEqual([-32600, -32600], [r['error']['code'] for r in responses[:2]])
+        self.assertEqual(2, responses[2]['id'])
+
+    def test_analysis_failure_is_a_diagnostic(self):
+        def crash(tree):
+            raise KeyError('x')
+
+        with mock.patch('analysisservice.analyze_tree', crash):
+            [diagnostic] = analyze_source('var x : Int = 1\nprint x')
+        self.assertEqual({'line': 1, 'column': 0, 'category': 'ANALYSIS_FAILED',
+                          'message': 'semantic analysis failed with KeyError', 'source': ''}, diagnostic)
+
+
+class IncrementalDocumentTests(unittest.TestCase):
+
+    def test_edit_matches_fresh_parse(self):
+        """
+        Editing one statement re-parses less than the whole script, and leaves the same
+        tokens, tree and diagnostics as opening the edited text afresh.
+        """
+        text = 'var x : Int = 1\nvar y : Int = 2\nx = x + y\nprint x\n'
+        document = IncrementalDocument('a.nim', text)
+        document.update()
+        document.apply_change({'range': {'start': {'line': 2, 'character': 8},
+                                         'end': {'line': 2, 'character': 9}},
+                               'text': 'true'})
+        diagnostics = document.update()
+        self.assertNotIn('ScriptContext', document.stats['parsed'])
+
+        fresh = IncrementalDocument('b.nim', text.replace('x + y', 'x + true'))
+        self.assertEqual(fresh.update(), diagnostics)
+        self.assertEqual([(t.type, t.text, t.line, t.column) for t in fresh.tokens],
+                         [(t.type, t.text, t.line, t.column) for t in document.tokens])
+        self.assertEqual(fresh.tree.toStringTree(recog=fresh.tree.parser),
+                         document.tree.toStringTree(recog=fresh.tree.parser))
+        self.assertIn('INVALID_BINARY_OP', [d['code'] for d in diagnostics])
+
+
+class InterpreterTests(unittest.TestCase):
+
+    def run_script(self, source):
+        output = []
+        compile_source(source).run(output.append)
+        return ''.join(output)
+
+    def test_functions_loops_and_printing(self):
+        script = '''
+            func fib(n : Int) -> Int {
+                if n < 2 { return n }
+                return fib(n - 1) + fib(n - 2)
+            }
+            var i : Int
+            var done : Bool
+            while i < 4 { print fib(i * 5) i = i + 1 }
+            print -7 / 2
+            print !done
+            print "tab\\tquote\\""
+            '''
+        self.assertEqual('0\n5\n55\n610\n-3\ntrue\ntab\tquote"\n', self.run_script(script))
+
+    def test_uses_analysis_types(self):
+        script = 'var b : Bool = 1 < 2\nprint !b\nprint (3 * 4)'
+        tree = parse(script, 'script', NimbleLexer, NimbleParser)
+        node_types = analyze_tree(tree)[2]
+        output = []
+        Compiler(node_types).compile_script(tree).run(output.append)
+        self.assertEqual('false\n12\n', ''.join(output))
+
+    def test_division_by_zero(self):
+        with self.assertRaises(NimbleRuntimeError):
+            self.run_script('var z : Int\nprint 1 / z')
+
+    def test_scripts_with_semantic_errors_are_not_compiled(self):
+        for source in ['print 1 + true', 'var s : String = 5\nprint s', 'print "a" + 1',
+                       'func f() { }\nprint f()']:
+            with self.subTest(source=source), self.assertRaises(SemanticErrors):
+                compile_source(source)
+
+    def test_self_tail_calls_run_in_constant_depth(self):
+        script = '''
+            func sum(n : Int, total : Int) -> Int {
+                var step : Int = 1
+                if n == 0 { return total }
+                return (sum(n - step, total + n))
+            }
+            print sum(100000, 0)
+            '''
+        tree = parse(script, 'script', NimbleLexer, NimbleParser)
+        node_types = check_script(tree)
+        with self.assertRaises(RecursionError):
+            Compiler(node_types).compile_script(tree).run(lambda text: None)
+        output = []
+        Compiler(node_types, tail_calls=True).compile_script(tree).run(output.append)
+        self.assertEqual('5000050000\n', ''.join(output))
+
+    def test_string_concatenation(self):
+        # The analysis rejects + between Strings, so the run-time support is tested directly
+        long = ''
+        for _ in range(10000):
+            long = concatenate(long, 'ab\t')
+        self.assertIsInstance(long, Rope)
+        self.assertEqual('ab\t' * 10000, str(long))
+        self.assertEqual('<ab\t>', concatenate(concatenate('<', 'ab\t'), '>'))
+        rope = Rope(['a' * 40], 40) + 'b' * 40
+        self.assertIsInstance(rope + 'c', Rope)
+        self.assertEqual('a' * 40 + 'b' * 40, str(rope))
+        self.assertEqual('tab\tquote"\n', self.run_script('print "tab\\tquote\\""'))
+
+    def test_64_bit_overflow(self):
+        script = '''
+            var big : Int = 9223372036854775807
+            print big + 1
+            print (4611686018427387904 * 2) / 2
+            print -(-9223372036854775807 - 1) / -1
+            '''
+        tree = parse(script, 'script', NimbleLexer, NimbleParser)
+        node_types = analyze_tree(tree)[2]
+        wrapped = '-9223372036854775808\n-4611686018427387904\n-9223372036854775808\n'
+        for tables in (None, fold_constants(tree, node_types, overflow='wrap')[0]):
+            output = []
+            Compiler(node_types, tables, overflow='wrap').compile_script(tree).run(output.append)
+            self.assertEqual(wrapped, ''.join(output))
+        tables = fold_constants(tree, node_types, overflow='trap')[0]
+        output = []
+        with self.assertRaises(NimbleRuntimeError):
+            Compiler(node_types, tables, overflow='trap').compile_script(tree).run(output.append)
+        self.assertEqual('', ''.join(output))
+        tree = parse('print 9223372036854775808', 'script', NimbleLexer, NimbleParser)
+        with self.assertRaises(CompileError):
+            Compiler(check_script(tree), overflow='trap').compile_script(tree)
+
+
+class TranspilerTests(unittest.TestCase):
+
+    SCRIPT = '''
+        func countdown(n : Int) { while 0 < n { print n n = n - 1 } }
+        func odd(n : Int) -> Bool { if n == 0 { return false } return !odd(n - 1) }
+        var s : String = "and\\n"
+        countdown(2)
+        print s
+        print odd(7)
+        print -9 / 4
+        '''
+
+    def test_matches_interpreter(self):
+        expected = []
+        compile_source(self.SCRIPT).run(expected.append)
+        output = []
+        TranspileCache().run(self.SCRIPT, output.append)
+        self.assertEqual(''.join(expected), ''.join(output))
+        self.assertEqual('2\n1\nand\n\ntrue\n-2\n', ''.join(output))
+
+    def test_disk_cache_skips_translation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            TranspileCache(directory).run(self.SCRIPT, lambda text: None)
+            cache = TranspileCache(directory)
+            output = []
+            cache.run(self.SCRIPT, output.append)
+            self.assertEqual((1, 0), (cache.disk_hits, cache.misses))
+            self.assertEqual('2\n1\nand\n\ntrue\n-2\n', ''.join(output))
+
+    def test_entries_that_are_not_code_are_evicted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            TranspileCache(directory).run(self.SCRIPT, lambda text: None)
+            [name] = os.listdir(directory)
+            for entry in (b'junk', marshal.dumps(['not', 'code'])):
+                with open(os.path.join(directory, name), 'wb') as f:
+                    f.write(entry)
+                cache = TranspileCache(directory)
+                output = []
+                cache.run(self.SCRIPT, output.append)
+                self.assertEqual((0, 1), (cache.disk_hits, cache.misses))
+                self.assertEqual('2\n1\nand\n\ntrue\n-2\n', ''.join(output))
+            cache = TranspileCache(directory)
+            cache.run(self.SCRIPT, lambda text: None)
+            self.assertEqual(1, cache.disk_hits)
+
+    def test_scripts_with_semantic_errors_are_not_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = TranspileCache(directory)
+            output = []
+            for source in ['print 1 + true', 'var s : String = 5\nprint s', 'func f() { }\nprint f()']:
+                with self.subTest(source=source), self.assertRaises(SemanticErrors):
+                    cache.run(source, output.append)
+            self.assertEqual([], output)
+            self.assertEqual([], os.listdir(directory))
+
+
+class FoldConstantsTests(unittest.TestCase):
+
+    SCRIPT = '''
+        var x : Int = (32 * 45) * (30 / 2)
+        var b : Bool = !true
+        var y : Int = x * 1 + 0
+        print x
+        print b
+        print -(-y) + (2 - 3) * x
+        '''
+
+    def test_folds_and_simplifies(self):
+        tree = parse(self.SCRIPT, 'script', NimbleLexer, NimbleParser)
+        node_types = analyze_tree(tree)[2]
+        tables, report = fold_constants(tree, node_types)
+        indexed = {(ctx.start.line, ctx.getText()): value for ctx, value in tables.constant_value.items()}
+        self.assertEqual(21600, indexed[(2, '(32*45)*(30/2)')])
+        self.assertIs(False, indexed[(3, '!true')])
+        self.assertEqual('x', tables.replacement[tree.main().body().varBlock().varDec(2).expr()].getText())
+        self.assertEqual((5, 3), (report.folded, report.simplified))
+        self.assertEqual(report.expressions_before - report.expressions_after, report.eliminated)
+
+        plain, folded = [], []
+        Compiler(node_types).compile_script(tree).run(plain.append)
+        Compiler(node_types, tables).compile_script(tree).run(folded.append)
+        self.assertEqual(plain, folded)
+
+
+class MarkUnreachableTests(unittest.TestCase):
+
+    def test_dead_branches_are_skipped(self):
+        script = ('var x : Int = 1\n'
+                  'if 1 < 0 { print y } else { print "live" }\n'
+                  'while !true { x = true }\n'
+                  'if x < 2 { return } else { print 1 return }\n'
+                  'print "dead"\n')
+        tree = parse(script, 'script', NimbleLexer, NimbleParser)
+        tables = fold_constants(tree, analyze_tree(tree)[2])[0]
+        self.assertEqual(3, mark_unreachable(tree, tables))
+        self.assertEqual({'printy', 'x=true', 'print"dead"'}, {s.getText() for s in tables.unreachable})
+
+        error_log, _, node_types = analyze_tree(tree, walker=PruningWalker(tables.unreachable))
+        self.assertEqual(0, error_log.total_entries())
+        output = []
+        Compiler(node_types, tables).compile_script(tree).run(output.append)
+        self.assertEqual('live\n', ''.join(output))
+
+
+class RegisterIRTests(unittest.TestCase):
+
+    SCRIPT = '''
+        func swap(n : Int) -> Int {
+            var a : Int = 1
+            var b : Int = 2
+            var t : Int
+            while 0 < n { t = a a = b b = t n = n - 1 }
+            return a * 10 + b
+        }
+        var i : Int
+        var total : Int
+        while i < 4 {
+            total = total + (i * i + 1) * (i * i + 1)
+            if i == 2 { return }
+            i = i + 1
+        }
+        print total
+        print swap(3) == 21
+        '''
+
+    def test_machines_match_interpreter(self):
+        tree = parse(self.SCRIPT, 'script', NimbleLexer, NimbleParser)
+        node_types = check_script(tree)
+        expected = []
+        Compiler(node_types).compile_script(tree).run(expected.append)
+        program = lower_script(tree, node_types)
+        before, after = optimize(program)
+        self.assertLess(after, before)
+        # i * i + 1 is computed once per iteration, so i * i and the product are the only multiplications
+        self.assertEqual(2, str(program.functions['$main']).count(' = mul '))
+        for machine in (RegisterVM(program), StackVM(StackCompiler(node_types).compile_script(tree))):
+            output = []
+            machine.run(output.append)
+            self.assertEqual(''.join(expected), ''.join(output))
+
+
+class MemoizationTests(unittest.TestCase):
+
+    SCRIPT = '''
+        func fib(n : Int) -> Int { if n < 2 { return n } return fib(n - 1) + fib(n - 2) }
+        func fib_plus(n : Int) -> Int { return fib(n) + 1 }
+        func show(n : Int) { print n }
+        func twice(n : Int) -> Int { show(n) return 2 * n }
+        print fib_plus(80)
+        print twice(3)
+        print twice(3)
+        '''
+
+    def test_pure_functions_are_memoized(self):
+        tree = parse(self.SCRIPT, 'script', NimbleLexer, NimbleParser)
+        pure = pure_functions(tree)
+        self.assertEqual({'fib', 'fib_plus'}, pure)
+        output = []
+        Compiler(check_script(tree), memoize=pure, memo_size=16).compile_script(tree).run(output.append)
+        self.assertEqual('23416728348467686\n3\n6\n3\n6\n', ''.join(output))
+
+
+class OutputTests(unittest.TestCase):
+
+    def test_output_is_passed_on_in_chunks(self):
+        sink = MemorySink()
+        output = BufferedOutput(sink, capacity=10)
+        for word in ['one\n', 'two\n', 'three\n', 'four\n']:
+            output.write(word)
+        self.assertEqual(['one\ntwo\nthree\n'], sink.chunks)
+        output.close()
+        self.assertEqual('one\ntwo\nthree\nfour\n', sink.getvalue())
+        self.assertEqual((19, 2), (output.characters_written, output.flushes))
+
+    def test_output_is_flushed_when_a_script_fails(self):
+        script = compile_source('var z : Int\nprint 1\nprint 2\nprint 1 / z')
+        sink = MemorySink()
+        with self.assertRaises(NimbleRuntimeError):
+            script.run(sink)
+        self.assertEqual(['1\n2\n'], sink.chunks)
+
+    def test_output_to_file(self):
+        tree = parse('var i : Int\nwhile i < 1000 { print i i = i + 1 }', 'script', NimbleLexer, NimbleParser)
+        script = StackCompiler(check_script(tree)).compile_script(tree)
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/out.txt'
+            with open_output(path, capacity=256) as output:
+                StackVM(script).run(output.write)
+            with open(path, encoding='utf-8') as file:
+                self.assertEqual(''.join(f'{i}\n' for i in range(1000)), file.read())
+
@@ -251,4 +251,38 @@ INVALID_IF = [
     'if !"Totally a bool" {}',
     'if (true) { if (123) { } }',
 
-]
\ No newline at end of file
+]
+
+# Functions may be called before they're defined, and have their own scopes
+
+VALID_FUNCTIONS = [
+
+    'func f(a : Int, b : Bool) -> Int { if b { return a } else { return -a } }\nprint f(1, true)',
+    'func a() -> Int { return b(2) }\nfunc b(n : Int) -> Int { return n * 2 }\nprint a()',
+    'func greet(name : String) { print "hello"\nprint name\nreturn }\ngreet("you")',
+    'func f() -> Bool { var x : Int = 1\nreturn x < 2 }\nfunc g() -> Bool { var x : Bool = f()\nreturn x }',
+    'func count(n : Int) -> Int { if n == 0 { return 0 }\nreturn 1 + count(n - 1) }\nprint count(3)',
+
+]
+
+INVALID_FUNCTIONS = [
+
+    ('print f(1)', Category.UNDEFINED_NAME),
+    ('func f(a : Int) -> Int { return a }\nprint f()', Category.INVALID_CALL),
+    ('func f(a : Int) -> Int { return a }\nprint f(true)', Category.INVALID_CALL),
+    ('var x : Int\nprint x(1)', Category.INVALID_CALL),
+    ('func f() -> Int { return 1 }\nprint f + 1', Category.UNDEFINED_NAME),
+    ('func f() {}\nprint f()', Category.UNPRINTABLE_EXPRESSION),
+    ('func f() {}\nvar x : Int = f()', Category.ASSIGN_TO_WRONG_TYPE),
+    ('func f() -> Int { return "one" }', Category.INVALID_RETURN),
+    ('func f() -> Int { return }', Category.INVALID_RETURN),
+    ('func f() { return 1 }', Category.INVALID_RETURN),
+    ('return 1', Category.INVALID_RETURN),
+    ('func f(b : Bool) -> Int { if b { return 1 } }', Category.MISSING_RETURN),
+    ('func f() -> Int { while true { return 1 } }', Category.MISSING_RETURN),
+    ('func f() {}\nfunc f() {}', Category.DUPLICATE_NAME),
+    ('func f(a : Int, a : Bool) {}', Category.DUPLICATE_NAME),
+    ('func f(a : Int) { var a : Bool }', Category.DUPLICATE_NAME),
+    ('func f() { print y }', Category.UNDEFINED_NAME),
+
+]
@@ -11,12 +11,23 @@ Version: 2023-02-08
 from collections import defaultdict
 
 from antlr4 import ParseTreeWalker
-from errorlog import ErrorLog
+from errorlog import ErrorLog, TooManyErrors
 from generic_parser import parse
 from nimble import NimbleLexer, NimbleParser
 from nimblesemantics import DefineScopesAndSymbols, InferTypesAndCheckConstraints
 from symboltable import Scope
 
+# A script exercising every rule, parsed on start by worker processes to warm their DFA caches
+WARM_UP_SCRIPT = '''
+func f(a : Int, b : Bool) -> Int { if b { return a } else { return -a } }
+var x : Int = (1 + 2) * 3 / 4 - 5
+var s : String = "warm"
+while x < 10 { x = x + f(x, !(x <= 3) == (1 == 1)) }
+f(1, true)
+print s
+return
+'''
+
 
 def do_semantic_analysis(source, start_rule_name, first_phase_only=False):
     """
@@ -35,21 +46,71 @@ def do_semantic_analysis(source, start_rule_name, first_phase_only=False):
     """
 
     tree = parse(source, start_rule_name, NimbleLexer, NimbleParser)
-    walker = ParseTreeWalker()
+    error_log, global_scope, node_types = analyze_tree(tree, first_phase_only)
+
+    indexed_types = index(node_types)
+    return error_log, global_scope, indexed_types
+
+
+def analyze_tree(tree, first_phase_only=False, walker=None, lazy_errors=False, max_errors=None,
+                 suppress_cascades=False, error_log=None):
+    """
+    Runs the two semantic analysis phases over an already-parsed tree and
+    returns the resulting error_log, global_scope and (un-indexed) node_types
+    dictionary, keyed by parse tree node.
+
+    The tree is walked by `walker`, by default a `ParseTreeWalker`; a
+    `nimbleoptimizer.PruningWalker` skips statements found unreachable. With `lazy_errors`, the error log is a lazy `ErrorLog`, which is
+    quicker when only the numbers of errors are wanted.
+
+    With `max_errors`, analysis stops once that many errors are logged, leaving the log
+    marked `truncated` and the node types incomplete. With `suppress_cascades`, errors
+    caused only by other errors aren't logged. Errors are logged to `error_log` if given,
+    e.g. a `diagnosticexport.StreamingErrorLog`, instead of a new `ErrorLog`.
+    """
+    walker = walker or ParseTreeWalker()
 
-    error_log = ErrorLog()
+    if error_log is None:
+        error_log = ErrorLog(lazy_errors, max_errors)
     global_scope = Scope('$global', None, None)
     node_types = {}
 
-    scopes_and_symbols = DefineScopesAndSymbols(error_log, global_scope, node_types)
-    walker.walk(scopes_and_symbols, tree)
+    try:
+        scopes_and_symbols = DefineScopesAndSymbols(error_log, global_scope, node_types)
+        walker.walk(scopes_and_symbols, tree)
 
-    if not first_phase_only:
-        types_and_constraints = InferTypesAndCheckConstraints(error_log, global_scope, node_types)
-        walker.walk(types_and_constraints, tree)
+        if not first_phase_only:
+            types_and_constraints = InferTypesAndCheckConstraints(error_log, global_scope, node_types,
+                                                                  suppress_cascades)
+            walker.walk(types_and_constraints, tree)
+    except TooManyErrors:
+        pass
 
-    indexed_types = index(node_types)
-    return error_log, global_scope, indexed_types
+    return error_log, global_scope, node_types
+
+
+class SemanticErrors(Exception):
+    """
+    Raised by `check_script` when a script has semantic errors.
+
+    :param error_log: The `ErrorLog` holding the errors
+    """
+
+    def __init__(self, error_log):
+        super().__init__(str(error_log))
+        self.error_log = error_log
+
+
+def check_script(tree):
+    """
+    Runs `analyze_tree` over a parsed script and returns its node types, as required by
+    the interpreter, transpiler and IR. Raises `SemanticErrors` if any errors are logged,
+    as such a script must not be run.
+    """
+    error_log, _, node_types = analyze_tree(tree)
+    if error_log.total_entries():
+        raise SemanticErrors(error_log)
+    return node_types
 
 
 def index(node_types):
@@ -74,3 +135,11 @@ def pretty_types(indexed_types):
         for expr in sorted(indexed_types[line_number]):
             output.append(f'  {expr} : {indexed_types[line_number][expr]}')
     return '\n'.join(output)
+
+
+def warm_up():
+    """
+    Parses `WARM_UP_SCRIPT`, populating the lexer and parser DFA caches shared by every
+    `NimbleParser` in the process; used to initialize worker processes.
+    """
+    parse(WARM_UP_SCRIPT, 'script', NimbleLexer, NimbleParser)
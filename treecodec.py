@@ -0,0 +1,275 @@
+"""
+A compact binary serialization format for Nimble parse trees.
+
+`encode` turns a parse tree produced by `NimbleParser` into bytes, and `decode`
+rebuilds it as real `NimbleParser.*Context` objects with `TerminalNodeImpl`
+leaves, so the result can be walked by `ParseTreeWalker` and the listeners in
+`nimblesemantics` exactly like a freshly parsed tree. Decoded contexts have
+`parser` set to None.
+
+Format (all integers are unsigned LEB128 varints; fields marked signed are
+zigzag-encoded first):
+
+    magic    b'NTC1'
+    strings  count, then for each: byte length, UTF-8 bytes
+    tokens   count, then for each, in tokenIndex order:
+             tokenIndex, type (signed), channel, start (signed), stop (signed),
+             line, column, text (string number)
+    nodes    the tree in preorder; each node begins with a kind:
+             0    terminal: token reference
+             r+1  rule node for rule index r: alternative, invokingState (signed),
+                  start reference, stop reference, child count,
+                  label count, then (name string number, token reference) per label
+
+A token reference is 0 for None, otherwise the token's position in the token
+table plus one. Alternative 0 is the rule's generic context; alternative n is
+the nth labelled alternative context the generator emitted for that rule.
+Every token is stored once, however many nodes refer to it, and token texts
+are stored once in the string table, however many tokens share them.
+
+Version: 2026-10-19
+"""
+
+from antlr4 import ParserRuleContext
+from antlr4.Token import CommonToken
+from antlr4.tree.Tree import TerminalNodeImpl
+from nimble import NimbleParser
+
+MAGIC = b'NTC1'
+
+
+def _context_tables():
+    """
+    Builds the two lookup tables relating context classes to (rule index, alternative)
+    pairs, from the classes the generator emitted, in definition order.
+    """
+    alternatives = {}
+    for context_class in vars(NimbleParser).values():
+        if isinstance(context_class, type) and issubclass(context_class, ParserRuleContext):
+            alternatives.setdefault(context_class.getRuleIndex(None), []).append(context_class)
+    for classes in alternatives.values():
+        # The generic context for the rule must be alternative 0
+        classes.sort(key=lambda c: c.__bases__[0] is not ParserRuleContext)
+    codes = {c: (rule_index, alt)
+             for rule_index, classes in alternatives.items()
+             for alt, c in enumerate(classes)}
+    return codes, alternatives
+
+
+_CODES, _ALTERNATIVES = _context_tables()
+
+
+class TreeCodecError(Exception):
+    """Raised when bytes being decoded are not a valid encoded tree."""
+
+
+def preorder(tree):
+    """
+    Returns the nodes of the tree in preorder, the order in which `encode` writes
+    them and `decode_nodes` returns them. Useful for referring to nodes by number.
+    """
+    nodes = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        if not isinstance(node, TerminalNodeImpl) and node.children:
+            stack.extend(reversed(node.children))
+    return nodes
+
+
+def encode(tree) -> bytes:
+    """Encodes the parse tree as bytes."""
+    strings = {}
+    tokens = {}
+
+    def string_number(text):
+        number = strings.get(text)
+        if number is None:
+            number = strings[text] = len(strings)
+        return number
+
+    def token_reference(token):
+        if token is None:
+            return None
+        tokens.setdefault(token.tokenIndex, token)
+        return token.tokenIndex
+
+    # Token references are tokenIndex values until the table is known, then renumbered
+    node_fields = []
+    for node in preorder(tree):
+        if isinstance(node, TerminalNodeImpl):
+            node_fields.append((0, token_reference(node.symbol)))
+            continue
+        rule_index, alt = _CODES[type(node)]
+        labels = [(string_number(name), token_reference(value))
+                  for name, value in getattr(node, '__dict__', {}).items()
+                  if isinstance(value, CommonToken) and name not in ('start', 'stop')]
+        node_fields.append((rule_index + 1, alt, node.invokingState,
+                            token_reference(node.start), token_reference(node.stop),
+                            len(node.children) if node.children else 0, labels))
+
+    token_table = [tokens[index] for index in sorted(tokens)]
+    position = {token.tokenIndex: i + 1 for i, token in enumerate(token_table)}
+    position[None] = 0
+    for token in token_table:
+        string_number(token.text)
+
+    out = bytearray(MAGIC)
+    write = _writer(out)
+    write(len(strings))
+    for text in strings:
+        data = text.encode('utf-8')
+        write(len(data))
+        out += data
+    write(len(token_table))
+    for token in token_table:
+        write(token.tokenIndex)
+        write(_zigzag(token.type))
+        write(token.channel)
+        write(_zigzag(token.start))
+        write(_zigzag(token.stop))
+        write(token.line)
+        write(token.column)
+        write(strings[token.text])
+    for fields in node_fields:
+        if fields[0] == 0:
+            write(0)
+            write(position[fields[1]])
+            continue
+        kind, alt, invoking_state, start, stop, child_count, labels = fields
+        write(kind)
+        write(alt)
+        write(_zigzag(invoking_state))
+        write(position[start])
+        write(position[stop])
+        write(child_count)
+        write(len(labels))
+        for name, token in labels:
+            write(name)
+            write(position[token])
+    return bytes(out)
+
+
+def decode(data: bytes):
+    """Decodes bytes produced by `encode`, returning the root of the rebuilt tree."""
+    return decode_nodes(data)[0]
+
+
+def decode_nodes(data: bytes):
+    """Decodes bytes produced by `encode`, returning every rebuilt node in preorder."""
+    if data[:len(MAGIC)] != MAGIC:
+        raise TreeCodecError('not an encoded Nimble parse tree')
+    reader = _Reader(data, len(MAGIC))
+    read = reader.read
+
+    nodes = []
+    # Each entry is [node, number of children still to read]
+    open_nodes = []
+    try:
+        strings = []
+        for _ in range(read()):
+            length = read()
+            strings.append(reader.take(length).decode('utf-8'))
+
+        tokens = [None]
+        for _ in range(read()):
+            token_index = read()
+            token = CommonToken(type=_unzigzag(read()), channel=read(),
+                                start=_unzigzag(read()), stop=_unzigzag(read()))
+            token.tokenIndex = token_index
+            token.line = read()
+            token.column = read()
+            token.text = strings[read()]
+            tokens.append(token)
+
+        while reader.position < len(data):
+            parent = open_nodes[-1][0] if open_nodes else None
+            kind = read()
+            if kind == 0:
+                node = TerminalNodeImpl(tokens[read()])
+                node.parentCtx = parent
+                child_count = 0
+            else:
+                context_class = _ALTERNATIVES[kind - 1][read()]
+                invoking_state = _unzigzag(read())
+                if context_class.__bases__[0] is ParserRuleContext:
+                    node = context_class(None, parent, invoking_state)
+                else:
+                    # Labelled alternatives are built as the generated parser builds them,
+                    # by copying a generic context for their rule
+                    node = context_class(None, context_class.__bases__[0](None, parent, invoking_state))
+                node.start = tokens[read()]
+                node.stop = tokens[read()]
+                child_count = read()
+                for _ in range(read()):
+                    setattr(node, strings[read()], tokens[read()])
+            if parent is not None:
+                parent.addChild(node)
+                open_nodes[-1][1] -= 1
+            nodes.append(node)
+            if child_count:
+                open_nodes.append([node, child_count])
+            while open_nodes and open_nodes[-1][1] == 0:
+                open_nodes.pop()
+    except (IndexError, KeyError, UnicodeDecodeError) as e:
+        raise TreeCodecError('corrupt encoded Nimble parse tree') from e
+    if not nodes or open_nodes:
+        raise TreeCodecError('truncated encoded Nimble parse tree')
+    return nodes
+
+
+# ---------------------------------------------------------------------------------
+
+
+def _zigzag(n):
+    return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+
+def _unzigzag(n):
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+
+def _writer(out):
+    append = out.append
+
+    def write(n):
+        while n > 0x7f:
+            append((n & 0x7f) | 0x80)
+            n >>= 7
+        append(n)
+
+    return write
+
+
+class _Reader:
+
+    def __init__(self, data, position):
+        self.data = data
+        self.position = position
+
+    def read(self):
+        data = self.data
+        position = self.position
+        byte = data[position]
+        position += 1
+        if byte < 0x80:
+            self.position = position
+            return byte
+        result = byte & 0x7f
+        shift = 7
+        while True:
+            byte = data[position]
+            position += 1
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                self.position = position
+                return result
+            shift += 7
+
+    def take(self, length):
+        start = self.position
+        self.position += length
+        if self.position > len(self.data):
+            raise IndexError('read past end of data')
+        return bytes(self.data[start:self.position])